@@ -0,0 +1,235 @@
+"""
+asyncio version of `OpenScadRunner`.
+For use inside an event loop, where blocking on openscad is not acceptable.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+import subprocess
+import time
+import weakref
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, BinaryIO, Iterable, Optional, Union
+
+from openscad_runner import OpenScadRunner, RenderJob, RenderResult, RenderStats
+
+if TYPE_CHECKING:
+    from openscad_runner import _ProcessUsage
+
+class AsyncOpenScadRunner(OpenScadRunner):
+    """
+    Same settings, parameter file handling, caching, and error detection as `OpenScadRunner`.
+    Adds per job timeouts, and a limit on how many openscad processes run at once.
+    Cancelling a render kills openscad, and anything it started.
+    @warning The synchronous methods from `OpenScadRunner` still work, but do not respect `max_concurrency`.
+    """
+    max_concurrency: int
+    '''Maximum number of openscad processes at once'''
+    max_queued: int
+    '''Maximum number of jobs `run_batch_async` reads ahead of the running ones'''
+    timeout_s: Optional[float]
+    '''Default timeout for each job'''
+
+    def __init__(self, file_path: Path, max_concurrency: Optional[int] = None,
+            max_queued: Optional[int] = None, timeout_s: Optional[float] = None):
+        super().__init__(file_path)
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_queued = max_queued if max_queued != None else self.max_concurrency
+        self.timeout_s = timeout_s
+        self._semaphores = weakref.WeakKeyDictionary()
+        '''Event loop -> `asyncio.Semaphore`.  A semaphore can only be used from one loop, e.g. one `asyncio.run`.'''
+
+    async def create_image_async(self, args: [str], image_file_name: str,
+            timeout_s: Optional[float] = None) -> subprocess.CompletedProcess:
+        '''@see `OpenScadRunner.create_image`'''
+        return await self.render(self.make_job(args, image_file_name), timeout_s)
+
+    async def render(self, job: RenderJob, timeout_s: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Run a single job, waiting for a free slot first.
+        @param timeout_s Only counts time spent running.  Defaults to `timeout_s`.
+        @throws subprocess.TimeoutExpired
+        """
+        return (await self._render_with_stats_async(job, timeout_s))[0]
+
+    async def run_batch_async(self, jobs: Union[Iterable[RenderJob], AsyncIterable[RenderJob]],
+            timeout_s: Optional[float] = None) -> AsyncIterator[RenderResult]:
+        """
+        Run many jobs, yielding each result as soon as it finishes.
+        Results are **not** in submission order.
+        `jobs` is consumed lazily.  At most `max_concurrency + max_queued` jobs are taken from it before results are read.
+        Closing the iterator early cancels every running job.
+        """
+        queue = asyncio.Queue(maxsize=max(self.max_queued, 1))
+        results = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            error = None
+            try:
+                if isinstance(jobs, AsyncIterable):
+                    async for job in jobs:
+                        await queue.put(job)
+                else:
+                    for job in jobs:
+                        await queue.put(job)
+            except Exception as e:
+                error = e
+            # Even if reading `jobs` failed, so the workers finish what was queued, and stop.
+            for _ in range(self.max_concurrency):
+                await queue.put(done)
+            if error != None:
+                raise error
+
+        async def work():
+            while (job := await queue.get()) is not done:
+                try:
+                    (process, stats) = await self._render_with_stats_async(job, timeout_s)
+                    await results.put(RenderResult(job, process=process, stats=stats))
+                except Exception as e:
+                    await results.put(RenderResult(job, error=e))
+            await results.put(done)
+
+        tasks = [asyncio.create_task(produce())] + \
+            [asyncio.create_task(work()) for _ in range(self.max_concurrency)]
+        try:
+            finished_workers = 0
+            while finished_workers < self.max_concurrency:
+                result = await results.get()
+                if result is done:
+                    finished_workers += 1
+                else:
+                    yield result
+            # Surface any error from reading `jobs`.
+            await tasks[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        '''Limits openscad processes to `max_concurrency`, for the running event loop.'''
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def _render_with_stats_async(self, job: RenderJob,
+            timeout_s: Optional[float]) -> tuple[subprocess.CompletedProcess, RenderStats]:
+        async with self._semaphore():
+            start_time = time.perf_counter()
+            try:
+                (output, usage, summary, cache_hit) = await self._execute_async(job,
+                    timeout_s if timeout_s != None else self.timeout_s)
+            except Exception:
+                await asyncio.to_thread(self._log_stats, RenderStats(job=job, succeeded=False, cache_hit=False,
+                    wall_time_s=time.perf_counter() - start_time))
+                raise
+            stats = RenderStats(job=job, succeeded=True, cache_hit=cache_hit,
+                wall_time_s=time.perf_counter() - start_time,
+                cpu_time_s=usage.cpu_time_s if usage != None else None,
+                peak_rss_bytes=usage.peak_rss_bytes if usage != None else None,
+                summary=summary)
+            # Stats logs and the artifact index are files.
+            await asyncio.to_thread(self._log_stats, stats)
+            return (output, stats)
+
+    async def _execute_async(self, job: RenderJob,
+            timeout_s: Optional[float]) -> tuple[subprocess.CompletedProcess, Optional[_ProcessUsage], Optional[dict], bool]:
+        """
+        @returns (output, usage, summary, cache_hit)
+        Anything which reads or writes files (schemas, dependency hashes, the cache, parameter files) runs in a thread.
+        """
+        prepared = await asyncio.to_thread(self._prepare, job)
+        if prepared.cache_hit:
+            return (prepared.cached_output(self.openscad_binary_path), None, None, True)
+
+        (command_arguments, summary_path) = await asyncio.to_thread(self._add_run_files,
+            prepared.job, prepared.command_arguments)
+        try:
+            (output, usage) = await self._run_async(command_arguments, timeout_s)
+            summary = await asyncio.to_thread(self._read_summary, summary_path)
+        finally:
+            # Not awaited, so it still happens when cancelled.
+            summary_path.unlink(missing_ok=True)
+
+        await asyncio.to_thread(self._store_in_cache, prepared)
+        return (output, usage, summary, False)
+
+    async def _run_async(self, args: [str],
+            timeout_s: Optional[float]) -> tuple[subprocess.CompletedProcess, Optional[_ProcessUsage]]:
+        """
+        @see `OpenScadRunner._run`
+        @returns The process, and its resource usage (if supported by the platform).
+        """
+        command = [str(self.openscad_binary_path)] + args
+        if not hasattr(os, 'wait4'):
+            return (await self._run_without_usage_async(command, timeout_s), None)
+
+        with TemporaryFile() as stdout, TemporaryFile() as stderr:
+            # Own process group, so the whole tree can be killed.
+            process = subprocess.Popen(command, stdout=stdout, stderr=stderr, start_new_session=True)
+            # asyncio subprocesses do not expose resource usage.  Wait in a thread instead.
+            waiter = asyncio.ensure_future(asyncio.to_thread(os.wait4, process.pid, 0))
+            try:
+                (_, status, resources) = await asyncio.wait_for(asyncio.shield(waiter), timeout_s)
+            except BaseException as e:
+                # Includes cancellation.
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                (_, status, _) = await waiter
+                process.returncode = os.waitstatus_to_exitcode(status)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise subprocess.TimeoutExpired(command, timeout_s)
+                raise
+            process.returncode = os.waitstatus_to_exitcode(status)
+            output = await asyncio.to_thread(_read_output, command, process.returncode, stdout, stderr)
+
+        self._check_output(output)
+        return (output, self._process_usage(resources))
+
+    async def _run_without_usage_async(self, command: [str], timeout_s: Optional[float]) -> subprocess.CompletedProcess:
+        '''For platforms without `os.wait4`, e.g. Windows.'''
+        process = await asyncio.create_subprocess_exec(*command,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            (stdout, stderr) = await asyncio.wait_for(process.communicate(), timeout_s)
+        except asyncio.TimeoutError:
+            await _kill_process_tree(process)
+            raise subprocess.TimeoutExpired(command, timeout_s)
+        except BaseException:
+            # Includes cancellation.
+            await _kill_process_tree(process)
+            raise
+
+        output = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+        self._check_output(output)
+        return output
+
+def _read_output(command: [str], returncode: int, stdout: BinaryIO, stderr: BinaryIO) -> subprocess.CompletedProcess:
+    stdout.seek(0)
+    stderr.seek(0)
+    return subprocess.CompletedProcess(command, returncode, stdout.read(), stderr.read())
+
+async def _kill_process_tree(process: asyncio.subprocess.Process) -> None:
+    if process.returncode != None:
+        return
+    try:
+        # taskkill is the only built in way to kill child processes on Windows.
+        killer = await asyncio.create_subprocess_exec('taskkill', '/F', '/T', '/PID', str(process.pid),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        await killer.wait()
+    except FileNotFoundError:
+        # No taskkill.  Only openscad itself can be killed.
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    except ProcessLookupError:
+        pass
+    await process.wait()
@@ -0,0 +1,148 @@
+"""
+Time each geometry backend on representative models, and remember the fastest one for each entry point.
+A backend is only chosen if its meshes are closed, and match the CGAL meshes.
+@example python tests/backend_calibration.py --openscad /usr/bin/openscad
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import NamedTuple, Optional, Sequence
+
+from benchmark import SERIES, BenchmarkSeries
+from openscad_runner import Backends, OpenScadRunner, ParameterFile, RenderJob
+from render_cache import RenderCache, openscad_version
+
+CALIBRATION_SERIES = [series for series in SERIES
+    if series.name in ("bins-magnet-screw", "baseplate-style-2", "spiral-vase-bin", "spiral-vase-base")]
+'''`gridfinityBase` (with holes), `gridfinityBaseplate`, and the spiral vase.'''
+
+class CalibrationPoint(NamedTuple):
+    series: str
+    scad_file: str
+    backend: str
+    succeeded: bool
+    wall_time_s: float
+    volume: Optional[float]
+    watertight: bool
+
+class BackendChoices:
+    """
+    Fastest valid backend for each entry point, for each openscad version.
+    Saved as JSON.
+    """
+    path: Path
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path if path != None else self.default_path()
+        self._choices = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    @staticmethod
+    def default_path() -> Path:
+        '''Next to the default `RenderCache`.'''
+        return RenderCache.default_directory().parent.joinpath("backends.json")
+
+    def get(self, openscad_binary_path: str, scad_file_path: Path) -> Optional[str]:
+        if not self._choices:
+            # Never calibrated.  Do not run openscad just to find the version.
+            return None
+        return self._choices.get(openscad_version(str(openscad_binary_path)), {}).get(Path(scad_file_path).name)
+
+    def set(self, openscad_binary_path: str, scad_file_path: Path, backend: str) -> None:
+        self._choices.setdefault(openscad_version(str(openscad_binary_path)), {})[Path(scad_file_path).name] = backend
+
+    def apply(self, runner: OpenScadRunner) -> None:
+        '''Set `runner.backend` to the calibrated choice for its scad file.  Unchanged if never calibrated.'''
+        backend = self.get(runner.openscad_binary_path, runner.scad_file_path)
+        if backend != None:
+            runner.backend = backend
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._choices, indent=2, sort_keys=True))
+
+def calibrate(root: Path, openscad_binary_path: str, series_list: Sequence[BenchmarkSeries] = CALIBRATION_SERIES,
+        backends: Sequence[str] = Backends.ALL, grid: int = 2) -> list[CalibrationPoint]:
+    """
+    Export every series with every backend.  One render at a time, so timings are comparable.
+    @Important Requires numpy.
+    """
+    # Only import numpy when actually needed.  `BackendChoices` is used by the tests, which may not have it.
+    from mesh import load_mesh
+
+    points = []
+    with TemporaryDirectory(prefix="gridfinity-rebuilt-calibration-") as output_folder:
+        runner = OpenScadRunner(root)
+        runner.openscad_binary_path = openscad_binary_path
+        runner.image_folder_base = Path(output_folder)
+        # Never time a cache hit.
+        runner.render_cache = None
+        for series in series_list:
+            parameters = {}
+            if series.parameter_file != None:
+                parameters = ParameterFile.from_json(root.joinpath(series.parameter_file).read_text()).parameterSets["Default"]
+            parameters = parameters | series.variant | {"gridx": grid, "gridy": grid}
+            for backend in backends:
+                runner.backend = backend
+                job = RenderJob(scad_file_path=root.joinpath(series.scad_file),
+                    output_file_name=Path(f"{series.name}-{backend}.stl"),
+                    parameters=parameters, args=("--export-format=binstl",))
+                [result] = runner.run_batch([job], max_workers=1)
+                if result.ok:
+                    mesh = load_mesh(runner.image_folder_base.joinpath(job.output_file_name))
+                    point = CalibrationPoint(series.name, series.scad_file, backend, True,
+                        result.stats.wall_time_s, mesh.volume(), mesh.non_manifold_edge_count() == 0)
+                else:
+                    point = CalibrationPoint(series.name, series.scad_file, backend, False, 0, None, False)
+                points.append(point)
+                status = f"{point.wall_time_s:8.2f}s" if point.succeeded else "  FAILED"
+                print(f"{status} {series.name} {backend}", file=sys.stderr, flush=True)
+    return points
+
+def choose_backends(points: Sequence[CalibrationPoint], reference: str = Backends.CGAL,
+        volume_tolerance: float = 1e-3) -> dict[str, str]:
+    """
+    Fastest backend for each scad file, counting every series using it.
+    A backend is only valid if every series succeeded, is watertight,
+    and is within `volume_tolerance` (relative) of the `reference` backend's volume.
+    @returns scad file -> backend.  Scad files without a valid backend are left out.
+    """
+    reference_volumes = {point.series: point.volume for point in points
+        if point.backend == reference and point.succeeded}
+    totals = {}
+    for point in points:
+        key = (point.scad_file, point.backend)
+        expected = reference_volumes.get(point.series)
+        valid = point.succeeded and point.watertight and \
+            (expected == None or abs(point.volume - expected) <= volume_tolerance * abs(expected))
+        (total, all_valid) = totals.get(key, (0.0, True))
+        totals[key] = (total + point.wall_time_s, all_valid and valid)
+    choices = {}
+    for ((scad_file, backend), (total, valid)) in sorted(totals.items(), key=lambda item: item[1][0]):
+        if valid and scad_file not in choices:
+            choices[scad_file] = backend
+    return choices
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--grid", type=int, default=2, help="Grid size of each model (N x N).")
+    parser.add_argument("--backends", nargs="+", choices=Backends.ALL, default=list(Backends.ALL))
+    parser.add_argument("--output", type=Path, default=None,
+        help=f"Where choices are saved.  Default: {BackendChoices.default_path()}")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    points = calibrate(root, arguments.openscad, backends=arguments.backends, grid=arguments.grid)
+    choices = BackendChoices(arguments.output)
+    for (scad_file, backend) in choose_backends(points).items():
+        print(f"{scad_file}: {backend}")
+        choices.set(arguments.openscad, root.joinpath(scad_file), backend)
+    choices.save()
+    return 1 if any(not point.succeeded for point in points) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
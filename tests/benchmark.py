@@ -0,0 +1,211 @@
+"""
+Measure how render time and memory scale with gridx and gridy, for each top level .scad file.
+Results can be saved as a baseline, and later runs compared against it.
+@example python tests/benchmark.py --max-grid 4 --quick --save-baseline baseline.json
+@example python tests/benchmark.py --max-grid 4 --quick --baseline baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional, Sequence
+
+from openscad_runner import OpenScadRunner, ParameterFile, RenderJob, set_variable_argument
+from scaling_fit import fit_grid_exponents, fit_scaling_exponent
+
+QUICK_RESOLUTION = {"$fa": 12, "$fs": 2}
+'''Low resolution, for fast smoke numbers.  Not comparable with normal resolution results.'''
+
+@dataclass(frozen=True)
+class BenchmarkSeries:
+    '''One model, rendered at every combination of gridx and gridy.'''
+    name: str
+    scad_file: str
+    '''Relative to the repository root'''
+    parameter_file: Optional[str] = None
+    '''"Default" parameter set is used.  If None, the scad file's own defaults are used.'''
+    variant: dict = field(default_factory=dict)
+    '''Applied on top of the default parameters'''
+
+SERIES = [
+    BenchmarkSeries("bins-refined", "gridfinity-rebuilt-bins.scad", "tests/gridfinity-rebuilt-bins.json"),
+    BenchmarkSeries("bins-magnet-screw", "gridfinity-rebuilt-bins.scad", "tests/gridfinity-rebuilt-bins.json",
+        {"refined_holes": False, "magnet_holes": True, "screw_holes": True,
+            "crush_ribs": True, "chamfer_holes": True, "printable_hole_top": True}),
+    BenchmarkSeries("bins-all-corners", "gridfinity-rebuilt-bins.scad", "tests/gridfinity-rebuilt-bins.json",
+        {"refined_holes": False, "magnet_holes": True, "only_corners": False}),
+    *[BenchmarkSeries(f"baseplate-style-{style}", "gridfinity-rebuilt-baseplate.scad",
+        "tests/gridfinity-rebuilt-baseplate.json", {"style_plate": style}) for style in range(5)],
+    BenchmarkSeries("spiral-vase-bin", "gridfinity-spiral-vase.scad", "tests/gridfinity-spiral-vase.json",
+        {"type": 0}),
+    BenchmarkSeries("spiral-vase-base", "gridfinity-spiral-vase.scad", "tests/gridfinity-spiral-vase.json",
+        {"type": 1}),
+    BenchmarkSeries("lite", "gridfinity-rebuilt-lite.scad"),
+]
+
+@dataclass(frozen=True)
+class BenchmarkPoint:
+    series: str
+    gridx: int
+    gridy: int
+    succeeded: bool
+    wall_time_s: float
+    cpu_time_s: Optional[float]
+    peak_rss_bytes: Optional[int]
+
+def summarize(points: Sequence[BenchmarkPoint]) -> dict[str, dict]:
+    """
+    Group points by series, and fit scaling exponents.
+    Each metric is fit against the number of bases (gridx * gridy), and against gridx and gridy separately.
+    The result is what is saved as a baseline.
+    """
+    summary = {}
+    for series in sorted({point.series for point in points}):
+        series_points = sorted((p for p in points if p.series == series and p.succeeded),
+            key=lambda p: (p.gridx, p.gridy))
+        bases = [p.gridx * p.gridy for p in series_points]
+        gridx = [p.gridx for p in series_points]
+        gridy = [p.gridy for p in series_points]
+        times = [p.wall_time_s for p in series_points]
+        memory = [p.peak_rss_bytes for p in series_points]
+        summary[series] = {
+            "points": [asdict(p) for p in series_points],
+            "time_exponent": fit_scaling_exponent(bases, times),
+            "time_grid_exponents": fit_grid_exponents(gridx, gridy, times),
+            "memory_exponent": fit_scaling_exponent(bases, memory),
+            "memory_grid_exponents": fit_grid_exponents(gridx, gridy, memory),
+        }
+    return summary
+
+def compare(current: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """
+    Find measurements which got worse by more than `threshold` (0.2 = 20%).
+    Only series and grid sizes present in both are compared.
+    @returns Human readable description of each regression.
+    """
+    regressions = []
+    for (series, summary) in current.items():
+        if series not in baseline:
+            continue
+        baseline_points = {(p.get("gridx"), p.get("gridy")): p for p in baseline[series]["points"]}
+        for point in summary["points"]:
+            old = baseline_points.get((point["gridx"], point["gridy"]))
+            if old == None:
+                continue
+            for metric in ("wall_time_s", "peak_rss_bytes"):
+                if not old[metric] or not point[metric]:
+                    continue
+                ratio = point[metric] / old[metric]
+                if ratio > 1 + threshold:
+                    regressions.append(f"{series} {point['gridx']}x{point['gridy']} {metric}: "
+                        f"{old[metric]:.4g} -> {point[metric]:.4g} ({ratio - 1:+.0%})")
+    return regressions
+
+def run_benchmarks(root: Path, series_list: Sequence[BenchmarkSeries], grid_sizes: Sequence[int],
+        openscad_binary_path: str, output_suffix: str = ".stl", quick: bool = False,
+        max_workers: int = 1) -> list[BenchmarkPoint]:
+    """
+    Render every series at every combination of gridx and gridy.
+    @param grid_sizes Values for both gridx and gridy.
+    @param output_suffix ".stl" measures a full geometry render.  ".png" measures a preview.
+    @param max_workers Anything above 1 makes timings noisier.
+    """
+    points = []
+    with TemporaryDirectory(prefix="gridfinity-rebuilt-benchmark-") as output_folder:
+        # Every job sets its own scad file.
+        runner = OpenScadRunner(root)
+        runner.openscad_binary_path = openscad_binary_path
+        runner.image_folder_base = Path(output_folder)
+        # Never measure a cache hit.
+        runner.render_cache = None
+
+        jobs = {}
+        for series in series_list:
+            parameters = {}
+            if series.parameter_file != None:
+                parameter_file_path = root.joinpath(series.parameter_file)
+                parameters = ParameterFile.from_json(parameter_file_path.read_text()).parameterSets["Default"]
+            parameters = parameters | series.variant
+            args = []
+            if quick:
+                parameters = parameters | QUICK_RESOLUTION
+                # Parameter files do not override `common_arguments`.
+                for (name, value) in QUICK_RESOLUTION.items():
+                    args += set_variable_argument(name, value)
+            if output_suffix == ".stl":
+                args = ["--export-format=binstl"] + args
+            for (gridx, gridy) in itertools.product(grid_sizes, repeat=2):
+                job = RenderJob(scad_file_path=root.joinpath(series.scad_file),
+                    output_file_name=Path(f"{series.name}-{gridx}x{gridy}{output_suffix}"),
+                    parameters=parameters | {"gridx": gridx, "gridy": gridy},
+                    args=tuple(args))
+                jobs[id(job)] = (series.name, gridx, gridy, job)
+
+        for result in runner.run_batch([job for (_, _, _, job) in jobs.values()], max_workers):
+            (series_name, gridx, gridy, _) = jobs[id(result.job)]
+            stats = result.stats
+            points.append(BenchmarkPoint(series=series_name, gridx=gridx, gridy=gridy, succeeded=result.ok,
+                wall_time_s=stats.wall_time_s if stats != None else 0,
+                cpu_time_s=stats.cpu_time_s if stats != None else None,
+                peak_rss_bytes=stats.peak_rss_bytes if stats != None else None))
+            status = f"{points[-1].wall_time_s:8.2f}s" if result.ok else "  FAILED"
+            print(f"{status} {series_name} {gridx}x{gridy}", file=sys.stderr, flush=True)
+    return points
+
+def _format_exponent(exponent: Optional[float]) -> str:
+    return f"{exponent:.2f}" if exponent != None else "n/a"
+
+def _print_summary(summary: dict[str, dict]) -> None:
+    for (series, data) in summary.items():
+        times = ", ".join(f"{p['gridx']}x{p['gridy']}={p['wall_time_s']:.2f}s" for p in data["points"])
+        (x_exponent, y_exponent) = data["time_grid_exponents"] or (None, None)
+        print(f"{series}: time ~ bases^{_format_exponent(data['time_exponent'])}"
+            f" ~ gridx^{_format_exponent(x_exponent)} * gridy^{_format_exponent(y_exponent)}  [{times}]")
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--max-grid", type=int, default=3,
+        help="Largest gridx and gridy.  Every combination from 1x1 to NxN is rendered.")
+    parser.add_argument("--series", nargs="*", choices=[s.name for s in SERIES], help="Default: all.")
+    parser.add_argument("--format", choices=["stl", "png"], default="stl")
+    parser.add_argument("--quick", action="store_true", help="Low $fa/$fs, for fast smoke numbers.")
+    parser.add_argument("--jobs", type=int, default=1, help="Concurrent renders.  Above 1 adds noise.")
+    parser.add_argument("--output", type=Path, help="Save results as JSON.")
+    parser.add_argument("--save-baseline", type=Path, help="Save results as the new baseline.")
+    parser.add_argument("--baseline", type=Path, help="Compare against this baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slow down.  0.2 = 20%%.")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    series_list = [s for s in SERIES if not arguments.series or s.name in arguments.series]
+    points = run_benchmarks(root, series_list, range(1, arguments.max_grid + 1), arguments.openscad,
+        "." + arguments.format, arguments.quick, arguments.jobs)
+    summary = summarize(points)
+    _print_summary(summary)
+
+    results = {"quick": arguments.quick, "format": arguments.format, "series": summary}
+    for path in (arguments.output, arguments.save_baseline):
+        if path != None:
+            path.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    exit_code = 1 if any(not p.succeeded for p in points) else 0
+    if arguments.baseline != None:
+        baseline = json.loads(arguments.baseline.read_text())
+        if (baseline["quick"], baseline["format"]) != (arguments.quick, arguments.format):
+            print("Baseline was recorded with different settings.  Not comparing.", file=sys.stderr)
+            return 2
+        regressions = compare(summary, baseline["series"], arguments.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            exit_code = 1
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
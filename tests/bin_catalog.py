@@ -0,0 +1,273 @@
+"""
+Catalog of every bin size, lip, and hole option from "gridfinity-rebuilt-bins.scad".
+Bins which are only a 90 degree rotation of another bin are not rendered.
+Artifacts are tracked in an SQLite index, so regenerating the catalog only renders what changed.
+@example python tests/bin_catalog.py catalog --grid-sizes 1 2 3 --heights 3 6 --openscad /usr/bin/openscad
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Sequence
+
+from mesh import load_mesh
+from openscad_runner import OpenScadRunner, ParameterFile, RenderJob, RenderResult
+from parameter_sweep import BIN_HOLE_AXES, BIN_HOLE_PARAMETERS, ParameterSweep, SweepProgress, print_progress
+from render_cache import file_hash
+
+_NO_TABS = 5
+'''`style_tab` value for "None"'''
+
+def is_rotation_symmetric(parameters: dict) -> bool:
+    """
+    If rotating the bin 90 degrees gives the same bin as swapping `gridx`/`gridy` and `divx`/`divy`.
+    Tabs and scoops are always on the same side of a compartment, so only bins without them qualify.
+    """
+    if parameters["divx"] == 0 or parameters["divy"] == 0:
+        # Solid bin
+        return True
+    if parameters["cut_cylinders"]:
+        return True
+    return parameters["style_tab"] == _NO_TABS and parameters["scoop"] == 0
+
+def rotate_to_canonical(parameters: dict) -> dict:
+    '''Rotate symmetric bins so `gridx` <= `gridy`.  Usable as a `ParameterSweep` normalizer.'''
+    if not is_rotation_symmetric(parameters):
+        return parameters
+    if (parameters["gridx"], parameters["divx"]) <= (parameters["gridy"], parameters["divy"]):
+        return parameters
+    return parameters | {"gridx": parameters["gridy"], "gridy": parameters["gridx"],
+        "divx": parameters["divy"], "divy": parameters["divx"]}
+
+def bin_catalog_sweep(base_parameters: dict, grid_sizes: Sequence[int], heights: Sequence[float]) -> ParameterSweep:
+    '''Every size, lip, and hole option.  Combinations with identical geometry, or which are rotations of each other, are equivalent.'''
+    base_parameters = {"cut_cylinders": False, "scoop": 1, "style_tab": 1, "divx": 1, "divy": 1} | base_parameters
+    axes = {"gridx": grid_sizes, "gridy": grid_sizes, "gridz": heights, "include_lip": [True, False], **BIN_HOLE_AXES}
+    return ParameterSweep(base_parameters, axes, hole_parameters=BIN_HOLE_PARAMETERS,
+        normalizers=[rotate_to_canonical])
+
+class CatalogArtifact(NamedTuple):
+    '''One rendered model.'''
+    key: str
+    '''`ParameterSweep.canonical_key`'''
+    parameters: dict
+    '''What was actually rendered'''
+    variants: list[tuple[dict, int]]
+    '''(parameters, counter clockwise rotation in degrees to get that variant from the artifact)'''
+
+class CatalogEntry(NamedTuple):
+    parameters: dict
+    path: Path
+    rotation: int
+    '''Counter clockwise rotation in degrees to apply to the model at `path`'''
+    sha256: str
+    metrics: dict
+
+def plan_catalog(sweep: ParameterSweep) -> list[CatalogArtifact]:
+    '''Group every combination by the artifact which can stand in for it.'''
+    groups = {}
+    for parameters in sweep.combinations():
+        groups.setdefault(sweep.canonical_key(parameters), []).append(parameters)
+    artifacts = []
+    for (key, group) in groups.items():
+        variants = [(parameters, 0 if rotate_to_canonical(parameters) == parameters else 90) for parameters in group]
+        artifacts.append(CatalogArtifact(key, rotate_to_canonical(group[0]), variants))
+    return artifacts
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    parameters TEXT NOT NULL,
+    path TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    triangle_count INTEGER,
+    volume REAL,
+    surface_area REAL,
+    size_x REAL,
+    size_y REAL,
+    size_z REAL,
+    wall_time_s REAL,
+    peak_rss_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS variants (
+    parameters TEXT PRIMARY KEY,
+    artifact_key TEXT NOT NULL REFERENCES artifacts(key) ON DELETE CASCADE,
+    rotation INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS variants_by_artifact ON variants(artifact_key);
+"""
+
+_METRIC_COLUMNS = ("triangle_count", "volume", "surface_area", "size_x", "size_y", "size_z", "wall_time_s", "peak_rss_bytes")
+
+class BinCatalog:
+    """
+    Folder of rendered bins, plus an index mapping parameters to the file, its hash, and measurements.
+    Paths in the index are relative to `directory`, so the folder can be moved.
+    """
+    INDEX_FILE_NAME = "index.sqlite"
+    directory: Path
+    connection: sqlite3.Connection
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.directory.joinpath(self.INDEX_FILE_NAME))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> BinCatalog:
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.close()
+
+    def stale_artifacts(self, artifacts: Sequence[CatalogArtifact], runner: OpenScadRunner) -> list[tuple[CatalogArtifact, RenderJob]]:
+        '''Artifacts whose inputs changed since they were rendered, or whose file is missing or modified.'''
+        stale = []
+        for (artifact, job) in zip(artifacts, self._jobs(artifacts, runner)):
+            row = self.connection.execute("SELECT input_hash, sha256 FROM artifacts WHERE key = ?", (artifact.key,)).fetchone()
+            path = self.directory.joinpath(job.output_file_name)
+            if row == None or row[0] != runner.cache_key(job) or not path.exists() or file_hash(path) != row[1]:
+                stale.append((artifact, job))
+        return stale
+
+    def update(self, sweep: ParameterSweep, runner: OpenScadRunner, max_workers: Optional[int] = None,
+            progress: Optional[Callable[[SweepProgress], None]] = print_progress) -> list[RenderResult]:
+        """
+        Render every stale artifact, in parallel, and remove artifacts no longer in `sweep`.
+        Uses the runner's settings, except for the output folder.
+        @returns Results of the renders which were needed.  Failed artifacts are left out of the index.
+        """
+        artifacts = plan_catalog(sweep)
+        runner.image_folder_base = self.directory
+        stale = self.stale_artifacts(artifacts, runner)
+        self._remove_missing({artifact.key for artifact in artifacts})
+        for (artifact, _) in stale:
+            self._remove(artifact.key)
+        # Variants may have moved between artifacts, e.g. if a rotation now has its own artifact.
+        self.connection.execute("DELETE FROM variants")
+        stale_keys = {artifact.key for (artifact, _) in stale}
+        for artifact in artifacts:
+            if artifact.key not in stale_keys:
+                self._add_variants(artifact)
+        self.connection.commit()
+
+        pending = {id(job): artifact for (artifact, job) in stale}
+        results = []
+        failed = 0
+        for result in runner.run_batch([job for (_, job) in stale], max_workers):
+            results.append(result)
+            if result.ok:
+                self._add(pending[id(result.job)], result, runner.cache_key(result.job))
+                # Each artifact is its own transaction, so an interrupted update keeps finished work.
+                self.connection.commit()
+            else:
+                failed += 1
+            if progress != None:
+                progress(SweepProgress(len(results), len(stale), failed, result))
+        return results
+
+    def parameter_names(self) -> set[str]:
+        '''Every parameter name used by a variant in the index.'''
+        return {name for (name,) in self.connection.execute(
+            "SELECT DISTINCT json_each.key FROM variants, json_each(variants.parameters)")}
+
+    def find(self, **parameters) -> list[CatalogEntry]:
+        """
+        Entries whose parameters have all of the given values.
+        @throws ValueError If a name is not in `parameter_names`.
+        @example catalog.find(gridx=2, gridy=3, magnet_holes=True)
+        """
+        unknown = sorted(set(parameters) - self.parameter_names())
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(map(repr, unknown))}")
+        conditions = " AND ".join("json_extract(variants.parameters, ?) = ?" for _ in parameters)
+        query = "SELECT variants.parameters, path, rotation, sha256, " + \
+            ", ".join(_METRIC_COLUMNS) + \
+            " FROM variants JOIN artifacts ON variants.artifact_key = artifacts.key" + \
+            (" WHERE " + conditions if conditions else "")
+        values = []
+        for (name, value) in parameters.items():
+            values += ["$." + name, json.dumps(value) if isinstance(value, (list, dict)) else value]
+        return [CatalogEntry(json.loads(row[0]), self.directory.joinpath(row[1]), row[2], row[3],
+                dict(zip(_METRIC_COLUMNS, row[4:])))
+            for row in self.connection.execute(query, values)]
+
+    @staticmethod
+    def _jobs(artifacts: Sequence[CatalogArtifact], runner: OpenScadRunner) -> list[RenderJob]:
+        return [replace(runner.make_export_job([], _file_name(artifact)), parameters=artifact.parameters)
+            for artifact in artifacts]
+
+    def _add(self, artifact: CatalogArtifact, result: RenderResult, input_hash: str) -> None:
+        path = self.directory.joinpath(result.job.output_file_name)
+        mesh = load_mesh(path)
+        size = mesh.size()
+        metrics = (mesh.triangle_count, mesh.volume(), mesh.surface_area(), float(size[0]), float(size[1]), float(size[2]),
+            result.stats.wall_time_s if result.stats != None else None,
+            result.stats.peak_rss_bytes if result.stats != None else None)
+        self.connection.execute("INSERT INTO artifacts VALUES (" + ", ".join("?" * (5 + len(metrics))) + ")",
+            (artifact.key, _dumps(artifact.parameters), result.job.output_file_name.as_posix(), input_hash,
+                file_hash(path), *metrics))
+        self._add_variants(artifact)
+
+    def _add_variants(self, artifact: CatalogArtifact) -> None:
+        self.connection.executemany("INSERT OR REPLACE INTO variants VALUES (?, ?, ?)",
+            [(_dumps(parameters), artifact.key, rotation) for (parameters, rotation) in artifact.variants])
+
+    def _remove(self, key: str) -> None:
+        self.connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+
+    def _remove_missing(self, keys: set[str]) -> None:
+        '''Remove artifacts, and their files, which are not in `keys`.'''
+        for (key, path) in self.connection.execute("SELECT key, path FROM artifacts").fetchall():
+            if key not in keys:
+                self.directory.joinpath(path).unlink(missing_ok=True)
+                self._remove(key)
+
+def _dumps(parameters: dict) -> str:
+    return json.dumps(parameters, sort_keys=True)
+
+def _file_name(artifact: CatalogArtifact) -> str:
+    '''Readable, but unique.'''
+    parameters = artifact.parameters
+    return f"bin_{parameters['gridx']}x{parameters['gridy']}x{parameters['gridz']}_" + \
+        hashlib.sha256(artifact.key.encode()).hexdigest()[:16] + ".stl"
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=Path, help="Catalog folder.  Created if needed.")
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[1, 2, 3, 4], help="Values for gridx and gridy.")
+    parser.add_argument("--heights", type=float, nargs="+", default=[2, 3, 6], help="Values for gridz.")
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--jobs", type=int, default=None, help="Maximum concurrent renders.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be rendered.")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    defaults = ParameterFile.from_json(root.joinpath("tests/gridfinity-rebuilt-bins.json").read_text()).parameterSets["Default"]
+    sweep = bin_catalog_sweep(defaults, arguments.grid_sizes, arguments.heights)
+    runner = OpenScadRunner(root.joinpath("gridfinity-rebuilt-bins.scad"))
+    runner.openscad_binary_path = arguments.openscad
+
+    with BinCatalog(arguments.output) as catalog, runner:
+        artifacts = plan_catalog(sweep)
+        variant_count = sum(len(artifact.variants) for artifact in artifacts)
+        if arguments.dry_run:
+            stale = catalog.stale_artifacts(artifacts, runner)
+            print(f"{variant_count} variants, {len(artifacts)} artifacts, {len(stale)} to render")
+            return 0
+        results = catalog.update(sweep, runner, arguments.jobs)
+    print(f"{variant_count} variants, {len(artifacts)} artifacts, rendered {len(results)}")
+    return 1 if any(not result.ok for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
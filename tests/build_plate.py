@@ -0,0 +1,249 @@
+"""
+Arrange exported bins on printer beds, and write each bed as a single mesh.
+Bins are packed by their grid footprint, so nothing needs to be loaded to plan the plates.
+Meshes are then copied into the plate file one at a time, and binary STL files are streamed in chunks.
+@Important Requires numpy.
+@example python tests/build_plate.py plate.stl bins/*.stl --bed 256 256
+         python tests/build_plate.py plate.3mf bin_2x1.stl:2x1 bin_1x1.stl:1x1
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import re
+import sys
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from gridfinity_standard import BASE_GAP_MM, GRID_DIMENSIONS_MM
+from mesh import Mesh, load_triangles, write_binary_stl
+
+_CHUNK_TRIANGLES = 1 << 16
+'''Triangles transformed and written at once'''
+
+_ITEM_PATTERN = re.compile(r'^(.*):([0-9.]+)x([0-9.]+)$')
+
+@dataclass(frozen=True)
+class PlateItem:
+    '''One exported bin.'''
+    mesh_path: Path
+    gridx: float
+    gridy: float
+
+    @classmethod
+    def from_mesh(cls, mesh_path: Path) -> PlateItem:
+        '''Grid size from the mesh's bounding box, to the nearest half base.'''
+        (minimum, maximum) = mesh_bounds(load_triangles(mesh_path))
+        (gridx, gridy) = (round(2 * (size + gap) / grid) / 2
+            for (size, gap, grid) in zip((maximum - minimum)[:2], BASE_GAP_MM, GRID_DIMENSIONS_MM))
+        return cls(Path(mesh_path), max(gridx, 0.5), max(gridy, 0.5))
+
+    @classmethod
+    def parse(cls, text: str) -> PlateItem:
+        '''"FILE:GRIDXxGRIDY", or just "FILE" to measure the mesh.'''
+        match = _ITEM_PATTERN.match(text)
+        if match == None:
+            return cls.from_mesh(Path(text))
+        return cls(Path(match[1]), float(match[2]), float(match[3]))
+
+    def footprint_mm(self) -> tuple[float, float]:
+        return (self.gridx * GRID_DIMENSIONS_MM[0], self.gridy * GRID_DIMENSIONS_MM[1])
+
+class Placement(NamedTuple):
+    item: PlateItem
+    x: float
+    '''Minimum corner of the footprint, in mm from the corner of the bed'''
+    y: float
+    rotated: bool
+    '''If rotated 90 degrees counter clockwise'''
+
+    def size_mm(self) -> tuple[float, float]:
+        (width, depth) = self.item.footprint_mm()
+        return (depth, width) if self.rotated else (width, depth)
+
+    def center_mm(self) -> tuple[float, float]:
+        (width, depth) = self.size_mm()
+        return (self.x + width / 2, self.y + depth / 2)
+
+@dataclass
+class _Shelf:
+    y: float
+    depth: float
+    used_x: float = 0
+
+@dataclass
+class _Plate:
+    shelves: list[_Shelf] = field(default_factory=list)
+    placements: list[Placement] = field(default_factory=list)
+
+    def top(self, spacing: float) -> float:
+        '''Where the next shelf starts.'''
+        return self.shelves[-1].y + self.shelves[-1].depth + spacing if self.shelves else 0
+
+def pack_plates(items: Sequence[PlateItem], bed_mm: tuple[float, float],
+        spacing: float = max(BASE_GAP_MM)) -> list[list[Placement]]:
+    """
+    Shelf packing: largest bins first, each in the first row with room, opening rows and then plates as needed.
+    Bins are rotated if that fits them into an existing row, or makes a new row shallower.
+    @param spacing Between neighboring footprints, in mm.
+    @returns Placements on each plate.
+    @throws ValueError If a bin is larger than the bed.
+    """
+    (bed_x, bed_y) = bed_mm
+    plates = []
+    for item in sorted(items, key=lambda item: sorted(item.footprint_mm(), reverse=True), reverse=True):
+        (width, depth) = item.footprint_mm()
+        # Shallowest rows first.
+        orientations = sorted([(width, depth, False), (depth, width, True)], key=lambda orientation: orientation[1])
+        orientations = [(w, d, rotated) for (w, d, rotated) in orientations if w <= bed_x and d <= bed_y]
+        if not orientations:
+            raise ValueError(f"{item.mesh_path} ({item.gridx} x {item.gridy}) does not fit on a {bed_x} x {bed_y}mm bed")
+        placed = False
+        for plate in plates:
+            for shelf in plate.shelves:
+                for (w, d, rotated) in orientations:
+                    if d <= shelf.depth and shelf.used_x + w <= bed_x:
+                        plate.placements.append(Placement(item, shelf.used_x, shelf.y, rotated))
+                        shelf.used_x += w + spacing
+                        placed = True
+                        break
+                if placed:
+                    break
+            if not placed:
+                top = plate.top(spacing)
+                for (w, d, rotated) in orientations:
+                    if top + d <= bed_y:
+                        plate.shelves.append(_Shelf(top, d, w + spacing))
+                        plate.placements.append(Placement(item, 0, top, rotated))
+                        placed = True
+                        break
+            if placed:
+                break
+        if not placed:
+            (w, d, rotated) = orientations[0]
+            plates.append(_Plate([_Shelf(0, d, w + spacing)], [Placement(item, 0, 0, rotated)]))
+    return [plate.placements for plate in plates]
+
+def mesh_bounds(triangles: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''(minimum, maximum) corners.  Reads `triangles` in chunks, so memory mapped files are never fully loaded.'''
+    minimum = np.full(3, np.inf)
+    maximum = np.full(3, -np.inf)
+    for start in range(0, len(triangles), _CHUNK_TRIANGLES):
+        corners = np.asarray(triangles[start:start + _CHUNK_TRIANGLES]).reshape(-1, 3)
+        minimum = np.minimum(minimum, corners.min(axis=0))
+        maximum = np.maximum(maximum, corners.max(axis=0))
+    return (minimum, maximum)
+
+def _placed_chunks(placement: Placement) -> Iterator[np.ndarray]:
+    """
+    The item's triangles, moved to `placement`, standing on z = 0.
+    @returns (N, 3, 3) float32 chunks.  Each chunk is a copy, transformed in place.
+    """
+    triangles = load_triangles(placement.item.mesh_path)
+    (minimum, maximum) = mesh_bounds(triangles)
+    center = np.array([(minimum[0] + maximum[0]) / 2, (minimum[1] + maximum[1]) / 2, minimum[2]], dtype=np.float32)
+    offset = np.array([*placement.center_mm(), 0], dtype=np.float32)
+    for start in range(0, len(triangles), _CHUNK_TRIANGLES):
+        chunk = np.array(triangles[start:start + _CHUNK_TRIANGLES], dtype=np.float32)
+        chunk -= center
+        if placement.rotated:
+            chunk[..., [0, 1]] = chunk[..., [1, 0]]
+            chunk[..., 0] *= -1
+        chunk += offset
+        yield chunk
+
+def write_plate_stl(placements: Sequence[Placement], output_path: Path) -> int:
+    """
+    Binary STL of every placed item.  Only one chunk of one mesh is in memory at a time.
+    @returns Number of triangles written.
+    """
+    chunks = (chunk for placement in placements for chunk in _placed_chunks(placement))
+    return write_binary_stl(output_path, chunks, b'gridfinity-rebuilt build plate')
+
+_3MF_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+'''
+
+_3MF_RELATIONSHIPS = '''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+'''
+
+def write_plate_3mf(placements: Sequence[Placement], output_path: Path) -> int:
+    """
+    3MF with one object for each placed item, so slicers can still select bins individually.
+    Each mesh is loaded on its own, to share its vertices between triangles.
+    @returns Number of triangles written.
+    """
+    triangle_count = 0
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _3MF_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _3MF_RELATIONSHIPS)
+        with io.TextIOWrapper(archive.open('3D/3dmodel.model', 'w'), encoding='utf-8') as model:
+            model.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<model unit="millimeter" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                '<resources>\n')
+            for (object_id, placement) in enumerate(placements, start=1):
+                mesh = Mesh.from_triangles(np.concatenate(list(_placed_chunks(placement))
+                    or [np.empty((0, 3, 3), dtype=np.float32)]))
+                name = placement.item.mesh_path.stem.replace('&', '&amp;').replace('"', '&quot;').replace('<', '&lt;')
+                model.write(f'<object id="{object_id}" type="model" name="{name}"><mesh>\n<vertices>\n')
+                np.savetxt(model, mesh.vertices, fmt='<vertex x="%.6f" y="%.6f" z="%.6f"/>')
+                model.write('</vertices>\n<triangles>\n')
+                np.savetxt(model, mesh.faces, fmt='<triangle v1="%d" v2="%d" v3="%d"/>')
+                model.write('</triangles>\n</mesh></object>\n')
+                triangle_count += mesh.triangle_count
+            model.write('</resources>\n<build>\n')
+            model.writelines(f'<item objectid="{object_id}"/>\n' for object_id in range(1, len(placements) + 1))
+            model.write('</build>\n</model>\n')
+    return triangle_count
+
+def write_plate(placements: Sequence[Placement], output_path: Path) -> int:
+    '''Format is determined by the file extension.  ".stl" or ".3mf".'''
+    writers = {
+        '.stl': write_plate_stl,
+        '.3mf': write_plate_3mf,
+    }
+    suffix = Path(output_path).suffix.lower()
+    if suffix not in writers:
+        raise ValueError(f'Unsupported plate format "{suffix}"')
+    return writers[suffix](placements, Path(output_path))
+
+def plate_file_names(output_path: Path, plate_count: int) -> list[Path]:
+    '''`output_path` for a single plate.  Otherwise numbered, e.g. "plate-1.stl", "plate-2.stl".'''
+    output_path = Path(output_path)
+    if plate_count == 1:
+        return [output_path]
+    return [output_path.with_name(f"{output_path.stem}-{i}{output_path.suffix}") for i in range(1, plate_count + 1)]
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=Path, help="Plate file (.stl or .3mf).  Numbered if more than one plate is needed.")
+    parser.add_argument("meshes", nargs="+", metavar="FILE[:XxY]",
+        help="Exported bins.  The grid size is measured from the mesh, unless given.")
+    parser.add_argument("--bed", type=float, nargs=2, default=[220, 220], metavar=("X", "Y"), help="Printer bed size, in mm.")
+    parser.add_argument("--spacing", type=float, default=max(BASE_GAP_MM), help="Added between grid footprints, in mm.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print where each bin goes.")
+    arguments = parser.parse_args(argv)
+
+    items = [PlateItem.parse(text) for text in arguments.meshes]
+    plates = pack_plates(items, tuple(arguments.bed), arguments.spacing)
+    for (plate_path, placements) in zip(plate_file_names(arguments.output, len(plates)), plates):
+        for placement in placements:
+            rotation = " rotated" if placement.rotated else ""
+            print(f"{plate_path}: {placement.item.mesh_path} at {placement.x:g}, {placement.y:g}{rotation}")
+        if not arguments.dry_run:
+            triangle_count = write_plate(placements, plate_path)
+            print(f"{plate_path}: {len(placements)} bins, {triangle_count} triangles", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Session wide render settings for the tests.
+By default every render runs immediately, without a cache, exactly like a plain `OpenScadRunner`.
+Opt in to a shared `RenderCache` (--render-cache), calibrated backends (--backend calibrated),
+or one pool of openscad processes shared by every test (--defer-renders).
+Deferred renders are checked after the last test of each module.  Failures error that test's teardown, naming the test which requested each render.
+--compare-images checks the rendered images against the committed ones once every test has finished.  @see image_compare.py
+Works with `pytest-xdist`.  Each worker gets an equal share of the cores.
+"""
+
+from pathlib import Path
+import pytest
+
+from backend_calibration import BackendChoices
+from incremental_build import ArtifactIndex
+from openscad_runner import Backends, ImageModes
+from render_cache import RenderCache
+from render_session import ParameterFiles, RenderSession, TimedRender
+
+_RENDER_SESSION = pytest.StashKey[RenderSession]()
+_IMAGE_FAILURES = pytest.StashKey[list]()
+_WORKER_TIMINGS = "openscad_render_timings"
+
+def pytest_addoption(parser):
+    group = parser.getgroup("openscad")
+    group.addoption("--render-jobs", type=int, default=None,
+        help="Maximum concurrent openscad processes.  Defaults to the number of cores, split between xdist workers.")
+    group.addoption("--render-cache", type=Path, nargs="?", const=RenderCache.default_directory(), default=None,
+        metavar="PATH", help="Reuse renders whose inputs have not changed.  Defaults to the user's cache folder.")
+    group.addoption("--defer-renders", action="store_true",
+        help="Run renders from every test in one shared pool, instead of during each test.")
+    group.addoption("--backend", choices=["calibrated", "default", *Backends.ALL], default="default",
+        help="Geometry backend.  \"calibrated\" uses the choice saved on this machine by backend_calibration.py, if any.")
+    group.addoption("--image-mode", choices=ImageModes.ALL,
+        default=None, help="How png files are drawn.  Defaults to openscad's default, a preview.")
+    group.addoption("--render-durations", type=int, default=10, metavar="N",
+        help="Show the N slowest renders.  0 to disable.")
+    group.addoption("--artifact-index", type=Path, nargs="?", const=ArtifactIndex.default_path(), default=None,
+        metavar="PATH", help="Record every render, for incremental_build.py.  Defaults to the user's cache folder.")
+    group.addoption("--compare-images", action="store_true",
+        help="Fail if rendered images differ from those committed in git.  Requires numpy and Pillow.")
+    group.addoption("--image-heatmaps", type=Path, default=None, metavar="PATH",
+        help="With --compare-images, write a difference heatmap here for each image which differs.")
+
+def pytest_configure(config):
+    render_cache = None
+    if config.getoption("--render-cache") != None:
+        render_cache = RenderCache(config.getoption("--render-cache"))
+    backend = config.getoption("--backend")
+    artifact_index = None
+    if config.getoption("--artifact-index") != None:
+        artifact_index = ArtifactIndex(config.rootpath, config.getoption("--artifact-index"))
+    config.stash[_RENDER_SESSION] = RenderSession(
+        config.getoption("--render-jobs") or RenderSession.default_max_workers(),
+        render_cache, defer=config.getoption("--defer-renders"),
+        image_mode=config.getoption("--image-mode"),
+        backend=backend if backend in Backends.ALL else None,
+        backend_choices=BackendChoices() if backend == "calibrated" else None,
+        artifact_index=artifact_index)
+
+def pytest_unconfigure(config):
+    session = config.stash[_RENDER_SESSION]
+    session.close()
+    if session.artifact_index != None:
+        session.artifact_index.close()
+
+@pytest.fixture(scope="session")
+def render_session(pytestconfig) -> RenderSession:
+    return pytestconfig.stash[_RENDER_SESSION]
+
+@pytest.fixture(scope="session")
+def parameter_files(pytestconfig) -> ParameterFiles:
+    return ParameterFiles(pytestconfig.rootpath)
+
+@pytest.fixture(scope="module", autouse=True)
+def deferred_renders(render_session):
+    '''With --defer-renders, waits for every deferred render once the last test of the module has finished.'''
+    yield
+    if render_session.defer:
+        render_session.wait()
+
+def pytest_sessionfinish(session):
+    render_session = session.config.stash[_RENDER_SESSION]
+    if hasattr(session.config, "workeroutput"):
+        # xdist worker.  Timings are reported, and images compared, by the controller.
+        session.config.workeroutput[_WORKER_TIMINGS] = [tuple(timing) for timing in render_session.timings]
+        return
+    if session.config.getoption("--compare-images"):
+        # Only import numpy and Pillow when actually needed.
+        from image_compare import compare_committed
+
+        comparisons = compare_committed(session.config.rootpath, heatmap_folder=session.config.getoption("--image-heatmaps"))
+        failed = [comparison for comparison in comparisons if not comparison.passed]
+        session.config.stash[_IMAGE_FAILURES] = failed
+        if failed and session.exitstatus == pytest.ExitCode.OK:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    '''xdist controller.'''
+    timings = getattr(node, "workeroutput", {}).get(_WORKER_TIMINGS, [])
+    node.config.stash[_RENDER_SESSION].timings += [TimedRender(*timing) for timing in timings]
+
+def pytest_terminal_summary(terminalreporter, config):
+    for comparison in config.stash.get(_IMAGE_FAILURES, []):
+        heatmap = f" (heatmap: {comparison.heatmap_path})" if comparison.heatmap_path != None else ""
+        terminalreporter.write_line(f"IMAGE CHANGED {comparison.image_path}: {comparison.reason}{heatmap}", red=True)
+    count = config.getoption("--render-durations")
+    slowest = config.stash[_RENDER_SESSION].slowest(count) if count > 0 else []
+    if not slowest:
+        return
+    terminalreporter.write_sep("=", f"slowest {len(slowest)} renders")
+    for timing in slowest:
+        status = "cached" if timing.cache_hit else ("ok" if timing.succeeded else "FAILED")
+        terminalreporter.write_line(f"{timing.wall_time_s:8.2f}s {status:6} {timing.nodeid} {timing.output_file_name}")
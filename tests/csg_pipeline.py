@@ -0,0 +1,129 @@
+"""
+Two stage rendering.
+Stage 1 evaluates the scad code once per parameter set, and exports a flattened `.csg` file.
+Stage 2 renders images or meshes from the `.csg` files, which have no libraries left to parse.
+Parameter sets which flatten to identical CSG share a single stage 2 render.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from openscad_runner import OpenScadRunner, RenderJob, RenderResult
+
+def split_arguments(args: Iterable[str]) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """
+    Separate arguments which only affect evaluation from those which only affect rendering.
+    `-D` is only needed by stage 1, and `--export-format` is only needed by stage 2.  Anything else is needed by both.
+    @returns (stage 1 arguments, stage 2 arguments)
+    """
+    (stage_one, stage_two) = ([], [])
+    args = iter(args)
+    for argument in args:
+        if argument == '-D':
+            stage_one += [argument, next(args)]
+        elif argument.startswith('-D'):
+            stage_one.append(argument)
+        elif argument.startswith('--export-format'):
+            stage_two.append(argument)
+        else:
+            stage_one.append(argument)
+            stage_two.append(argument)
+    return (tuple(stage_one), tuple(stage_two))
+
+class _Stage2Key(NamedTuple):
+    csg_hash: str
+    camera: str
+    args: tuple[str, ...]
+    suffix: str
+
+class CsgPipeline:
+    """
+    Runs `RenderJob`s in two stages, using the settings of `runner`.
+    Set `runner.render_cache` to also skip stage 1 for parameter sets evaluated by earlier runs.
+    """
+    runner: OpenScadRunner
+    csg_directory: Path
+    '''Stage 1 output.  One `<content hash>.csg` file per unique model.'''
+
+    def __init__(self, runner: OpenScadRunner, csg_directory: Optional[Path] = None):
+        self.runner = runner
+        self.csg_directory = csg_directory if csg_directory != None else runner.run_files.directory.joinpath("csg")
+
+    def run(self, jobs: Iterable[RenderJob], max_workers: Optional[int] = None) -> list[RenderResult]:
+        """
+        Same results as `OpenScadRunner.run_batch`, but each model is only evaluated and rendered once.
+        Jobs sharing a render get copies of the output, and the same `process` and `stats`.
+        @returns One result per job, in the same order as `jobs`.
+        """
+        jobs = list(jobs)
+        self.csg_directory.mkdir(parents=True, exist_ok=True)
+        stage_one_results = self._stage_one(jobs, max_workers)
+
+        # Group jobs which produce identical output.
+        groups = {}
+        results = {}
+        for job in jobs:
+            (csg_path, error) = stage_one_results[self._stage_one_key(job)]
+            if error != None:
+                results[id(job)] = RenderResult(job, error=error)
+                continue
+            stage_two_args = split_arguments(job.args)[1]
+            key = _Stage2Key(csg_path.stem,
+                job.camera_arguments.as_argument() if job.camera_arguments != None else "",
+                stage_two_args, job.output_file_name.suffix.lower())
+            groups.setdefault(key, []).append(job)
+
+        stage_two_jobs = {}
+        for (key, group) in groups.items():
+            stage_two_job = replace(group[0], scad_file_path=self.csg_directory.joinpath(key.csg_hash + ".csg"),
+                parameters=None, args=key.args)
+            stage_two_jobs[id(stage_two_job)] = (stage_two_job, group)
+        for result in self.runner.run_batch([job for (job, _) in stage_two_jobs.values()], max_workers):
+            (_, group) = stage_two_jobs[id(result.job)]
+            output_path = self.runner.image_folder_base.joinpath(group[0].output_file_name)
+            for job in group:
+                copy_path = self.runner.image_folder_base.joinpath(job.output_file_name)
+                if result.ok and copy_path != output_path:
+                    copy_path.unlink(missing_ok=True)
+                    shutil.copyfile(output_path, copy_path)
+                results[id(job)] = replace(result, job=job,
+                    stats=replace(result.stats, job=job) if result.stats != None else None)
+        return [results[id(job)] for job in jobs]
+
+    @staticmethod
+    def _stage_one_key(job: RenderJob) -> str:
+        return json.dumps([str(job.scad_file_path), job.parameters, split_arguments(job.args)[0]],
+            sort_keys=True, default=str)
+
+    def _stage_one(self, jobs: list[RenderJob], max_workers: Optional[int]) -> dict[str, tuple[Optional[Path], Optional[Exception]]]:
+        '''@returns stage 1 key -> (csg path, error)'''
+        stage_one_jobs = {}
+        for job in jobs:
+            key = self._stage_one_key(job)
+            if key not in stage_one_jobs:
+                stage_one_jobs[key] = RenderJob(scad_file_path=job.scad_file_path,
+                    output_file_name=self.runner.run_files.unique_path(".csg"),
+                    parameters=job.parameters, args=split_arguments(job.args)[0])
+
+        keys = {id(job): key for (key, job) in stage_one_jobs.items()}
+        output = {}
+        for result in self.runner.run_batch(stage_one_jobs.values(), max_workers):
+            key = keys[id(result.job)]
+            if not result.ok:
+                output[key] = (None, result.error)
+                continue
+            # Content addressed, so identical models share a file.
+            export_path = self.runner.image_folder_base.joinpath(result.job.output_file_name)
+            csg_path = self.csg_directory.joinpath(hashlib.sha256(export_path.read_bytes()).hexdigest() + ".csg")
+            if csg_path.exists():
+                export_path.unlink()
+            else:
+                # May be on a different file system.
+                shutil.move(export_path, csg_path)
+            output[key] = (csg_path, None)
+        return output
@@ -0,0 +1,245 @@
+"""
+Typed parameters of a scad file, from its Customizer annotations.
+Lets parameters be checked, and converted to the right type, before openscad is run.
+@see https://en.wikibooks.org/wiki/OpenSCAD_User_Manual/Customizer
+"""
+from __future__ import annotations
+
+import difflib
+import functools
+import re
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Optional
+
+from scad_values import parse_scad_value
+
+class ParameterKinds:
+    '''Values for `ParameterSpec.kind`'''
+    Bool = 'bool'
+    Int = 'int'
+    '''Dropdowns and sliders with only whole numbers'''
+    Number = 'number'
+    String = 'string'
+    Vector = 'vector'
+
+@dataclass(frozen=True)
+class ParameterSpec:
+    '''One Customizer parameter.'''
+    name: str
+    kind: str
+    '''One of `ParameterKinds`'''
+    default: Any
+    section: str
+    description: str = ""
+    choices: Optional[dict[Any, str]] = None
+    '''Dropdown value -> label'''
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    '''For strings, the maximum length'''
+    step: Optional[float] = None
+
+class SchemaError(ValueError):
+    '''Parameters do not match a `CustomizerSchema`.  Lists every problem, not just the first one.'''
+
+@dataclass(frozen=True)
+class CustomizerSchema:
+    scad_file_name: str
+    parameters: dict[str, ParameterSpec]
+    '''In the same order as the scad file'''
+
+    def sections(self) -> dict[str, list[str]]:
+        '''Section -> parameter names.'''
+        sections = {}
+        for spec in self.parameters.values():
+            sections.setdefault(spec.section, []).append(spec.name)
+        return sections
+
+    def defaults(self) -> dict[str, Any]:
+        return {name: spec.default for (name, spec) in self.parameters.items()}
+
+    def coerce(self, parameters: dict) -> dict:
+        """
+        Check every parameter, and convert it to the type the scad file expects.
+        Accepts the strings saved by the Customizer, and whole floats for integer parameters.
+        @returns A new dictionary, in the same order as `parameters`.
+        @throws SchemaError If any parameter is unknown, the wrong type, out of range, or not one of the choices.
+        """
+        output = {}
+        errors = []
+        for (name, value) in parameters.items():
+            spec = self.parameters.get(name)
+            if spec == None:
+                suggestions = difflib.get_close_matches(name, self.parameters.keys(), n=1)
+                hint = f'  Did you mean "{suggestions[0]}"?' if suggestions else ""
+                errors.append(f'Unknown parameter "{name}".{hint}')
+                continue
+            try:
+                output[name] = _coerce(spec, value)
+            except (TypeError, ValueError) as e:
+                errors.append(f'"{name}": {e}')
+        if errors:
+            raise SchemaError(f"{self.scad_file_name}: " + "  ".join(errors))
+        return output
+
+_SECTION_PATTERN = re.compile(r'^/\*\s*\[(.+?)\]\s*\*/$')
+_ASSIGNMENT_PATTERN = re.compile(r'^(\$?[A-Za-z_]\w*)\s*=\s*(.+?)\s*;\s*(?://\s*(.*))?$')
+_DEFINITION_PATTERN = re.compile(r'^(?:module|function)\s')
+_INTEGER_PATTERN = re.compile(r'^-?\d+$')
+_NUMBER_PATTERN = re.compile(r'^-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$')
+_STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+def parse_schema(source: str, scad_file_name: str = "") -> CustomizerSchema:
+    """
+    Find every Customizer parameter in `source`.
+    Like the Customizer, only top level assignments of literal values, before the first module or function, count.
+    Parameters in the "Hidden" section are still included, since they can still be set.
+    """
+    parameters = {}
+    section = "Parameters"
+    description = []
+    in_comment = False
+    depth = 0
+    for line in source.splitlines():
+        line = line.strip()
+        if in_comment:
+            in_comment = "*/" not in line
+            continue
+        section_match = _SECTION_PATTERN.match(line)
+        if section_match != None:
+            section = section_match[1].strip()
+            description = []
+            continue
+        if line.startswith("/*"):
+            in_comment = "*/" not in line
+            continue
+        if line.startswith("//"):
+            description.append(line.lstrip("/").strip())
+            continue
+        if _DEFINITION_PATTERN.match(line):
+            break
+        assignment = _ASSIGNMENT_PATTERN.match(line) if depth == 0 else None
+        if assignment != None:
+            spec = _make_spec(assignment[1], assignment[2], assignment[3], section, " ".join(description))
+            if spec != None:
+                parameters[spec.name] = spec
+        code = _STRING_PATTERN.sub('""', line.split("//")[0])
+        depth = max(0, depth + code.count("{") - code.count("}"))
+        description = []
+    return CustomizerSchema(scad_file_name, parameters)
+
+def load_schema(scad_file_path: Path) -> CustomizerSchema:
+    '''`parse_schema` of a file.  Only re-parsed if the file has changed on disk.'''
+    scad_file_path = Path(scad_file_path).resolve()
+    return _load_schema(scad_file_path, scad_file_path.stat().st_mtime_ns)
+
+@functools.lru_cache(maxsize=None)
+def _load_schema(scad_file_path: Path, mtime_ns: int) -> CustomizerSchema:
+    '''`mtime_ns` is only used to invalidate the cache.'''
+    return parse_schema(scad_file_path.read_text(), scad_file_path.name)
+
+def _make_spec(name: str, literal: str, annotation: Optional[str], section: str, description: str) -> Optional[ParameterSpec]:
+    '''None if `literal` is not a literal value, so the Customizer ignores it.'''
+    try:
+        default = parse_scad_value(literal)
+    except ValueError:
+        return None
+    if isinstance(default, bool):
+        return ParameterSpec(name, ParameterKinds.Bool, default, section, description)
+    if isinstance(default, str):
+        spec = ParameterSpec(name, ParameterKinds.String, default, section, description)
+    elif isinstance(default, list) and all(_is_number(item) for item in default):
+        spec = ParameterSpec(name, ParameterKinds.Vector, default, section, description)
+    elif _is_number(default):
+        spec = ParameterSpec(name, ParameterKinds.Number,
+            int(default) if _INTEGER_PATTERN.match(literal) else default, section, description)
+    else:
+        return None
+    return _annotate(spec, literal, (annotation or "").strip())
+
+def _annotate(spec: ParameterSpec, literal: str, annotation: str) -> ParameterSpec:
+    """
+    Apply the comment after a parameter.
+    "[a, b:label]" is a dropdown, "[max]", "[min:max]" or "[min:step:max]" a slider, and a plain number a step.
+    """
+    if _NUMBER_PATTERN.match(annotation) and spec.kind in (ParameterKinds.Number, ParameterKinds.Vector):
+        return _with_integers(spec, literal, step=float(annotation))
+    if not (annotation.startswith("[") and annotation.endswith("]")):
+        return spec
+    parts = [part.strip() for part in annotation[1:-1].split(":")]
+    if all(_NUMBER_PATTERN.match(part) for part in parts) and 1 <= len(parts) <= 3 and "," not in annotation:
+        numbers = [float(part) for part in parts]
+        if spec.kind == ParameterKinds.String:
+            return replace(spec, maximum=numbers[0])
+        (minimum, step, maximum) = ([0.0, None] + numbers if len(numbers) == 1
+            else [numbers[0], None, numbers[1]] if len(numbers) == 2 else numbers)
+        return _with_integers(spec, literal, minimum=minimum, maximum=maximum, step=step,
+            integers=all(_INTEGER_PATTERN.match(part) for part in parts))
+
+    choices = {}
+    for item in annotation[1:-1].split(","):
+        (value, _, label) = item.partition(":")
+        value = value.strip()
+        value = (int(value) if _INTEGER_PATTERN.match(value) else float(value)) \
+            if _NUMBER_PATTERN.match(value) and spec.kind != ParameterKinds.String else value.strip('"')
+        choices[value] = label.strip() or str(value)
+    kind = ParameterKinds.Int if all(isinstance(value, int) for value in choices) else spec.kind
+    return replace(spec, kind=kind, choices=choices,
+        default=int(spec.default) if kind == ParameterKinds.Int else spec.default)
+
+def _with_integers(spec: ParameterSpec, literal: str, integers: bool = False, **limits) -> ParameterSpec:
+    '''Sliders are integers if the default, limits, and step are all whole numbers.'''
+    kind = ParameterKinds.Int if spec.kind == ParameterKinds.Number and integers and _INTEGER_PATTERN.match(literal) \
+        else spec.kind
+    return replace(spec, kind=kind, **limits)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _coerce_number(value: Any) -> float:
+    if isinstance(value, str):
+        value = parse_scad_value(value)
+    if not _is_number(value):
+        raise TypeError(f"expected a number, not {value!r}")
+    return value
+
+def _coerce(spec: ParameterSpec, value: Any) -> Any:
+    '''@throws TypeError, ValueError'''
+    if spec.kind == ParameterKinds.Bool:
+        if isinstance(value, str) and value in ("true", "false"):
+            return value == "true"
+        if not isinstance(value, bool):
+            raise TypeError(f"expected true or false, not {value!r}")
+        return value
+    if spec.kind == ParameterKinds.String:
+        if not isinstance(value, str):
+            raise TypeError(f"expected a string, not {value!r}")
+        if spec.maximum != None and len(value) > spec.maximum:
+            raise ValueError(f"longer than {spec.maximum:g} characters")
+        if spec.choices != None and value not in spec.choices:
+            raise ValueError(f"{value!r} is not one of {list(spec.choices)}")
+        return value
+    if spec.kind == ParameterKinds.Vector:
+        if isinstance(value, str):
+            value = parse_scad_value(value)
+        if not isinstance(value, (list, tuple)) or len(value) != len(spec.default):
+            raise TypeError(f"expected a vector of {len(spec.default)} numbers, not {value!r}")
+        values = [_coerce_number(item) for item in value]
+        _check_range(spec, values)
+        return values
+
+    number = _coerce_number(value)
+    if spec.kind == ParameterKinds.Int:
+        if number != int(number):
+            raise ValueError(f"expected a whole number, not {value!r}")
+        number = int(number)
+    if spec.choices != None and number not in spec.choices:
+        options = ", ".join(f"{choice} ({label})" for (choice, label) in spec.choices.items())
+        raise ValueError(f"{value!r} is not one of {options}")
+    _check_range(spec, [number])
+    return number
+
+def _check_range(spec: ParameterSpec, values: list[float]) -> None:
+    for value in values:
+        if (spec.minimum != None and value < spec.minimum) or (spec.maximum != None and value > spec.maximum):
+            raise ValueError(f"{value!r} is outside {spec.minimum:g} to {spec.maximum:g}")
@@ -0,0 +1,230 @@
+"""
+Split a drawer into baseplate tiles which fit on a printer bed, and export each unique tile once.
+Only the tiles along the drawer's edges are padded to fill the drawer.
+Tiles which are rotations of each other are only exported once.
+@example python tests/drawer_planner.py 600 400 output --bed 256 256 --openscad /usr/bin/openscad
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+from dataclasses import asdict, astuple, dataclass, replace
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from gridfinity_standard import GRID_SIZE_MM
+from openscad_runner import OpenScadRunner, ParameterFile
+from scad_values import parse_scad_value
+
+class AxisPiece(NamedTuple):
+    '''One row or column of tiles.'''
+    bases: int
+    padding_before: float
+    '''Padding on the negative side, in mm'''
+    padding_after: float
+
+def split_axis(length_mm: float, bed_mm: float, fit: float = 0) -> list[AxisPiece]:
+    """
+    Split one axis of a drawer into the fewest pieces which fit on the bed.
+    Pieces are as equal in size as possible, so more tiles are identical.
+    @param fit Where padding goes.  Same as `fitx` in "gridfinity-rebuilt-baseplate.scad".  -1 to 1.
+    @throws ValueError If the bed is too small for even a single base, plus padding.
+    """
+    bases = math.floor(length_mm / GRID_SIZE_MM)
+    if bases < 1:
+        raise ValueError(f"{length_mm}mm does not fit a single base")
+    padding = length_mm - bases * GRID_SIZE_MM
+    padding_after = padding * (fit + 1) / 2
+    padding_before = padding - padding_after
+
+    capacity = math.floor(bed_mm / GRID_SIZE_MM)
+    first_capacity = math.floor((bed_mm - padding_before) / GRID_SIZE_MM)
+    last_capacity = math.floor((bed_mm - padding_after) / GRID_SIZE_MM)
+    if bases * GRID_SIZE_MM + padding <= bed_mm:
+        return [AxisPiece(bases, padding_before, padding_after)]
+    if min(capacity, first_capacity, last_capacity) < 1:
+        raise ValueError(f"A {bed_mm}mm bed can not fit a single base, plus {max(padding_before, padding_after):.4g}mm of padding")
+
+    count = 2
+    while first_capacity + last_capacity + (count - 2) * capacity < bases:
+        count += 1
+    capacities = [first_capacity] + [capacity] * (count - 2) + [last_capacity]
+    sizes = _even_split(bases, capacities)
+    return [AxisPiece(size, padding_before if i == 0 else 0, padding_after if i == count - 1 else 0)
+        for (i, size) in enumerate(sizes)]
+
+def _even_split(total: int, capacities: list[int]) -> list[int]:
+    '''Split `total` into pieces no larger than `capacities`, as evenly and symmetrically as possible.'''
+    count = len(capacities)
+    sizes = [min(total // count, capacity) for capacity in capacities]
+    # Mirrored pairs of pieces, middle first.  The middle piece of an odd count is on its own.
+    groups = ([(count // 2,)] if count % 2 else []) + [(i, count - 1 - i) for i in reversed(range(count // 2))]
+    while sum(sizes) < total:
+        remaining = total - sum(sizes)
+        candidates = [group for group in groups
+            if len(group) <= remaining and all(sizes[i] < capacities[i] for i in group)]
+        if not candidates:
+            # Only possible when the edge pieces have less room, or an even count gets an odd number of extra bases.
+            candidates = [(i,) for group in groups for i in group if sizes[i] < capacities[i]]
+        # Smallest pieces first.  Extra bases go in pairs, except an odd one left over, which goes to the middle piece.
+        group = min(candidates, key=lambda group: (min(sizes[i] for i in group), (len(group) == 1) != (remaining % 2 == 1)))
+        for i in group:
+            sizes[i] += 1
+    return sizes
+
+@dataclass(frozen=True)
+class Tile:
+    '''Parameters for one baseplate tile.  Distances are in mm.'''
+    gridx: int
+    gridy: int
+    distancex: float
+    distancey: float
+    fitx: float
+    fity: float
+
+    @classmethod
+    def from_pieces(cls, x: AxisPiece, y: AxisPiece) -> Tile:
+        return cls(x.bases, y.bases, _distance(x), _distance(y), _fit(x), _fit(y))
+
+    def rotated(self) -> Tile:
+        '''Rotated 90 degrees counter clockwise.  +x padding moves to +y, +y padding moves to -x.'''
+        return replace(self, gridx=self.gridy, gridy=self.gridx, distancex=self.distancey, distancey=self.distancex,
+            fitx=-self.fity, fity=self.fitx)
+
+    def canonical(self) -> tuple[Tile, int]:
+        """
+        Identical for tiles which are rotations of each other.
+        @returns (canonical tile, counter clockwise rotation in degrees which turns it into this tile)
+        """
+        rotations = [self]
+        for _ in range(3):
+            rotations.append(rotations[-1].rotated())
+        index = min(range(4), key=lambda i: astuple(rotations[i]))
+        return (rotations[index], (360 - 90 * index) % 360)
+
+    def as_parameters(self) -> dict:
+        return asdict(self)
+
+def _distance(piece: AxisPiece) -> float:
+    padding = piece.padding_before + piece.padding_after
+    return round(piece.bases * GRID_SIZE_MM + padding, 6) if padding > 0 else 0
+
+def _fit(piece: AxisPiece) -> float:
+    padding = piece.padding_before + piece.padding_after
+    if padding <= 0:
+        return 0
+    return round(2 * piece.padding_after / padding - 1, 6)
+
+@dataclass(frozen=True)
+class PlacedTile:
+    column: int
+    row: int
+    '''0 is the front (-y) of the drawer'''
+    unique_index: int
+    '''Index into `DrawerPlan.unique_tiles`'''
+    rotation: int
+    '''Counter clockwise rotation, in degrees, to apply to the unique tile'''
+
+@dataclass(frozen=True)
+class DrawerPlan:
+    drawer_mm: tuple[float, float]
+    bed_mm: tuple[float, float]
+    columns: list[AxisPiece]
+    rows: list[AxisPiece]
+    unique_tiles: list[Tile]
+    placements: list[PlacedTile]
+
+    def counts(self) -> list[int]:
+        '''Number of copies to print of each unique tile.'''
+        counts = [0] * len(self.unique_tiles)
+        for placement in self.placements:
+            counts[placement.unique_index] += 1
+        return counts
+
+    def file_name(self, unique_index: int) -> str:
+        tile = self.unique_tiles[unique_index]
+        return f"tile_{unique_index}_{tile.gridx}x{tile.gridy}.stl"
+
+    def manifest(self) -> dict:
+        counts = self.counts()
+        return {
+            "drawer_mm": list(self.drawer_mm),
+            "bed_mm": list(self.bed_mm),
+            "columns": [piece._asdict() for piece in self.columns],
+            "rows": [piece._asdict() for piece in self.rows],
+            "tiles": [{"file": self.file_name(i), "count": counts[i], "parameters": tile.as_parameters()}
+                for (i, tile) in enumerate(self.unique_tiles)],
+            "placements": [asdict(placement) for placement in self.placements],
+        }
+
+def plan_drawer(drawer_mm: tuple[float, float], bed_mm: tuple[float, float],
+        fit: tuple[float, float] = (0, 0), clearance_mm: float = 0) -> DrawerPlan:
+    """
+    @param clearance_mm Removed from each drawer dimension, so the plate is not a press fit.
+    """
+    drawer_mm = (drawer_mm[0] - clearance_mm, drawer_mm[1] - clearance_mm)
+    columns = split_axis(drawer_mm[0], bed_mm[0], fit[0])
+    rows = split_axis(drawer_mm[1], bed_mm[1], fit[1])
+    unique = {}
+    placements = []
+    for (row, y) in enumerate(rows):
+        for (column, x) in enumerate(columns):
+            (canonical, rotation) = Tile.from_pieces(x, y).canonical()
+            index = unique.setdefault(canonical, len(unique))
+            placements.append(PlacedTile(column, row, index, rotation))
+    return DrawerPlan(drawer_mm, bed_mm, columns, rows, list(unique.keys()), placements)
+
+def export_tiles(plan: DrawerPlan, runner: OpenScadRunner, max_workers: Optional[int] = None) -> dict[str, Exception]:
+    """
+    Export every unique tile, in parallel, to `runner.image_folder_base`.
+    Uses `runner.parameters` for anything the plan does not set (e.g. `style_plate`).
+    @returns file name -> error, for every export which failed.
+    """
+    base_parameters = runner.parameters if runner.parameters != None else {}
+    jobs = [replace(runner.make_export_job([], plan.file_name(i)), parameters=base_parameters | tile.as_parameters())
+        for (i, tile) in enumerate(plan.unique_tiles)]
+    return {str(result.job.output_file_name): result.error
+        for result in runner.run_batch(jobs, max_workers) if not result.ok}
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("width", type=float, help="Drawer size along x, in mm.")
+    parser.add_argument("depth", type=float, help="Drawer size along y, in mm.")
+    parser.add_argument("output", type=Path, help="Folder for the STL files and manifest.json.")
+    parser.add_argument("--bed", type=float, nargs=2, default=[220, 220], metavar=("X", "Y"), help="Printer bed size, in mm.")
+    parser.add_argument("--fit", type=float, nargs=2, default=[0, 0], metavar=("X", "Y"), help="Where padding goes.  -1 to 1.")
+    parser.add_argument("--clearance", type=float, default=0, help="Removed from the drawer size, in mm.")
+    parser.add_argument("--parameter", "-D", action="append", default=[], metavar="NAME=VALUE",
+        help="Baseplate setting.  e.g. -D style_plate=3")
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent exports.")
+    parser.add_argument("--dry-run", action="store_true", help="Only write the manifest.")
+    arguments = parser.parse_args(argv)
+
+    plan = plan_drawer((arguments.width, arguments.depth), tuple(arguments.bed), tuple(arguments.fit), arguments.clearance)
+    arguments.output.mkdir(parents=True, exist_ok=True)
+    arguments.output.joinpath("manifest.json").write_text(json.dumps(plan.manifest(), indent=2))
+    for (i, count) in enumerate(plan.counts()):
+        print(f"{count} x {plan.file_name(i)}")
+    if arguments.dry_run:
+        return 0
+
+    root = Path(__file__).resolve().parent.parent
+    runner = OpenScadRunner(root.joinpath("gridfinity-rebuilt-baseplate.scad"))
+    runner.openscad_binary_path = arguments.openscad
+    runner.image_folder_base = arguments.output
+    runner.parameters = ParameterFile.from_json(
+        root.joinpath("tests/gridfinity-rebuilt-baseplate.json").read_text()).parameterSets["Default"]
+    for assignment in arguments.parameter:
+        (name, value) = assignment.split("=", 1)
+        runner.parameters[name] = parse_scad_value(value)
+    with runner:
+        errors = export_tiles(plan, runner, arguments.jobs)
+    for (file_name, error) in errors.items():
+        print(f"FAILED {file_name}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+Prove a refactor did not change the exported geometry.
+Exports the same parameter sets from two git revisions (or working trees), and compares the meshes.
+Requires numpy and scipy.
+@example python tests/geometry_diff.py gridfinity-rebuilt-bins.scad HEAD~1 . --parameter-file tests/gridfinity-rebuilt-bins.json
+"""
+from __future__ import annotations
+
+import argparse
+import filecmp
+import io
+import re
+import subprocess
+import sys
+import tarfile
+from dataclasses import dataclass, replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterator, Optional
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from mesh import load_triangles
+from openscad_runner import OpenScadRunner, ParameterFile
+
+CHUNK_TRIANGLES = 1 << 18
+'''Triangles processed at once.  Bounds memory use, no matter how large the mesh is.'''
+CHUNK_POINTS = 1 << 15
+'''Sample points processed at once'''
+MAX_REFERENCE_POINTS = 2_000_000
+'''Limits the size of each KD-tree.  About 60 bytes each.'''
+MIN_EXPECTED_SAMPLES = 16
+'''Triangles expected to get fewer samples than this get a reference point at their centroid'''
+CANDIDATE_COUNTS = (8, 64, 512)
+"""
+Nearest reference points on the other surface.  Their triangles are the candidates for the closest point.
+Points still further than `resolution` are retried with the next count.
+"""
+
+@dataclass(frozen=True)
+class MeshStatistics:
+    triangle_count: int
+    volume: float
+    surface_area: float
+    minimum: tuple[float, float, float]
+    maximum: tuple[float, float, float]
+
+@dataclass(frozen=True)
+class GeometryDifference:
+    """
+    How far one mesh is from another.
+    Distances are in mm.
+    """
+    name: str
+    identical: bool
+    '''Byte for byte identical.  Nothing else was measured.'''
+    hausdorff_distance: float = 0.0
+    """
+    Largest distance from a sample point on either surface to the other surface.
+    Distances are exact, but features smaller than the sample spacing can be missed.
+    """
+    mean_distance: float = 0.0
+    volume_delta: float = 0.0
+    '''new - old, in mm^3'''
+    relative_volume_delta: float = 0.0
+    bounding_box_delta: float = 0.0
+    '''Largest change of any bounding box coordinate'''
+    old_triangle_count: int = 0
+    new_triangle_count: int = 0
+
+    def drifted(self, tolerance: float, relative_volume_tolerance: float = 1e-4) -> bool:
+        return self.hausdorff_distance > tolerance \
+            or self.bounding_box_delta > tolerance \
+            or abs(self.relative_volume_delta) > relative_volume_tolerance
+
+def _chunks(triangles: np.ndarray) -> Iterator[tuple[int, np.ndarray]]:
+    '''(first index, float64 triangles) for every chunk.'''
+    for start in range(0, len(triangles), CHUNK_TRIANGLES):
+        yield (start, np.asarray(triangles[start:start + CHUNK_TRIANGLES], dtype=np.float64))
+
+def _areas(triangles: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1) / 2
+
+def mesh_statistics(triangles: np.ndarray) -> MeshStatistics:
+    '''Measured one chunk at a time.  @param triangles e.g. from `mesh.load_triangles`'''
+    signed_volume = 0.0
+    surface_area = 0.0
+    minimum = np.full(3, np.inf)
+    maximum = np.full(3, -np.inf)
+    for (_, chunk) in _chunks(triangles):
+        signed_volume += np.einsum('ij,ij->i', chunk[:, 0], np.cross(chunk[:, 1], chunk[:, 2])).sum() / 6
+        surface_area += _areas(chunk).sum()
+        minimum = np.minimum(minimum, chunk.min(axis=(0, 1)))
+        maximum = np.maximum(maximum, chunk.max(axis=(0, 1)))
+    return MeshStatistics(len(triangles), abs(signed_volume), surface_area, tuple(minimum), tuple(maximum))
+
+def sample_surface(triangles: np.ndarray, count: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Uniformly distributed random points on the surface.
+    @returns ((count, 3) points, (count,) index of the triangle each point is on)
+    """
+    rng = np.random.default_rng(seed)
+    chunk_areas = np.array([_areas(chunk).sum() for (_, chunk) in _chunks(triangles)])
+    if chunk_areas.sum() <= 0:
+        return (np.empty((0, 3)), np.empty(0, dtype=np.int64))
+    chunk_counts = rng.multinomial(count, chunk_areas / chunk_areas.sum())
+
+    points = []
+    indices = []
+    for ((start, chunk), chunk_count) in zip(_chunks(triangles), chunk_counts):
+        if chunk_count == 0:
+            continue
+        areas = _areas(chunk)
+        chosen = rng.choice(len(chunk), size=chunk_count, p=areas / areas.sum())
+        # Uniform barycentric coordinates.
+        (r1, r2) = (np.sqrt(rng.random(chunk_count)), rng.random(chunk_count))
+        corners = chunk[chosen]
+        points.append(corners[:, 0] * (1 - r1)[:, None] + corners[:, 1] * (r1 * (1 - r2))[:, None]
+            + corners[:, 2] * (r1 * r2)[:, None])
+        indices.append(chosen + start)
+    return (np.concatenate(points), np.concatenate(indices))
+
+def reference_points(triangles: np.ndarray, samples: np.ndarray, sample_triangles: np.ndarray,
+        max_points: int = MAX_REFERENCE_POINTS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Points which find the triangles nearest to any location.
+    Small triangles may have no samples, so their centroids are added.
+    @returns (points, index of the triangle each point is on)
+    """
+    area_per_sample = mesh_statistics(triangles).surface_area / max(len(samples), 1)
+    points = [samples]
+    indices = [sample_triangles]
+    remaining = max_points - len(samples)
+    for (start, chunk) in _chunks(triangles):
+        if remaining <= 0:
+            break
+        small = np.flatnonzero(_areas(chunk) < MIN_EXPECTED_SAMPLES * area_per_sample)[:remaining]
+        points.append(chunk[small].mean(axis=1))
+        indices.append(small + start)
+        remaining -= len(small)
+    return (np.concatenate(points), np.concatenate(indices))
+
+def point_triangle_distance(points: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """
+    Exact distance from each point to the matching triangle.
+    @param points (N, 3)
+    @param triangles (N, 3, 3)
+    @see Ericson, "Real-Time Collision Detection", 5.1.5
+    """
+    (a, b, c) = (triangles[:, 0], triangles[:, 1], triangles[:, 2])
+    def dot(u, v):
+        return np.einsum('ij,ij->i', u, v)
+    (ab, ac, ap, bp, cp) = (b - a, c - a, points - a, points - b, points - c)
+    (d1, d2, d3, d4, d5, d6) = (dot(ab, ap), dot(ac, ap), dot(ab, bp), dot(ac, bp), dot(ab, cp), dot(ac, cp))
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = va + vb + vc
+        closest = a + ab * (vb / denominator)[:, None] + ac * (vc / denominator)[:, None]
+        # Later regions take priority, matching the order of checks in the reference.
+        regions = [
+            ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+                b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None]),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), a + ac * (d2 / (d2 - d6))[:, None]),
+            ((d6 >= 0) & (d5 <= d6), c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), a + ab * (d1 / (d1 - d3))[:, None]),
+            ((d3 >= 0) & (d4 <= d3), b),
+            ((d1 <= 0) & (d2 <= 0), a),
+        ]
+        for (in_region, region_closest) in regions:
+            closest = np.where(in_region[:, None], region_closest, closest)
+    distances = np.linalg.norm(points - closest, axis=1)
+    # Degenerate (zero area) triangles.
+    corner_distances = np.linalg.norm(points[:, None, :] - triangles, axis=2).min(axis=1)
+    return np.where(np.isfinite(distances), np.minimum(distances, corner_distances), corner_distances)
+
+def surface_distances(points: np.ndarray, triangles: np.ndarray, references: np.ndarray,
+        reference_triangles: np.ndarray, resolution: float = 1e-4) -> np.ndarray:
+    """
+    Distance from each point to the surface made of `triangles`.
+    Only triangles with a reference point near the point are checked, so memory use is bounded by the number of references.
+    @param references, reference_triangles From `reference_points(triangles)`.
+    @param resolution Distances below this are not refined further.
+    @returns Upper bound of each distance.  Exact unless the surface is very under sampled.
+    """
+    tree = cKDTree(references)
+    output = np.full(len(points), np.inf)
+    remaining = np.arange(len(points))
+    for candidate_count in CANDIDATE_COUNTS:
+        candidate_count = min(candidate_count, len(references))
+        # Fewer points per chunk as the candidate count grows, so memory use stays the same.
+        chunk_size = max(CHUNK_POINTS * CANDIDATE_COUNTS[0] // candidate_count, 1)
+        for start in range(0, len(remaining), chunk_size):
+            chunk = remaining[start:start + chunk_size]
+            output[chunk] = np.minimum(output[chunk],
+                _nearest_candidate_distances(points[chunk], triangles, tree, reference_triangles, candidate_count))
+        remaining = remaining[output[remaining] > resolution]
+        if len(remaining) == 0 or candidate_count == len(references):
+            break
+    return output
+
+def _nearest_candidate_distances(points: np.ndarray, triangles: np.ndarray, tree: cKDTree,
+        reference_triangles: np.ndarray, candidate_count: int) -> np.ndarray:
+    (_, nearest) = tree.query(points, k=candidate_count)
+    candidates = reference_triangles[nearest.reshape(len(points), candidate_count)]
+    # Only read each candidate triangle once.
+    (unique, inverse) = np.unique(candidates, return_inverse=True)
+    candidate_triangles = np.asarray(triangles[unique], dtype=np.float64)[inverse.reshape(-1)]
+    distances = point_triangle_distance(np.repeat(points, candidate_count, axis=0), candidate_triangles)
+    return distances.reshape(len(points), candidate_count).min(axis=1)
+
+def compare_meshes(old_path: Path, new_path: Path, name: str = "", sample_count: int = 200_000) -> GeometryDifference:
+    '''@param sample_count Per surface.  Higher finds smaller differences, and uses more memory.'''
+    if filecmp.cmp(old_path, new_path, shallow=False):
+        return GeometryDifference(name, identical=True)
+    (old, new) = (load_triangles(old_path), load_triangles(new_path))
+    (old_statistics, new_statistics) = (mesh_statistics(old), mesh_statistics(new))
+    (old_samples, old_sample_triangles) = sample_surface(old, sample_count)
+    (new_samples, new_sample_triangles) = sample_surface(new, sample_count)
+    distances = np.concatenate([
+        surface_distances(old_samples, new, *reference_points(new, new_samples, new_sample_triangles)),
+        surface_distances(new_samples, old, *reference_points(old, old_samples, old_sample_triangles)),
+    ])
+    volume_delta = new_statistics.volume - old_statistics.volume
+    corners = np.array([old_statistics.minimum, old_statistics.maximum, new_statistics.minimum, new_statistics.maximum])
+    return GeometryDifference(name, identical=False,
+        hausdorff_distance=float(distances.max()) if len(distances) else 0.0,
+        mean_distance=float(distances.mean()) if len(distances) else 0.0,
+        volume_delta=volume_delta,
+        relative_volume_delta=volume_delta / old_statistics.volume if old_statistics.volume else 0.0,
+        bounding_box_delta=float(np.abs(corners[2:] - corners[:2]).max()),
+        old_triangle_count=old_statistics.triangle_count,
+        new_triangle_count=new_statistics.triangle_count)
+
+def checkout_revision(repository: Path, revision: str, destination: Path) -> None:
+    '''Extract a git revision, without touching the repository's working tree.'''
+    archive = subprocess.run(["git", "-C", str(repository), "archive", "--format=tar", revision],
+        capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(destination, filter='data')
+        else:
+            # Extraction filters are only in Python 3.12, and some patch releases before it.
+            # The archive comes from the repository itself, so is trusted.
+            tar.extractall(destination)
+
+def mesh_file_names(parameter_sets: dict[str, dict]) -> dict[str, str]:
+    """
+    File name for each parameter set's mesh.
+    Set names can contain anything, e.g. "/" or "..", so only the index and a sanitized name are used.
+    @returns set name -> file name, e.g. "2-Half_grid.stl"
+    """
+    return {name: f"{i}-{re.sub(r'[^A-Za-z0-9_-]+', '_', name)[:64]}.stl" for (i, name) in enumerate(parameter_sets)}
+
+def export_meshes(root: Path, scad_file: str, parameter_sets: dict[str, dict], output_folder: Path,
+        openscad_binary_path: str, max_workers: Optional[int] = None) -> dict[str, Exception]:
+    """
+    Export each parameter set into `output_folder`, named by `mesh_file_names`.
+    @returns set name -> error, for every export which failed.
+    """
+    output_folder.mkdir(parents=True, exist_ok=True)
+    runner = OpenScadRunner(root.joinpath(scad_file))
+    runner.openscad_binary_path = openscad_binary_path
+    runner.image_folder_base = output_folder
+    file_names = mesh_file_names(parameter_sets)
+    jobs = {}
+    for (name, parameters) in parameter_sets.items():
+        job = replace(runner.make_export_job([], file_names[name]), parameters=parameters)
+        jobs[id(job)] = (name, job)
+    with runner:
+        return {jobs[id(result.job)][0]: result.error
+            for result in runner.run_batch([job for (_, job) in jobs.values()], max_workers) if not result.ok}
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scad_file", help="Relative to the repository root.")
+    parser.add_argument("old", help="Git revision, or folder.")
+    parser.add_argument("new", help="Git revision, or folder.")
+    parser.add_argument("--parameter-file", type=Path, help="Every set in it is compared.  Default: the scad file's defaults.")
+    parser.add_argument("--set", nargs="*", help="Only compare these sets.")
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent exports.")
+    parser.add_argument("--samples", type=int, default=200_000, help="Sample points per surface.")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Allowed distance, in mm.")
+    arguments = parser.parse_args(argv)
+
+    repository = Path(__file__).resolve().parent.parent
+    parameter_sets = {"Default": {}}
+    if arguments.parameter_file != None:
+        parameter_sets = ParameterFile.from_json(arguments.parameter_file.read_text()).parameterSets
+    if arguments.set:
+        parameter_sets = {name: parameter_sets[name] for name in arguments.set}
+
+    with TemporaryDirectory(prefix="gridfinity-rebuilt-diff-") as directory:
+        directory = Path(directory)
+        roots = []
+        for (label, tree) in (("old", arguments.old), ("new", arguments.new)):
+            if Path(tree).is_dir():
+                roots.append(Path(tree).resolve())
+            else:
+                checkout_revision(repository, tree, directory.joinpath(label, "source"))
+                roots.append(directory.joinpath(label, "source"))
+
+        errors = {}
+        for (label, root) in zip(("old", "new"), roots):
+            for (name, error) in export_meshes(root, arguments.scad_file, parameter_sets,
+                    directory.joinpath(label, "meshes"), arguments.openscad, arguments.jobs).items():
+                errors[name] = f"{label}: {error}"
+
+        exit_code = 0
+        file_names = mesh_file_names(parameter_sets)
+        for name in parameter_sets:
+            if name in errors:
+                print(f"FAILED {name}: {errors[name]}")
+                exit_code = 1
+                continue
+            difference = compare_meshes(directory.joinpath("old", "meshes", file_names[name]),
+                directory.joinpath("new", "meshes", file_names[name]), name, arguments.samples)
+            if difference.identical:
+                print(f"identical {name}")
+                continue
+            status = "DRIFTED" if difference.drifted(arguments.tolerance) else "same"
+            print(f"{status} {name}: hausdorff {difference.hausdorff_distance:.4g}mm, "
+                f"mean {difference.mean_distance:.4g}mm, volume {difference.volume_delta:+.4g}mm^3 "
+                f"({difference.relative_volume_delta:+.3%}), bounding box {difference.bounding_box_delta:.4g}mm, "
+                f"triangles {difference.old_triangle_count} -> {difference.new_triangle_count}")
+            if status == "DRIFTED":
+                exit_code = 1
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+"""
+Dimensions from "src/core/standard.scad", for tools which plan layouts without running openscad.
+"""
+from __future__ import annotations
+
+GRID_DIMENSIONS_MM = (42, 42)
+'''`GRID_DIMENSIONS_MM`.  Size of a single grid unit, in mm.  (x, y)'''
+
+GRID_SIZE_MM = GRID_DIMENSIONS_MM[0]
+'''Both axes are the same size.'''
+
+BASE_TOP_DIMENSIONS = (41.5, 41.5)
+'''`BASE_TOP_DIMENSIONS`.  Size of the top of a single base, in mm.  (x, y)'''
+
+BASE_GAP_MM = tuple(grid - top for (grid, top) in zip(GRID_DIMENSIONS_MM, BASE_TOP_DIMENSIONS))
+'''`BASE_GAP_MM`.  How much smaller a bin is than its grid footprint, in mm.  (x, y)'''
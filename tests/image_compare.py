@@ -0,0 +1,244 @@
+"""
+Compare rendered images against golden images.
+The tests render over the images committed in "images", so by default the golden images are those committed to git.
+`pytest --compare-images` checks `RENDERED_IMAGES` this way, after the tests have rendered.
+Requires numpy and Pillow.
+@example python tests/image_compare.py images/hole_cutouts --heatmaps /tmp/heatmaps
+         python tests/image_compare.py images/hole_cutouts --revision origin/main
+         python tests/image_compare.py new_renders/ old_renders/ --update
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import shutil
+import subprocess
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+_SSIM_WINDOW = 7
+_SSIM_C1 = (0.01 * 255)**2
+_SSIM_C2 = (0.03 * 255)**2
+_HASH_SIZE = 8
+_HASH_IMAGE_SIZE = 32
+
+RENDERED_IMAGES = ('images/hole_cutouts', 'images/base_hole_options')
+'''Committed folders which the tests render into.  Relative to the repository root.'''
+
+@dataclass(frozen=True)
+class Tolerance:
+    '''Every limit must be met for an image to pass.'''
+    pixel_threshold: int = 8
+    '''Per channel difference (0-255) at or below which a pixel is unchanged.  Absorbs anti-aliasing noise.'''
+    max_changed_fraction: float = 0.001
+    '''Fraction of pixels allowed to change'''
+    min_ssim: float = 0.99
+    max_hash_distance: int = 4
+    '''Bits of the 64 bit perceptual hash allowed to differ'''
+
+@dataclass(frozen=True)
+class ImageComparison:
+    image_path: Path
+    golden_path: Path
+    passed: bool
+    reason: str = ""
+    '''Why the comparison failed.  Empty if it passed.'''
+    changed_fraction: Optional[float] = None
+    max_difference: Optional[int] = None
+    ssim: Optional[float] = None
+    hash_distance: Optional[int] = None
+    heatmap_path: Optional[Path] = None
+    '''Only written for failures'''
+
+def load_image(file_path: Path) -> np.ndarray:
+    '''(height, width, 3) uint8 RGB.  Any alpha channel is dropped.'''
+    with Image.open(file_path) as image:
+        return np.asarray(image.convert('RGB'))
+
+def pixel_difference(image: np.ndarray, golden: np.ndarray) -> np.ndarray:
+    '''(height, width) largest difference of any channel.'''
+    # Stays in uint8, without wrapping.
+    return (np.maximum(image, golden) - np.minimum(image, golden)).max(axis=2)
+
+def _grayscale(image: np.ndarray) -> np.ndarray:
+    return image.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def _box_mean(values: np.ndarray, size: int) -> np.ndarray:
+    '''Mean of every `size` x `size` window which fits entirely inside `values`.'''
+    # float64 sums, so large images do not lose precision.
+    sums = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    window_sums = sums[size:, size:] - sums[:-size, size:] - sums[size:, :-size] + sums[:-size, :-size]
+    return window_sums / (size * size)
+
+def ssim(image: np.ndarray, golden: np.ndarray) -> float:
+    '''Mean structural similarity of the grayscale images, using a uniform 7x7 window.  1.0 is identical.'''
+    (a, b) = (_grayscale(image), _grayscale(golden))
+    if min(a.shape) < _SSIM_WINDOW:
+        return 1.0 if np.array_equal(a, b) else 0.0
+    mean_a = _box_mean(a, _SSIM_WINDOW)
+    mean_b = _box_mean(b, _SSIM_WINDOW)
+    variance_a = _box_mean(a * a, _SSIM_WINDOW) - mean_a**2
+    variance_b = _box_mean(b * b, _SSIM_WINDOW) - mean_b**2
+    covariance = _box_mean(a * b, _SSIM_WINDOW) - mean_a * mean_b
+    ssim_map = ((2 * mean_a * mean_b + _SSIM_C1) * (2 * covariance + _SSIM_C2)) / \
+        ((mean_a**2 + mean_b**2 + _SSIM_C1) * (variance_a + variance_b + _SSIM_C2))
+    return float(ssim_map.mean())
+
+def _dct_matrix(size: int) -> np.ndarray:
+    (k, n) = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+def perceptual_hash(image: np.ndarray) -> np.ndarray:
+    '''64 bit DCT hash, as a bool array.  Similar images have similar hashes.'''
+    small = Image.fromarray(_grayscale(image).astype(np.uint8)).resize(
+        (_HASH_IMAGE_SIZE, _HASH_IMAGE_SIZE), Image.Resampling.BOX)
+    dct = _dct_matrix(_HASH_IMAGE_SIZE)
+    frequencies = (dct @ np.asarray(small, dtype=np.float64) @ dct.T)[:_HASH_SIZE, :_HASH_SIZE]
+    return (frequencies > np.median(frequencies)).flatten()
+
+def difference_heatmap(difference: np.ndarray, golden: np.ndarray) -> np.ndarray:
+    '''Changed pixels colored black -> red -> yellow -> white by size, over a dimmed golden image.'''
+    background = np.repeat((_grayscale(golden) * 0.4)[:, :, np.newaxis], 3, axis=2)
+    scale = difference.astype(np.float64) / max(int(difference.max()), 1)
+    heat = np.clip(np.stack([3 * scale, 3 * scale - 1, 3 * scale - 2], axis=2), 0, 1) * 255
+    return np.where(difference[:, :, np.newaxis] > 0, heat, background).astype(np.uint8)
+
+def compare_image(image_path: Path, golden_path: Path, tolerance: Tolerance = Tolerance(),
+        heatmap_path: Optional[Path] = None) -> ImageComparison:
+    '''@param heatmap_path If set, a heatmap is written here when the comparison fails.'''
+    if not image_path.exists():
+        return ImageComparison(image_path, golden_path, False, "image was not rendered")
+    if not golden_path.exists():
+        return ImageComparison(image_path, golden_path, False, "no golden image")
+    image = load_image(image_path)
+    golden = load_image(golden_path)
+    if image.shape != golden.shape:
+        return ImageComparison(image_path, golden_path, False,
+            f"size {image.shape[1]}x{image.shape[0]} != {golden.shape[1]}x{golden.shape[0]}")
+    if np.array_equal(image, golden):
+        # The usual case, and much cheaper than the full comparison.
+        return ImageComparison(image_path, golden_path, True, changed_fraction=0.0, max_difference=0,
+            ssim=1.0, hash_distance=0)
+
+    difference = pixel_difference(image, golden)
+    changed_fraction = float(np.count_nonzero(difference > tolerance.pixel_threshold)) / difference.size
+    similarity = ssim(image, golden)
+    hash_distance = int(np.count_nonzero(perceptual_hash(image) != perceptual_hash(golden)))
+
+    failures = []
+    if changed_fraction > tolerance.max_changed_fraction:
+        failures.append(f"{changed_fraction:.2%} of pixels changed")
+    if similarity < tolerance.min_ssim:
+        failures.append(f"ssim {similarity:.4f}")
+    if hash_distance > tolerance.max_hash_distance:
+        failures.append(f"hash distance {hash_distance}")
+
+    if failures and heatmap_path != None:
+        heatmap_path.parent.mkdir(parents=True, exist_ok=True)
+        Image.fromarray(difference_heatmap(difference, golden)).save(heatmap_path)
+    else:
+        heatmap_path = None
+    return ImageComparison(image_path, golden_path, not failures, ", ".join(failures),
+        changed_fraction=changed_fraction, max_difference=int(difference.max()),
+        ssim=similarity, hash_distance=hash_distance, heatmap_path=heatmap_path)
+
+def compare_folders(image_folder: Path, golden_folder: Path, tolerance: Tolerance = Tolerance(),
+        heatmap_folder: Optional[Path] = None, max_workers: Optional[int] = None) -> list[ImageComparison]:
+    """
+    Compare every png in either folder, matched by path relative to the folder.
+    Images without a golden image fail, as do golden images which were not rendered.
+    @returns Sorted by path.
+    """
+    names = sorted({path.relative_to(folder)
+        for folder in (image_folder, golden_folder) for path in folder.rglob('*.png')})
+    # numpy and Pillow release the GIL for the heavy work, so threads run in parallel.
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-compare") as executor:
+        return list(executor.map(lambda name: compare_image(image_folder.joinpath(name), golden_folder.joinpath(name),
+            tolerance, heatmap_folder.joinpath(name) if heatmap_folder != None else None), names))
+
+def extract_committed(root: Path, folders: Sequence[str], revision: str, destination: Path) -> None:
+    '''`folders` (relative to `root`) as committed in git `revision`, into `destination`.'''
+    archive = subprocess.run(["git", "-C", str(root), "archive", "--format=tar", revision, "--", *folders],
+        capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(destination, filter='data')
+        else:
+            # The archive comes from the repository itself, so is trusted.
+            tar.extractall(destination)
+
+def compare_committed(root: Path, folders: Sequence[str] = RENDERED_IMAGES, revision: str = "HEAD",
+        tolerance: Tolerance = Tolerance(), heatmap_folder: Optional[Path] = None,
+        max_workers: Optional[int] = None) -> list[ImageComparison]:
+    """
+    `compare_folders` for each of `folders`, against the same folder as committed in `revision`.
+    Golden paths point into a temporary folder, which is removed before returning.  Report `image_path` instead.
+    @param heatmap_folder Heatmaps are written to the same relative path, e.g. "heatmaps/images/hole_cutouts/x.png".
+    """
+    comparisons = []
+    with TemporaryDirectory(prefix="gridfinity-rebuilt-golden-") as golden_root:
+        extract_committed(root, folders, revision, Path(golden_root))
+        for folder in folders:
+            comparisons += compare_folders(root.joinpath(folder), Path(golden_root, folder), tolerance,
+                heatmap_folder.joinpath(folder) if heatmap_folder != None else None, max_workers)
+    return comparisons
+
+def update_golden(comparisons: list[ImageComparison]) -> None:
+    """
+    Replace the golden image of every failed comparison with the new image.
+    Golden images which were not rendered are kept.  Delete them by hand.
+    """
+    for comparison in comparisons:
+        if comparison.passed or not comparison.image_path.exists():
+            continue
+        comparison.golden_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(comparison.image_path, comparison.golden_path)
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", type=Path, help="Folder of newly rendered images.  e.g. `image_folder_base`")
+    parser.add_argument("golden", type=Path, nargs="?", default=None,
+        help="Folder of golden images.  Default: `images`, as committed in --revision.")
+    parser.add_argument("--revision", default="HEAD", help="Git revision of the golden images, without a `golden` folder.")
+    parser.add_argument("--heatmaps", type=Path, help="Write a difference heatmap here for each failure.")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent comparisons.")
+    parser.add_argument("--pixel-threshold", type=int, default=Tolerance.pixel_threshold)
+    parser.add_argument("--max-changed-fraction", type=float, default=Tolerance.max_changed_fraction)
+    parser.add_argument("--min-ssim", type=float, default=Tolerance.min_ssim)
+    parser.add_argument("--max-hash-distance", type=int, default=Tolerance.max_hash_distance)
+    parser.add_argument("--update", action="store_true",
+        help="Accept the new images as golden.  Only with a `golden` folder.  Otherwise commit the new images instead.")
+    arguments = parser.parse_args(argv)
+
+    tolerance = Tolerance(arguments.pixel_threshold, arguments.max_changed_fraction,
+        arguments.min_ssim, arguments.max_hash_distance)
+    if arguments.golden != None:
+        comparisons = compare_folders(arguments.images, arguments.golden, tolerance, arguments.heatmaps, arguments.jobs)
+    else:
+        if arguments.update:
+            parser.error("--update needs a `golden` folder.  Commit the new images instead.")
+        root = Path(__file__).resolve().parent.parent
+        folder = arguments.images.resolve().relative_to(root).as_posix()
+        comparisons = compare_committed(root, [folder], arguments.revision, tolerance,
+            arguments.heatmaps, arguments.jobs)
+    failed = [comparison for comparison in comparisons if not comparison.passed]
+    for comparison in failed:
+        heatmap = f" (heatmap: {comparison.heatmap_path})" if comparison.heatmap_path != None else ""
+        print(f"FAILED {comparison.image_path}: {comparison.reason}{heatmap}")
+    print(f"{len(comparisons) - len(failed)}/{len(comparisons)} images match.")
+
+    if arguments.update:
+        update_golden(failed)
+        return 0
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
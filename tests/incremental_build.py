@@ -0,0 +1,267 @@
+"""
+Rebuild only the published renders (e.g. everything under "images/") affected by a change.
+Renders are recorded in an index as they happen (`OpenScadRunner.artifact_index`, or `pytest --artifact-index`),
+along with the entry point, parameters, and every file it includes or uses.
+@example python tests/incremental_build.py --since origin/main --dry-run
+         python tests/incremental_build.py src/core/tab.scad --openscad /usr/bin/openscad
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional, Sequence
+
+from render_cache import RenderCache, file_hash, scad_dependencies
+
+if TYPE_CHECKING:
+    # Circular import.
+    from openscad_runner import OpenScadRunner, RenderJob, RenderResult
+
+class ArtifactRecord(NamedTuple):
+    '''How one artifact was rendered.  Paths are relative to `ArtifactIndex.root`.'''
+    output: str
+    scad_file: str
+    parameters: Optional[dict]
+    camera: Optional[list]
+    '''`CameraArguments` as (translate, rotate, distance)'''
+    args: list[str]
+    backend: Optional[str]
+    image_mode: Optional[str]
+    wall_time_s: Optional[float]
+    '''Duration of the last render which was not a cache hit'''
+
+    def job(self, root: Path) -> RenderJob:
+        '''Relative to `root`.  Render with `OpenScadRunner.image_folder_base` set to `root`.'''
+        # Imports this module.
+        from openscad_runner import CameraArguments, RenderJob, Vec3
+
+        camera = None
+        if self.camera != None:
+            (translate, rotate, distance) = self.camera
+            camera = CameraArguments(Vec3(*translate), Vec3(*rotate), distance)
+        return RenderJob(scad_file_path=root.joinpath(self.scad_file), output_file_name=Path(self.output),
+            parameters=self.parameters, camera_arguments=camera, args=tuple(self.args))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    output TEXT PRIMARY KEY,
+    scad_file TEXT NOT NULL,
+    parameters TEXT,
+    camera TEXT,
+    args TEXT NOT NULL,
+    backend TEXT,
+    image_mode TEXT,
+    wall_time_s REAL
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    output TEXT NOT NULL REFERENCES artifacts(output) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (output, path)
+);
+CREATE INDEX IF NOT EXISTS dependencies_by_path ON dependencies(path);
+"""
+
+class ArtifactIndex:
+    """
+    Every recorded render with an entry point and output inside `root`, keyed by output.
+    Renders of temporary files (e.g. `OpenScadRunner.create_views` intermediates) are not recorded.
+    Safe to share between threads, and between processes (e.g. pytest-xdist workers).
+    """
+    root: Path
+    path: Path
+
+    def __init__(self, root: Path, path: Optional[Path] = None):
+        self.root = Path(root).resolve()
+        self.path = Path(path) if path != None else self.default_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_path() -> Path:
+        '''Next to the default `RenderCache`.'''
+        return RenderCache.default_directory().parent.joinpath("artifacts.sqlite")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> ArtifactIndex:
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.close()
+
+    def record(self, runner: OpenScadRunner, job: RenderJob, wall_time_s: Optional[float] = None) -> bool:
+        """
+        Record (or update) a successful render, and the current hash of every file it depends on.
+        @param wall_time_s None to keep the previous duration, e.g. for a cache hit.
+        @returns False if the entry point or output is outside `root`, so nothing was recorded.
+        """
+        try:
+            output = runner.image_folder_base.joinpath(job.output_file_name).resolve().relative_to(self.root).as_posix()
+            scad_file = job.scad_file_path.resolve().relative_to(self.root).as_posix()
+        except ValueError:
+            return False
+        # Library files outside the repository are never considered changed.
+        dependencies = [(output, path.relative_to(self.root).as_posix(), file_hash(path))
+            for path in scad_dependencies(job.scad_file_path) if path.is_relative_to(self.root)]
+        camera = job.camera_arguments
+        row = (output, scad_file, json.dumps(job.parameters, sort_keys=True),
+            json.dumps(list(asdict(camera).values())) if camera != None else None,
+            json.dumps(list(job.args)), runner.backend, runner.image_mode, wall_time_s)
+        with self._lock, self.connection:
+            self.connection.execute("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(output) DO UPDATE SET scad_file = excluded.scad_file, parameters = excluded.parameters, "
+                "camera = excluded.camera, args = excluded.args, backend = excluded.backend, "
+                "image_mode = excluded.image_mode, wall_time_s = COALESCE(excluded.wall_time_s, wall_time_s)", row)
+            # The include set may have changed since the last render.
+            self.connection.execute("DELETE FROM dependencies WHERE output = ?", (output,))
+            self.connection.executemany("INSERT INTO dependencies VALUES (?, ?, ?)", dependencies)
+        return True
+
+    def records(self, outputs: Optional[Iterable[str]] = None) -> list[ArtifactRecord]:
+        '''Every record, or only those for `outputs`.  Sorted by output.'''
+        with self._lock:
+            rows = self.connection.execute("SELECT * FROM artifacts ORDER BY output").fetchall()
+        if outputs != None:
+            outputs = set(outputs)
+            rows = [row for row in rows if row[0] in outputs]
+        return [ArtifactRecord(output, scad_file, json.loads(parameters), json.loads(camera) if camera != None else None,
+                json.loads(args), backend, image_mode, wall_time_s)
+            for (output, scad_file, parameters, camera, args, backend, image_mode, wall_time_s) in rows]
+
+    def stale(self, changed_files: Optional[Iterable[str]] = None) -> list[ArtifactRecord]:
+        """
+        Artifacts depending on any of `changed_files`, plus any whose output is missing.
+        @param changed_files Relative to `root`.  If None, every dependency is hashed to find what changed instead.
+        """
+        with self._lock:
+            if changed_files != None:
+                changed_files = sorted({Path(path).as_posix() for path in changed_files})
+                stale = set()
+                for start in range(0, len(changed_files), 500):
+                    batch = changed_files[start:start + 500]
+                    stale |= {output for (output,) in self.connection.execute(
+                        "SELECT DISTINCT output FROM dependencies WHERE path IN (" + ", ".join("?" * len(batch)) + ")", batch)}
+            else:
+                stale = {output for (output, path, sha256) in self.connection.execute("SELECT * FROM dependencies")
+                    if not self.root.joinpath(path).is_file() or file_hash(self.root.joinpath(path)) != sha256}
+            outputs = [output for (output,) in self.connection.execute("SELECT output FROM artifacts")]
+        stale |= {output for output in outputs if not self.root.joinpath(output).exists()}
+        return self.records(stale)
+
+    def remove(self, outputs: Iterable[str]) -> None:
+        with self._lock, self.connection:
+            self.connection.executemany("DELETE FROM artifacts WHERE output = ?", [(output,) for output in outputs])
+
+def estimate_wall_time(durations: Sequence[float], workers: int) -> float:
+    '''How long `durations` take on `workers` parallel workers, starting the longest first.'''
+    finish_times = [0.0] * max(1, workers)
+    for duration in sorted(durations, reverse=True):
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+    return max(finish_times)
+
+def changed_since(root: Path, revision: str) -> list[str]:
+    """
+    Files changed between `revision` and the working tree, relative to `root`.
+    Includes deleted files, and untracked files which are not ignored.
+    """
+    changed = []
+    for command in (["git", "diff", "--name-only", revision, "--"], ["git", "ls-files", "--others", "--exclude-standard"]):
+        output = subprocess.run(command, cwd=root, capture_output=True, text=True, check=True)
+        changed += [line for line in output.stdout.splitlines() if line]
+    return changed
+
+def rebuild(index: ArtifactIndex, records: Sequence[ArtifactRecord], openscad_binary_path: str,
+        max_workers: Optional[int] = None) -> list[RenderResult]:
+    """
+    Render `records` again, in parallel, with the backend and image mode they were recorded with.
+    Successful renders update the index, including any change to the files they include.
+    """
+    # Imports this module.
+    from openscad_runner import OpenScadRunner
+
+    groups = {}
+    for record in records:
+        groups.setdefault((record.backend, record.image_mode), []).append(record)
+        index.root.joinpath(record.output).parent.mkdir(parents=True, exist_ok=True)
+    results = []
+    for ((backend, image_mode), group) in groups.items():
+        with OpenScadRunner(index.root.joinpath(group[0].scad_file)) as runner:
+            runner.openscad_binary_path = openscad_binary_path
+            runner.image_folder_base = index.root
+            runner.backend = backend
+            runner.image_mode = image_mode
+            runner.artifact_index = index
+            results += runner.run_batch([record.job(index.root) for record in group], max_workers)
+    return results
+
+def main(argv: Optional[list[str]] = None) -> int:
+    # Imports this module.
+    from openscad_runner import OpenScadRunner
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("changed", nargs="*", type=Path,
+        help="Changed files.  If none (and no --since), every recorded dependency is hashed instead.")
+    parser.add_argument("--since", metavar="REVISION",
+        help="Also count files changed since a git revision, and untracked files which are not ignored.")
+    parser.add_argument("--index", type=Path, default=None,
+        help=f"Artifact index.  Default: {ArtifactIndex.default_path()}")
+    parser.add_argument("--stats-log", type=Path,
+        help="Render history, to estimate artifacts without a recorded duration.  @see OpenScadRunner.stats_log_path")
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--jobs", type=int, default=None, help="Maximum concurrent renders.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be rebuilt, and how long it should take.")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    changed = None
+    if arguments.changed or arguments.since != None:
+        changed = []
+        for path in arguments.changed:
+            try:
+                changed.append(path.resolve().relative_to(root).as_posix())
+            except ValueError:
+                print(f"{path} is outside {root}, so is not tracked.", file=sys.stderr)
+        if arguments.since != None:
+            changed += changed_since(root, arguments.since)
+
+    with ArtifactIndex(root, arguments.index) as index:
+        records = index.stale(changed)
+        total = len(index.records())
+        if arguments.dry_run:
+            from memory_scheduler import ResourceModel
+
+            model = ResourceModel.from_stats_log(arguments.stats_log) if arguments.stats_log != None else ResourceModel()
+            durations = []
+            for record in records:
+                duration = record.wall_time_s
+                if duration == None:
+                    duration = model.predict(record.job(root)).wall_time_s
+                durations.append(duration)
+                print(f"{duration:8.1f}s {record.output}")
+            workers = arguments.jobs or os.cpu_count() or 1
+            print(f"{len(records)} of {total} artifacts to rebuild.  "
+                f"About {estimate_wall_time(durations, workers):.0f}s with {workers} workers, "
+                f"{sum(durations):.0f}s of rendering.")
+            return 0
+        results = rebuild(index, records, arguments.openscad, arguments.jobs)
+    for result in results:
+        if not result.ok:
+            print(f"FAILED {result.job.output_file_name}: {result.error}", file=sys.stderr)
+    print(f"Rebuilt {sum(result.ok for result in results)} of {total} artifacts.")
+    return 1 if any(not result.ok for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Run batches of renders without running out of memory.
+Each job's peak memory and duration are predicted from earlier renders (`OpenScadRunner.stats_log_path`).
+Jobs are started longest first, as long as the predicted memory of everything running fits in a budget.
+Jobs killed for using too much memory are retried, on their own, with fewer jobs running at once.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from openscad_runner import OpenScadRunner, RenderJob, RenderResult, load_stats_log
+from parameter_sweep import BASEPLATE_HOLE_PARAMETERS, BIN_HOLE_PARAMETERS
+from scaling_fit import fit_power_law
+
+HOLE_PARAMETERS = tuple(sorted(set(BIN_HOLE_PARAMETERS.values()) | set(BASEPLATE_HOLE_PARAMETERS.values()) |
+    {"enable_thumbscrew", "style_hole", "style_plate", "only_corners", "half_grid"}))
+'''Parameters which change the amount of geometry per base.  Jobs are only compared with jobs using the same values.'''
+
+class Prediction(NamedTuple):
+    peak_rss_bytes: float
+    wall_time_s: float
+
+class _Observation(NamedTuple):
+    bases: float
+    peak_rss_bytes: float
+    wall_time_s: float
+
+def job_features(scad_file_path, parameters: Optional[dict]) -> tuple[tuple, float]:
+    """
+    What a prediction is based on.
+    @returns (key, number of bases).  Jobs with the same key are assumed to scale with the number of bases.
+    """
+    parameters = parameters if parameters != None else {}
+    holes = tuple((name, parameters[name]) for name in HOLE_PARAMETERS if name in parameters)
+    bases = float(parameters.get("gridx", 1) or 1) * float(parameters.get("gridy", 1) or 1)
+    return ((Path(scad_file_path).name, holes), bases)
+
+class ResourceModel:
+    """
+    Predicts peak memory and duration of a render, with `value = c * bases^exponent`.
+    Fitted separately for each entry point and set of hole options.
+    Falls back to every render of the same entry point, and then to `default`.
+    """
+    default: Prediction
+    memory_margin: float
+    '''Predicted memory is multiplied by this, to allow for error'''
+
+    def __init__(self, default: Prediction = Prediction(1024**3, 60), memory_margin: float = 1.25):
+        self.default = default
+        self.memory_margin = memory_margin
+        self._observations = {}
+        self._fits = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_stats_log(cls, log_path: Path, **arguments) -> ResourceModel:
+        model = cls(**arguments)
+        if Path(log_path).exists():
+            model.add_records(load_stats_log(log_path))
+        return model
+
+    def add_records(self, records: Iterable[dict]) -> None:
+        '''@param records From `load_stats_log`.  Failed renders and cache hits are skipped.'''
+        for record in records:
+            if record["succeeded"] and not record["cache_hit"] and record.get("peak_rss_bytes"):
+                job = record["job"]
+                self.observe(job["scad_file_path"], job["parameters"], record["peak_rss_bytes"], record["wall_time_s"])
+
+    def observe(self, scad_file_path, parameters: Optional[dict], peak_rss_bytes: float, wall_time_s: float) -> None:
+        (key, bases) = job_features(scad_file_path, parameters)
+        with self._lock:
+            for group in (key, key[0]):
+                self._observations.setdefault(group, []).append(_Observation(bases, peak_rss_bytes, wall_time_s))
+                self._fits.pop(group, None)
+
+    def predict(self, job: RenderJob) -> Prediction:
+        (key, bases) = job_features(job.scad_file_path, job.parameters)
+        with self._lock:
+            for group in (key, key[0]):
+                if group in self._observations:
+                    if group not in self._fits:
+                        self._fits[group] = self._fit(self._observations[group])
+                    (memory, time) = self._fits[group]
+                    return Prediction(memory(bases) * self.memory_margin, time(bases))
+        return self.default
+
+    @staticmethod
+    def _fit(observations: list[_Observation]):
+        '''@returns (memory function, time function) of the number of bases.'''
+        functions = []
+        for metric in ("peak_rss_bytes", "wall_time_s"):
+            sizes = [observation.bases for observation in observations]
+            values = [getattr(observation, metric) for observation in observations]
+            fit = fit_power_law(sizes, values)
+            if fit == None:
+                # Only one size.  Assume linear, and be pessimistic.
+                (size, value) = max(zip(sizes, values), key=lambda item: item[1] / item[0])
+                fit = (value / size, 1.0)
+            # Never predict less than the smallest process seen.
+            minimum = min(values)
+            functions.append(lambda bases, fit=fit, minimum=minimum: max(minimum, fit[0] * bases ** fit[1]))
+        return tuple(functions)
+
+def available_memory_bytes() -> Optional[int]:
+    '''Memory available to new processes.  None if unknown.'''
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def is_out_of_memory(error: Exception) -> bool:
+    '''If openscad was killed by the OOM killer, or failed to allocate memory.'''
+    if not isinstance(error, subprocess.CalledProcessError):
+        return isinstance(error, MemoryError)
+    # 137 is a shell reporting SIGKILL.
+    if error.returncode in (-signal.SIGKILL, 137):
+        return True
+    stderr = error.stderr.decode(errors="replace") if isinstance(error.stderr, bytes) else str(error.stderr or "")
+    return "std::bad_alloc" in stderr or "out of memory" in stderr.lower()
+
+class MemoryScheduler:
+    """
+    Replacement for `OpenScadRunner.run_batch`, which keeps predicted memory use under `memory_budget_bytes`.
+    Every finished render is added to `model`, so predictions improve during a batch.
+    """
+    model: ResourceModel
+    memory_budget_bytes: float
+    max_retries: int
+    '''Times a job killed for using too much memory is retried'''
+
+    def __init__(self, model: ResourceModel, memory_budget_bytes: Optional[float] = None, max_retries: int = 2):
+        if memory_budget_bytes == None:
+            available = available_memory_bytes()
+            memory_budget_bytes = available * 0.8 if available != None else float("inf")
+        self.model = model
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_retries = max_retries
+
+    def run(self, runner: OpenScadRunner, jobs: Iterable[RenderJob], max_workers: Optional[int] = None) -> Iterator[RenderResult]:
+        """
+        Same results as `runner.run_batch`, but in a different order.
+        A job predicted to need more than the whole budget still runs, but on its own.
+        After a job runs out of memory, at most half as many jobs run at once for the rest of the batch.
+        No new jobs start until the retry does, so smaller jobs cannot keep it waiting.
+        """
+        concurrency = max_workers if max_workers != None else (os.cpu_count() or 1)
+        jobs = list(jobs)
+        runner.add_parameter_files(jobs)
+        predictions = {id(job): self.model.predict(job) for job in jobs}
+        # Longest first, so a long job does not start last and hold up the end of the batch.
+        pending = sorted(jobs, key=lambda job: predictions[id(job)].wall_time_s, reverse=True)
+        attempts = {id(job): 0 for job in jobs}
+        retries = []
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="openscad") as executor:
+            while pending or retries or running:
+                used_memory = sum(predictions[id(job)].peak_rss_bytes for job in running.values())
+                queue = retries if retries else pending
+                for job in list(queue):
+                    if len(running) >= concurrency:
+                        break
+                    memory = predictions[id(job)].peak_rss_bytes
+                    if running and used_memory + memory > self.memory_budget_bytes:
+                        if queue is retries:
+                            break
+                        continue
+                    queue.remove(job)
+                    used_memory += memory
+                    running[executor.submit(self._render, runner, job)] = job
+
+                (done, _) = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    result = future.result()
+                    if not result.ok and is_out_of_memory(result.error) and attempts[id(job)] < self.max_retries:
+                        attempts[id(job)] += 1
+                        concurrency = max(1, concurrency // 2)
+                        # Run it on its own.
+                        predictions[id(job)] = predictions[id(job)]._replace(peak_rss_bytes=self.memory_budget_bytes)
+                        retries.append(job)
+                        continue
+                    yield result
+
+    def _render(self, runner: OpenScadRunner, job: RenderJob) -> RenderResult:
+        '''Parameter files were already added by `run`.'''
+        try:
+            (process, stats) = runner._render_with_stats(job)
+        except Exception as e:
+            return RenderResult(job, error=e)
+        if not stats.cache_hit and stats.peak_rss_bytes:
+            self.model.observe(job.scad_file_path, job.parameters, stats.peak_rss_bytes, stats.wall_time_s)
+        return RenderResult(job, process=process, stats=stats)
@@ -0,0 +1,194 @@
+"""
+Load meshes exported by openscad into NumPy arrays, and measure them.
+Supports STL (binary and ascii), OFF, and 3MF.  Meshes can be written back as binary STL.
+"""
+from __future__ import annotations
+
+import re
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+from xml.etree import ElementTree
+
+import numpy as np
+
+_BINARY_STL_HEADER_SIZE = 80
+_BINARY_STL_TRIANGLE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2'),
+])
+_ASCII_STL_VERTEX_PATTERN = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+@dataclass(frozen=True, eq=False)
+class Mesh:
+    """
+    Indexed triangle mesh.
+    Duplicate vertices are merged, so connectivity (and manifoldness) can be checked.
+    """
+    vertices: np.ndarray
+    '''(N, 3) float64'''
+    faces: np.ndarray
+    '''(M, 3) int64 indices into `vertices`'''
+
+    @classmethod
+    def from_triangles(cls, triangles: np.ndarray) -> Mesh:
+        '''Create from a (M, 3, 3) array of triangle corners.'''
+        corners = np.asarray(triangles, dtype=np.float64).reshape(-1, 3)
+        vertices, inverse = np.unique(corners, axis=0, return_inverse=True)
+        return Mesh(vertices=vertices, faces=inverse.reshape(-1, 3).astype(np.int64))
+
+    @property
+    def triangle_count(self) -> int:
+        return len(self.faces)
+
+    @property
+    def triangles(self) -> np.ndarray:
+        '''(M, 3, 3) corners of each triangle.'''
+        return self.vertices[self.faces]
+
+    def bounding_box(self) -> tuple[np.ndarray, np.ndarray]:
+        '''(minimum, maximum) corners.'''
+        return (self.vertices.min(axis=0), self.vertices.max(axis=0))
+
+    def size(self) -> np.ndarray:
+        '''[x, y, z] size of the bounding box.'''
+        (minimum, maximum) = self.bounding_box()
+        return maximum - minimum
+
+    def volume(self) -> float:
+        '''Enclosed volume.  Only meaningful for closed meshes.'''
+        triangles = self.triangles
+        signed = np.einsum('ij,ij->i', triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2]))
+        return abs(signed.sum()) / 6
+
+    def surface_area(self) -> float:
+        triangles = self.triangles
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        return np.linalg.norm(normals, axis=1).sum() / 2
+
+    def non_manifold_edge_count(self) -> int:
+        '''Number of edges not shared by exactly two faces.  Zero for a watertight mesh.'''
+        edges = np.concatenate([self.faces[:, [0, 1]], self.faces[:, [1, 2]], self.faces[:, [2, 0]]])
+        edges.sort(axis=1)
+        (_, counts) = np.unique(edges, axis=0, return_counts=True)
+        return int(np.count_nonzero(counts != 2))
+
+def load_mesh(file_path: Path) -> Mesh:
+    '''Load a mesh, using the file extension to determine the format.'''
+    file_path = Path(file_path)
+    loaders = {
+        '.stl': _load_stl,
+        '.off': _load_off,
+        '.3mf': _load_3mf,
+    }
+    suffix = file_path.suffix.lower()
+    if suffix not in loaders:
+        raise ValueError(f'Unsupported mesh format "{suffix}"')
+    return loaders[suffix](file_path)
+
+def load_triangles(file_path: Path) -> np.ndarray:
+    """
+    (M, 3, 3) corners of each triangle, without merging vertices.
+    Binary STL files are memory mapped, so only the parts actually used are read.
+    Use this instead of `load_mesh` for meshes too large to fit in memory.
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() == '.stl':
+        triangle_count = _binary_stl_triangle_count(file_path)
+        if triangle_count != None:
+            return _map_binary_stl(file_path, triangle_count)
+    return load_mesh(file_path).triangles
+
+def write_binary_stl(output_path: Path, chunks: Iterable[np.ndarray], header: bytes = b'') -> int:
+    """
+    Stream triangles into a binary STL file, one chunk at a time.  Normals are calculated from the winding order.
+    @param chunks (N, 3, 3) corners of each triangle.
+    @param header Up to 80 bytes.  Must not start with "solid", or the file looks like an ascii STL.
+    @returns Number of triangles written.
+    """
+    triangle_count = 0
+    with open(output_path, 'wb') as file:
+        file.write(header[:_BINARY_STL_HEADER_SIZE].ljust(_BINARY_STL_HEADER_SIZE, b' '))
+        # Updated at the end.
+        file.write(np.uint32(0).tobytes())
+        for chunk in chunks:
+            records = np.zeros(len(chunk), dtype=_BINARY_STL_TRIANGLE)
+            records['vertices'] = chunk
+            normals = np.cross(chunk[:, 1] - chunk[:, 0], chunk[:, 2] - chunk[:, 0])
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            records['normal'] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+            file.write(records.tobytes())
+            triangle_count += len(chunk)
+        file.seek(_BINARY_STL_HEADER_SIZE)
+        file.write(np.uint32(triangle_count).tobytes())
+    return triangle_count
+
+def _binary_stl_triangle_count(file_path: Path) -> Optional[int]:
+    '''None if not a binary STL file.'''
+    with open(file_path, 'rb') as file:
+        header = file.read(_BINARY_STL_HEADER_SIZE + 4)
+    if len(header) < _BINARY_STL_HEADER_SIZE + 4:
+        return None
+    triangle_count = int(np.frombuffer(header[_BINARY_STL_HEADER_SIZE:], dtype='<u4')[0])
+    expected_size = _BINARY_STL_HEADER_SIZE + 4 + triangle_count * _BINARY_STL_TRIANGLE.itemsize
+    # Ascii files start with "solid", but so do some binary files.  Size is the reliable check.
+    return triangle_count if file_path.stat().st_size == expected_size else None
+
+def _map_binary_stl(file_path: Path, triangle_count: int) -> np.ndarray:
+    if triangle_count == 0:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    records = np.memmap(file_path, dtype=_BINARY_STL_TRIANGLE, mode='r',
+        offset=_BINARY_STL_HEADER_SIZE + 4, shape=(triangle_count,))
+    return records['vertices']
+
+def _load_stl(file_path: Path) -> Mesh:
+    triangle_count = _binary_stl_triangle_count(file_path)
+    if triangle_count == None:
+        return _load_ascii_stl(file_path)
+    # Memory mapped, so only the vertex data is ever copied into memory.
+    return Mesh.from_triangles(_map_binary_stl(file_path, triangle_count))
+
+def _load_ascii_stl(file_path: Path) -> Mesh:
+    values = _ASCII_STL_VERTEX_PATTERN.findall(file_path.read_bytes())
+    return Mesh.from_triangles(np.array(values, dtype=np.float64).reshape(-1, 3, 3))
+
+def _load_off(file_path: Path) -> Mesh:
+    # Comments start with '#'.
+    lines = [line.split() for line in re.sub(r'#.*', '', file_path.read_text()).splitlines()]
+    lines = [line for line in lines if line]
+    if lines[0][0] != 'OFF':
+        raise ValueError(f'{file_path} is not an OFF file')
+    # Counts may be on the same line as the header.
+    counts_line = 0 if len(lines[0]) > 1 else 1
+    (vertex_count, face_count) = (int(lines[counts_line][-3]), int(lines[counts_line][-2]))
+    vertex_lines = lines[counts_line + 1:counts_line + 1 + vertex_count]
+    face_lines = lines[counts_line + 1 + vertex_count:counts_line + 1 + vertex_count + face_count]
+
+    vertices = np.array([line[:3] for line in vertex_lines], dtype=np.float64).reshape(-1, 3)
+    faces = []
+    for line in face_lines:
+        # Anything after the corners is an optional color.
+        corners = [int(i) for i in line[1:1 + int(line[0])]]
+        # openscad writes convex polygons, so a fan is a valid triangulation.
+        faces.extend([corners[0], corners[i], corners[i + 1]] for i in range(1, len(corners) - 1))
+    return Mesh.from_triangles(vertices[np.array(faces, dtype=np.int64).reshape(-1, 3)])
+
+def _load_3mf(file_path: Path) -> Mesh:
+    with zipfile.ZipFile(file_path) as archive:
+        model_name = next(name for name in archive.namelist() if name.lower().endswith('.model'))
+        root = ElementTree.fromstring(archive.read(model_name))
+
+    triangles = []
+    for mesh in root.iter():
+        if not mesh.tag.endswith('}mesh'):
+            continue
+        vertices = np.array([(v.get('x'), v.get('y'), v.get('z'))
+            for v in mesh.iter() if v.tag.endswith('}vertex')], dtype=np.float64)
+        faces = np.array([(t.get('v1'), t.get('v2'), t.get('v3'))
+            for t in mesh.iter() if t.tag.endswith('}triangle')], dtype=np.int64)
+        triangles.append(vertices[faces.reshape(-1, 3)])
+    if not triangles:
+        return Mesh.from_triangles(np.empty((0, 3, 3)))
+    return Mesh.from_triangles(np.concatenate(triangles))
@@ -4,12 +4,27 @@ Helpful classes for running OpenScad from Python.
 """
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import subprocess
-from dataclasses import dataclass, is_dataclass, asdict
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, is_dataclass, asdict, replace
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import NamedTuple, Optional
+from tempfile import TemporaryDirectory, TemporaryFile
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from customizer_schema import SchemaError, load_schema
+from render_cache import RenderCache, openscad_version
+from scad_values import format_scad_value, parse_echo_assignments
+
+if TYPE_CHECKING:
+    from incremental_build import ArtifactIndex
+    from mesh import Mesh
 
 class DataClassJSONEncoder(json.JSONEncoder):
     '''Allow json serialization'''
@@ -83,6 +98,16 @@ class ParameterFile:
                     pass
         return output
 
+    def coerced(self, scad_file_path: Path) -> ParameterFile:
+        """
+        Every set checked against the scad file's Customizer parameters, and converted to the right types.
+        e.g. `style_plate` is an int, not the float `from_json` guesses.
+        @throws SchemaError
+        """
+        schema = load_schema(scad_file_path)
+        return replace(self, parameterSets={name: schema.coerce(parameters)
+            for (name, parameters) in self.parameterSets.items()})
+
 def set_variable_argument(var: str, val: str) -> [str, str]:
     """
     Allows setting a variable to a particular value.
@@ -90,6 +115,92 @@ def set_variable_argument(var: str, val: str) -> [str, str]:
     """
     return ['-D', f'{var}={str(val)}']
 
+class RunFiles:
+    """
+    Scratch directory shared by every render from one runner.
+    Parameter sets are written to consolidated parameter files, and selected with `-P`.
+    Each file is only written once, no matter how many renders use it.
+    Uses tmpfs when available.
+    Removed by `close`, or when garbage collected.
+    """
+    directory: Path
+
+    MAX_DEFINE_PARAMETERS = 8
+    '''Parameter sets this small are passed with `-D` instead of a file'''
+
+    def __init__(self):
+        self._directory = TemporaryDirectory(prefix="gridfinity-rebuilt-", dir=self._tmpfs_directory())
+        self.directory = Path(self._directory.name)
+        self._lock = threading.Lock()
+        self._set_files = {}
+        '''set name -> parameter file containing it'''
+
+    @staticmethod
+    def _tmpfs_directory() -> Optional[str]:
+        shared_memory = Path('/dev/shm')
+        if shared_memory.is_dir() and os.access(shared_memory, os.W_OK | os.X_OK):
+            return str(shared_memory)
+        return None
+
+    @staticmethod
+    def set_name(parameters: dict) -> str:
+        '''Identical parameters always get the same name.'''
+        text = json.dumps(parameters, sort_keys=True, default=str)
+        return "python_generated_" + hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    def add(self, parameter_sets: Iterable[dict]) -> Optional[Path]:
+        """
+        Write a single parameter file containing every set not already written.
+        Sets small enough for `-D` are skipped.
+        Call before a batch, so the whole batch uses one file.
+        @returns The new file.  None if nothing needed writing.
+        """
+        with self._lock:
+            new_sets = {}
+            for parameters in parameter_sets:
+                name = self.set_name(parameters)
+                if name not in self._set_files and self._define_arguments(parameters) == None:
+                    new_sets[name] = parameters
+            if not new_sets:
+                return None
+            file_hash = hashlib.sha256(" ".join(sorted(new_sets)).encode()).hexdigest()[:16]
+            file_path = self.directory.joinpath(f"parameters-{file_hash}.json")
+            with open(file_path, 'wt') as file:
+                json.dump(ParameterFile(parameterSets=new_sets), file, sort_keys=True, indent=2, cls=DataClassJSONEncoder)
+            for name in new_sets:
+                self._set_files[name] = file_path
+            return file_path
+
+    def arguments(self, parameters: dict) -> list[str]:
+        """
+        Arguments which apply `parameters`.
+        Small sets of simple values use `-D`.  Anything else uses a parameter file, written if needed.
+        """
+        define_arguments = self._define_arguments(parameters)
+        if define_arguments != None:
+            return define_arguments
+        name = self.set_name(parameters)
+        self.add([parameters])
+        with self._lock:
+            return ["-p", str(self._set_files[name]), "-P", name]
+
+    def _define_arguments(self, parameters: dict) -> Optional[list[str]]:
+        '''`-D` arguments for `parameters`.  None if it is too big, or has values `-D` can not express.'''
+        if len(parameters) > self.MAX_DEFINE_PARAMETERS:
+            return None
+        try:
+            return [argument for (name, value) in parameters.items()
+                for argument in set_variable_argument(name, format_scad_value(value))]
+        except TypeError:
+            return None
+
+    def unique_path(self, suffix: str) -> Path:
+        '''A path no other render will use.'''
+        return self.directory.joinpath(uuid.uuid4().hex + suffix)
+
+    def close(self) -> None:
+        self._directory.cleanup()
+
 class CameraRotations:
     '''Pre-defined useful camera rotations'''
     Default = Vec3(0,0,0),
@@ -97,13 +208,118 @@ class CameraRotations:
     AngledBottom = Vec3(225,0,225)
     Top = Vec3(45,0,0)
 
+class Backends:
+    '''Values for `OpenScadRunner.backend`'''
+    CGAL = 'cgal'
+    Manifold = 'manifold'
+    ALL = (CGAL, Manifold)
+
+class ImageModes:
+    '''Values for `OpenScadRunner.image_mode`.  How png files are drawn.'''
+    Preview = 'preview'
+    '''OpenCSG preview.  What openscad does if no mode is given.'''
+    ThrownTogether = 'throwntogether'
+    '''Fastest.  Subtracted shapes are drawn, not cut out.  Good enough to check that the code runs.'''
+    Render = 'render'
+    '''Full geometry render.  Slowest, but shows exactly what would be exported.'''
+    ALL = (Preview, ThrownTogether, Render)
+
+_IMAGE_MODE_ARGUMENTS = {
+    ImageModes.Preview: ['--preview'],
+    ImageModes.ThrownTogether: ['--preview=throwntogether'],
+    ImageModes.Render: ['--render'],
+}
+
+@dataclass(frozen=True)
+class RenderJob:
+    """
+    Everything needed for a single, independent, openscad invocation.
+    @see `OpenScadRunner.run_batch`
+    """
+    scad_file_path: Path
+    output_file_name: Path
+    '''Relative to `OpenScadRunner.image_folder_base`'''
+    parameters: Optional[dict] = None
+    camera_arguments: Optional[CameraArguments] = None
+    args: tuple[str, ...] = ()
+
+@dataclass(frozen=True)
+class RenderStats:
+    """
+    Measurements from a single `RenderJob`.
+    Process measurements are None on a cache hit, or if the platform does not support them.
+    @see `OpenScadRunner.stats_log_path`
+    """
+    job: RenderJob
+    succeeded: bool
+    cache_hit: bool
+    wall_time_s: float
+    cpu_time_s: Optional[float] = None
+    '''User + system time of the openscad process'''
+    peak_rss_bytes: Optional[int] = None
+    '''Peak resident memory of the openscad process'''
+    summary: Optional[dict] = None
+    '''Parsed `--summary-file` output.  Only set if `OpenScadRunner.collect_summary` is enabled.'''
+
+def load_stats_log(log_path: Path) -> list[dict]:
+    '''Read a log written by `OpenScadRunner.stats_log_path`.  One dictionary per render.'''
+    with open(log_path, 'rt') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+class _ProcessUsage(NamedTuple):
+    cpu_time_s: float
+    peak_rss_bytes: int
+
+class _PreparedJob(NamedTuple):
+    job: RenderJob
+    '''With checked parameters.  @see `OpenScadRunner.checked_job`'''
+    image_path: Path
+    command_arguments: list[str]
+    '''Excluding parameters, and anything which requires a temporary file'''
+    cache_key: Optional[str]
+    cache_hit: bool
+
+    def cached_output(self, openscad_binary_path: Path) -> subprocess.CompletedProcess:
+        '''Stand in for the process which would have run.'''
+        return subprocess.CompletedProcess([openscad_binary_path]+self.command_arguments, 0, b'', b'')
+
+@dataclass(frozen=True)
+class RenderResult:
+    """
+    Outcome of a single `RenderJob`.
+    Exactly one of `process` or `error` is set.
+    """
+    job: RenderJob
+    process: Optional[subprocess.CompletedProcess] = None
+    error: Optional[Exception] = None
+    stats: Optional[RenderStats] = None
+    '''Only set on success'''
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
 class OpenScadRunner:
     '''Helper to run the openscad binary'''
     scad_file_path: Path
     openscad_binary_path: Path
     image_folder_base: Path
     parameters: Optional[dict]
-    '''If set, a temporary parameter file is created, and used with these variables'''
+    '''If set, these variables are passed to openscad.  @see `RunFiles.arguments`'''
+    backend: Optional[str]
+    '''Geometry backend.  One of `Backends`.  If None, openscad's default is used.'''
+    image_mode: Optional[str]
+    '''How png files are drawn.  One of `ImageModes`.  If None, openscad's default is used.'''
+    render_cache: Optional[RenderCache]
+    '''If set, outputs are reused from here instead of re-running openscad'''
+    stats_log_path: Optional[Path]
+    '''If set, `RenderStats` for every render are appended here as JSON lines'''
+    collect_summary: bool
+    '''Pass `--summary all` to openscad, and store the output in `RenderStats`.  Requires OpenSCAD 2024 or newer.'''
+    validate_parameters: bool
+    '''Check parameters against the scad file's Customizer annotations before running openscad.  @see `checked_job`'''
+    artifact_index: Optional[ArtifactIndex]
+    '''If set, every successful render is recorded here, so it can be rebuilt when a file it uses changes.'''
 
     WINDOWS_DEFAULT_PATH = 'C:\\Program Files\\OpenSCAD\\openscad.exe'
     TOP_ANGLE_CAMERA = CameraArguments(Vec3(0,0,0),Vec3(45,0,45),150)
@@ -114,8 +330,6 @@ class OpenScadRunner:
         '--imgsize=1280,720',
         '--view=axes',
         '--projection=ortho',
-        #"--summary", "all",
-        #"--summary-file", "-"
         ] + \
         set_variable_argument('$fa', 8) + set_variable_argument('$fs', 0.25)
 
@@ -125,6 +339,37 @@ class OpenScadRunner:
         self.image_folder_base = Path('.')
         self.camera_arguments = None
         self.parameters = None
+        self.backend = None
+        self.image_mode = None
+        self.render_cache = None
+        self.stats_log_path = None
+        self.collect_summary = False
+        self.validate_parameters = True
+        self.artifact_index = None
+        self._stats_log_lock = threading.Lock()
+        self._run_files = None
+        self._run_files_lock = threading.Lock()
+
+    def close(self) -> None:
+        '''Remove temporary files.  The runner can still be used afterwards.'''
+        with self._run_files_lock:
+            if self._run_files != None:
+                self._run_files.close()
+                self._run_files = None
+
+    def __enter__(self) -> OpenScadRunner:
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+    @property
+    def run_files(self) -> RunFiles:
+        '''Created on first use.'''
+        with self._run_files_lock:
+            if self._run_files == None:
+                self._run_files = RunFiles()
+            return self._run_files
 
     def create_image(self, args: [str], image_file_name: str) -> subprocess.CompletedProcess:
         """
@@ -132,35 +377,295 @@ class OpenScadRunner:
         @Important The only verification is that no errors occured.
                    There is no verification if the image was created, or the image contents.
         """
-        assert(self.scad_file_path.exists())
+        return self._render(self.make_job(args, image_file_name))
+
+    def create_mesh(self, args: [str], mesh_file_name: str) -> Mesh:
+        """
+        Run the code, export a mesh, and load it.
+        Format is determined by the file extension.  Any format supported by `mesh.load_mesh` works.
+        Saved in `image_folder_base`.
+        @Important Requires numpy.
+        """
+        # Only import numpy when actually needed.
+        from mesh import load_mesh
+
+        job = self.make_export_job(args, mesh_file_name)
+        self._render(job)
+        return load_mesh(self.image_folder_base.joinpath(job.output_file_name))
+
+    def create_views(self, args: [str], views: Sequence[tuple[str, CameraArguments]],
+            intermediate_suffix: str = '.csg', max_workers: Optional[int] = None) -> list[subprocess.CompletedProcess]:
+        """
+        Create several images of the same model, only evaluating the model once.
+        The model is exported to an intermediate file, then each view is rendered from that.
+        @param views (image_file_name, camera) pairs.
+        @param intermediate_suffix '.csg' keeps colors, and renders identically to `create_image`.
+                                   A mesh format (e.g. '.off') is slower to export, but faster to render.
+        @returns One result per view, in the same order as `views`.
+        """
+        with TemporaryDirectory(prefix="gridfinity-rebuilt-") as directory:
+            directory = Path(directory)
+            intermediate_path = directory.joinpath('model' + intermediate_suffix)
+            (_, export_stats) = self._render_with_stats(self.make_export_job(args, intermediate_path))
+
+            if intermediate_suffix == '.csg':
+                # Exported csg files are valid scad files.
+                model_path = intermediate_path
+            else:
+                model_path = directory.joinpath('model.scad')
+                model_path.write_text(f'import("{intermediate_path.as_posix()}");\n')
+
+            jobs = [RenderJob(scad_file_path=model_path, output_file_name=Path(image_file_name),
+                    camera_arguments=camera)
+                for (image_file_name, camera) in views]
+            results = {id(result.job): result for result in self.run_batch(jobs, max_workers)}
+
+        ordered = [results[id(job)] for job in jobs]
+        for result in ordered:
+            if not result.ok:
+                raise result.error
+        if self.artifact_index != None:
+            # Only the temporary files were recorded.  Record each view as if it was rendered directly instead.
+            for ((image_file_name, camera), result) in zip(views, ordered):
+                self.artifact_index.record(self, replace(self.make_job(args, image_file_name), camera_arguments=camera),
+                    export_stats.wall_time_s + result.stats.wall_time_s
+                    if not (export_stats.cache_hit or result.stats.cache_hit) else None)
+        return [result.process for result in ordered]
+
+    def make_export_job(self, args: [str], file_name: str) -> RenderJob:
+        '''Like `make_job`, but exports a model instead of an image.  Format is determined by the file extension.'''
+        job = replace(self.make_job(args, file_name), camera_arguments=None)
+        if job.output_file_name.suffix.lower() == '.stl':
+            # Binary is smaller, and much faster to load.
+            job = replace(job, args=('--export-format=binstl',) + job.args)
+        return job
+
+    def evaluate(self, expressions: Sequence[str], args: [str] = []) -> list[Any]:
+        """
+        Evaluate SCAD expressions, without rendering any geometry.
+        `scad_file_path` is included, so its functions, variables, and `parameters` are all available.
+        All expressions are evaluated by a single openscad process.
+        @returns Python values, in the same order as `expressions`.  @see `scad_values.parse_scad_value`
+        @example runner.evaluate(["bin_get_bounding_box(bin1)", "height(6, 0)"])
+        @warning Any error (including a failed assert) fails every expression.
+        """
+        with TemporaryDirectory(prefix="gridfinity-rebuilt-") as directory:
+            directory = Path(directory)
+            script_path = directory.joinpath("evaluate.scad")
+            script_path.write_text(
+                f"include <{self.scad_file_path.resolve().as_posix()}>\n" +
+                "".join(f"echo(_python_result_{i} = {expression});\n"
+                    for (i, expression) in enumerate(expressions)))
+            job = replace(self.make_job(args, directory.joinpath("output.echo")),
+                scad_file_path=script_path, camera_arguments=None)
+            self._render(job)
+            results = parse_echo_assignments(directory.joinpath("output.echo").read_text())
+        return [results[f"_python_result_{i}"] for i in range(len(expressions))]
+
+    def make_job(self, args: [str], image_file_name: str) -> RenderJob:
+        """
+        Snapshot the runner's current settings as a `RenderJob`.
+        Later changes to `parameters` or `camera_arguments` do not affect the returned job.
+        """
+        return RenderJob(
+            scad_file_path=self.scad_file_path,
+            output_file_name=Path(image_file_name),
+            parameters=self.parameters.copy() if self.parameters != None else None,
+            camera_arguments=self.camera_arguments,
+            args=tuple(args))
+
+    def run_batch(self, jobs: Iterable[RenderJob], max_workers: Optional[int] = None) -> Iterator[RenderResult]:
+        """
+        Run many jobs concurrently, yielding each result as soon as it finishes.
+        Results are **not** in submission order.
+        A failing job does not stop the batch.  Check `RenderResult.ok` instead.
+        @param max_workers Maximum number of openscad processes at once.  Defaults to the number of cores.
+        """
+        if max_workers == None:
+            max_workers = os.cpu_count() or 1
+        jobs = list(jobs)
+        self.add_parameter_files(jobs)
+        # Each thread only waits on its own openscad process, so threads are enough to keep every core busy.
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openscad") as executor:
+            futures = {executor.submit(self._render_with_stats, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    (process, stats) = future.result()
+                    yield RenderResult(futures[future], process=process, stats=stats)
+                except Exception as e:
+                    yield RenderResult(futures[future], error=e)
+
+    def _render(self, job: RenderJob) -> subprocess.CompletedProcess:
+        """
+        Run a single job.
+        Only uses settings shared by every job (binary, output folder, common arguments) from the runner itself.
+        """
+        return self._render_with_stats(job)[0]
+
+    def _render_with_stats(self, job: RenderJob) -> tuple[subprocess.CompletedProcess, RenderStats]:
+        '''@see `_render`'''
+        start_time = time.perf_counter()
+        try:
+            (output, usage, summary, cache_hit) = self._execute(job)
+        except Exception:
+            self._log_stats(RenderStats(job=job, succeeded=False, cache_hit=False,
+                wall_time_s=time.perf_counter() - start_time))
+            raise
+        stats = RenderStats(job=job, succeeded=True, cache_hit=cache_hit,
+            wall_time_s=time.perf_counter() - start_time,
+            cpu_time_s=usage.cpu_time_s if usage != None else None,
+            peak_rss_bytes=usage.peak_rss_bytes if usage != None else None,
+            summary=summary)
+        self._log_stats(stats)
+        return (output, stats)
+
+    def _execute(self, job: RenderJob) -> tuple[subprocess.CompletedProcess, Optional[_ProcessUsage], Optional[dict], bool]:
+        '''@returns (output, usage, summary, cache_hit)'''
+        prepared = self._prepare(job)
+        if prepared.cache_hit:
+            return (prepared.cached_output(self.openscad_binary_path), None, None, True)
+
+        (command_arguments, summary_path) = self._add_run_files(prepared.job, prepared.command_arguments)
+        try:
+            (output, usage) = self._run(command_arguments)
+            summary = self._read_summary(summary_path)
+        finally:
+            summary_path.unlink(missing_ok=True)
+
+        self._store_in_cache(prepared)
+        return (output, usage, summary, False)
+
+    def _prepare(self, job: RenderJob) -> _PreparedJob:
+        '''Check parameters, build the command line, and check the cache.'''
+        assert(job.scad_file_path.exists())
         assert(self.image_folder_base.exists())
+        # Before anything slow, so invalid jobs fail immediately.
+        job = self.checked_job(job)
 
-        image_path = self.image_folder_base.joinpath(image_file_name)
-        command_arguments = self.common_arguments + \
-            ([self.camera_arguments.as_argument()] if self.camera_arguments != None else []) + \
-            args + \
-            ["-o", str(image_path), str(self.scad_file_path)]
+        image_path = self.image_folder_base.joinpath(job.output_file_name)
+        command_arguments = self._render_arguments(job) + ["-o", str(image_path), str(job.scad_file_path)]
         #print(command_arguments)
 
-        if self.parameters != None:
-            #print(self.parameters)
-            params = ParameterFile(parameterSets={"python_generated": self.parameters})
-            with NamedTemporaryFile(prefix="gridfinity-rebuilt-", suffix=".json", mode='wt',delete_on_close=False) as file:
-                json.dump(params, file, sort_keys=True, indent=2, cls=DataClassJSONEncoder)
-                file.close()
-                command_arguments += ["-p", file.name, "-P", "python_generated"]
-                return self._run(command_arguments)
-        else:
-            return self._run(command_arguments)
+        cache_key = None
+        cache_hit = False
+        if self.render_cache != None:
+            cache_key = self.cache_key(job)
+            cache_hit = self.render_cache.get(cache_key, image_path)
+            if not cache_hit:
+                # Output may be hard linked to a cache entry.  Never write through it.
+                image_path.unlink(missing_ok=True)
+        return _PreparedJob(job, image_path, command_arguments, cache_key, cache_hit)
+
+    def checked_job(self, job: RenderJob) -> RenderJob:
+        """
+        `job`, with parameters checked against the scad file's Customizer annotations, and converted to the right types.
+        Unchanged if `validate_parameters` is disabled, or the scad file has no Customizer parameters.
+        @throws SchemaError
+        """
+        if job.parameters == None or not self.validate_parameters:
+            return job
+        schema = load_schema(job.scad_file_path)
+        if not schema.parameters:
+            # Not meant to be customized.  e.g. `evaluate` scripts.
+            return job
+        return replace(job, parameters=schema.coerce(job.parameters))
+
+    def add_parameter_files(self, jobs: Iterable[RenderJob]) -> None:
+        """
+        Write one parameter file for a whole batch.  Call before running the batch.
+        Jobs with invalid parameters are skipped.  They fail when run instead.
+        """
+        parameter_sets = []
+        for job in jobs:
+            try:
+                parameter_sets.append(self.checked_job(job).parameters)
+            except SchemaError:
+                pass
+        self.run_files.add(parameters for parameters in parameter_sets if parameters != None)
+
+    def cache_key(self, job: RenderJob) -> str:
+        '''Hash of everything which can affect the output of `job`.  @see `RenderCache.make_key`'''
+        job = self.checked_job(job)
+        return RenderCache.make_key(job.scad_file_path, openscad_version(str(self.openscad_binary_path)),
+            self._render_arguments(job), job.parameters, job.output_file_name.suffix)
+
+    def _render_arguments(self, job: RenderJob) -> list[str]:
+        '''Command line arguments, excluding input and output files.'''
+        return self.common_arguments + \
+            ([f'--backend={self.backend}'] if self.backend != None else []) + \
+            (_IMAGE_MODE_ARGUMENTS[self.image_mode]
+                if self.image_mode != None and job.output_file_name.suffix.lower() == '.png' else []) + \
+            ([job.camera_arguments.as_argument()] if job.camera_arguments != None else []) + \
+            list(job.args)
 
-    def _run(self, args: [str]) -> subprocess.CompletedProcess:
+    def _add_run_files(self, job: RenderJob, command_arguments: [str]) -> tuple[list[str], Path]:
+        """
+        Add arguments for the job's parameters, and the summary file.
+        Files are in `run_files`, and parameter files are shared between renders.
+        @returns (full command arguments, summary file path).  The summary file may not be created, and must be deleted by the caller.
+        """
+        # First, so explicit `-D` arguments still override parameters.
+        parameter_arguments = self.run_files.arguments(job.parameters) if job.parameters != None else []
+        command_arguments = parameter_arguments + list(command_arguments)
+        summary_path = self.run_files.unique_path(".json")
+        if self.collect_summary:
+            command_arguments += ["--summary", "all", "--summary-file", str(summary_path)]
+        return (command_arguments, summary_path)
+
+    @staticmethod
+    def _read_summary(summary_path: Path) -> Optional[dict]:
+        '''@returns None if openscad did not write a summary.  @see `collect_summary`'''
+        return json.loads(summary_path.read_text()) if summary_path.exists() else None
+
+    def _store_in_cache(self, prepared: _PreparedJob) -> None:
+        if prepared.cache_key != None:
+            self.render_cache.put(prepared.cache_key, prepared.image_path)
+
+    def _log_stats(self, stats: RenderStats) -> None:
+        if self.artifact_index != None and stats.succeeded:
+            self.artifact_index.record(self, stats.job, stats.wall_time_s if not stats.cache_hit else None)
+        if self.stats_log_path == None:
+            return
+        line = json.dumps(asdict(stats), sort_keys=True, default=str)
+        with self._stats_log_lock:
+            with open(self.stats_log_path, 'at') as file:
+                file.write(line + "\n")
+
+    @staticmethod
+    def _process_usage(resources) -> _ProcessUsage:
+        '''@param resources From `os.wait4`'''
+        # Linux reports kilobytes, macOS reports bytes.
+        rss_scale = 1 if sys.platform == 'darwin' else 1024
+        return _ProcessUsage(resources.ru_utime + resources.ru_stime, resources.ru_maxrss * rss_scale)
+
+    def _run(self, args: [str]) -> tuple[subprocess.CompletedProcess, Optional[_ProcessUsage]]:
         """
         Run openscad with the passed in arguments.
+        @returns The process, and its resource usage (if supported by the platform).
         """
-        output = subprocess.run([self.openscad_binary_path]+args, capture_output=True)
+        command = [self.openscad_binary_path]+args
+        usage = None
+        if hasattr(os, 'wait4'):
+            # `subprocess.run` does not expose per process resource usage.
+            with TemporaryFile() as stdout, TemporaryFile() as stderr:
+                process = subprocess.Popen(command, stdout=stdout, stderr=stderr)
+                (_, status, resources) = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                stdout.seek(0)
+                stderr.seek(0)
+                output = subprocess.CompletedProcess(command, process.returncode, stdout.read(), stderr.read())
+            usage = self._process_usage(resources)
+        else:
+            output = subprocess.run(command, capture_output=True)
+
+        self._check_output(output)
+        return (output, usage)
+
+    @staticmethod
+    def _check_output(output: subprocess.CompletedProcess) -> None:
+        '''@throws subprocess.CalledProcessError If openscad failed, or printed any errors.'''
         error_strings = output.stderr.decode().strip().splitlines()
         if any(line.startswith("ERROR:") for line in error_strings):
             # OpenSCAD doesn't set an error return if it errors from bad SCAD code!
             output.returncode = 11
         output.check_returncode()
-        return output
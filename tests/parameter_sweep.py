@@ -0,0 +1,238 @@
+"""
+Generate, de-duplicate, and render every combination of a set of parameters.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import sys
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, NamedTuple, Optional, Sequence
+
+from csg_pipeline import CsgPipeline
+from openscad_runner import Backends, CameraArguments, CameraRotations, ImageModes, OpenScadRunner, ParameterFile, RenderResult, Vec3
+
+if TYPE_CHECKING:
+    from memory_scheduler import MemoryScheduler
+
+class HoleOptions(NamedTuple):
+    '''Python version of `bundle_hole_options` in "src/core/gridfinity-rebuilt-holes.scad".'''
+    refined_hole: bool = False
+    magnet_hole: bool = False
+    screw_hole: bool = False
+    crush_ribs: bool = False
+    chamfer: bool = False
+    supportless: bool = False
+
+    def is_valid(self) -> bool:
+        '''Mirrors the asserts in `bundle_hole_options`.'''
+        return not (self.refined_hole and self.magnet_hole)
+
+    def effective(self) -> HoleOptions:
+        """
+        Clear options which `block_base_hole` ignores.
+        Options which produce identical geometry have identical effective options.
+        """
+        any_hole = self.magnet_hole or self.screw_hole
+        return self._replace(
+            crush_ribs=self.crush_ribs and self.magnet_hole,
+            chamfer=self.chamfer and any_hole,
+            supportless=self.supportless and any_hole)
+
+    def as_scad(self) -> str:
+        arguments = ", ".join(f"{name}={str(value).lower()}" for (name, value) in self._asdict().items())
+        return f"bundle_hole_options({arguments})"
+
+BIN_HOLE_PARAMETERS = {
+    "refined_hole": "refined_holes",
+    "magnet_hole": "magnet_holes",
+    "screw_hole": "screw_holes",
+    "crush_ribs": "crush_ribs",
+    "chamfer": "chamfer_holes",
+    "supportless": "printable_hole_top",
+}
+'''`HoleOptions` field -> variable in "gridfinity-rebuilt-bins.scad"'''
+
+BASEPLATE_HOLE_PARAMETERS = {
+    "magnet_hole": "enable_magnet",
+    "crush_ribs": "crush_ribs",
+    "chamfer": "chamfer_holes",
+}
+'''`HoleOptions` field -> variable in "gridfinity-rebuilt-baseplate.scad".  Other fields are always false.'''
+
+BIN_HOLE_AXES = {name: [False, True] for name in BIN_HOLE_PARAMETERS.values()}
+'''Every hole option for "gridfinity-rebuilt-bins.scad"'''
+
+BASEPLATE_HOLE_AXES = {
+    "style_plate": [0, 1, 2, 3, 4],
+    "style_hole": [0, 1, 2],
+    **{name: [False, True] for name in BASEPLATE_HOLE_PARAMETERS.values()},
+}
+'''Every plate and hole style for "gridfinity-rebuilt-baseplate.scad"'''
+
+def baseplate_ignored_parameters(parameters: dict) -> dict:
+    '''Minimal baseplates (thin, screw together minimal) have no holes at all.'''
+    if parameters["style_plate"] not in (0, 4):
+        return parameters
+    return parameters | {"style_hole": 0} | {name: False for name in BASEPLATE_HOLE_PARAMETERS.values()}
+
+def hole_options_from_parameters(parameters: dict, hole_parameters: dict[str, str]) -> HoleOptions:
+    '''@param hole_parameters `HoleOptions` field -> parameter name.  e.g. `BIN_HOLE_PARAMETERS`'''
+    return HoleOptions(**{option: bool(parameters[name]) for (option, name) in hole_parameters.items()})
+
+class SweepProgress(NamedTuple):
+    completed: int
+    total: int
+    failed: int
+    result: RenderResult
+
+def print_progress(progress: SweepProgress) -> None:
+    status = "ok" if progress.result.ok else "FAILED"
+    print(f"[{progress.completed}/{progress.total}] {status} {progress.result.job.output_file_name}",
+        file=sys.stderr, flush=True)
+
+@dataclass
+class ParameterSweep:
+    """
+    Cartesian product of `axes`, applied on top of `base_parameters`.
+    @example ParameterSweep(defaults, {"gridx": [1, 2, 3], **BIN_HOLE_AXES}, hole_parameters=BIN_HOLE_PARAMETERS)
+    """
+    base_parameters: dict
+    axes: dict[str, Sequence]
+    '''parameter name -> every value to try'''
+    exclusions: list[Callable[[dict], bool]] = field(default_factory=list)
+    '''Combinations are skipped if any of these return True'''
+    hole_parameters: Optional[dict[str, str]] = None
+    """
+    If set, combinations with invalid `HoleOptions` are skipped,
+    and combinations with the same effective `HoleOptions` are only rendered once.
+    """
+    normalizers: list[Callable[[dict], dict]] = field(default_factory=list)
+    '''Reset parameters which do not affect the output.  Combinations which normalize the same are only rendered once.'''
+
+    def combinations(self) -> Iterator[dict]:
+        '''Every combination not excluded.  Includes duplicates.'''
+        names = list(self.axes.keys())
+        for values in itertools.product(*self.axes.values()):
+            parameters = self.base_parameters | dict(zip(names, values))
+            if self.hole_parameters != None \
+                and not hole_options_from_parameters(parameters, self.hole_parameters).is_valid():
+                continue
+            if any(exclude(parameters) for exclude in self.exclusions):
+                continue
+            yield parameters
+
+    def canonical_key(self, parameters: dict) -> str:
+        '''Identical for combinations which produce the same output.'''
+        if self.hole_parameters != None:
+            effective = hole_options_from_parameters(parameters, self.hole_parameters).effective()
+            parameters = parameters | {name: getattr(effective, option)
+                for (option, name) in self.hole_parameters.items()}
+        for normalize in self.normalizers:
+            parameters = normalize(parameters)
+        return json.dumps(parameters, sort_keys=True, default=str)
+
+    def unique_combinations(self) -> list[dict]:
+        '''First combination of each set of equivalent combinations.'''
+        unique = {}
+        for parameters in self.combinations():
+            unique.setdefault(self.canonical_key(parameters), parameters)
+        return list(unique.values())
+
+    def output_file_name(self, parameters: dict, suffix: str = ".png") -> Path:
+        '''Unique name, built from the values of each axis.'''
+        parts = [f"{name}-{_format_value(parameters[name])}" for name in self.axes.keys()]
+        return Path("_".join(parts) + suffix)
+
+    def run(self, runner: OpenScadRunner, suffix: str = ".png", max_workers: Optional[int] = None,
+            progress: Optional[Callable[[SweepProgress], None]] = print_progress,
+            two_stage: bool = False, scheduler: Optional[MemoryScheduler] = None) -> list[RenderResult]:
+        """
+        Render every unique combination, using the runner's current camera and output folder.
+        @param suffix Output format.
+        @param progress Called after each render finishes.
+        @param two_stage Use `CsgPipeline`, so combinations which evaluate to the same model are only rendered once.
+        @param scheduler Limits how many renders run at once by their predicted memory.  Not used with `two_stage`.
+        """
+        jobs = [replace(runner.make_job([], self.output_file_name(parameters, suffix)), parameters=parameters)
+            for parameters in self.unique_combinations()]
+        results = []
+        failed = 0
+        if two_stage:
+            batch = CsgPipeline(runner).run(jobs, max_workers)
+        elif scheduler != None:
+            batch = scheduler.run(runner, jobs, max_workers)
+        else:
+            batch = runner.run_batch(jobs, max_workers)
+        for result in batch:
+            results.append(result)
+            failed += 0 if result.ok else 1
+            if progress != None:
+                progress(SweepProgress(len(results), len(jobs), failed, result))
+        return results
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# name -> (scad file, default parameter file, axes, hole parameters, normalizers)
+_ENTRY_POINTS = {
+    "bins": ("gridfinity-rebuilt-bins.scad", "tests/gridfinity-rebuilt-bins.json",
+        BIN_HOLE_AXES, BIN_HOLE_PARAMETERS, []),
+    "baseplate": ("gridfinity-rebuilt-baseplate.scad", "tests/gridfinity-rebuilt-baseplate.json",
+        BASEPLATE_HOLE_AXES, BASEPLATE_HOLE_PARAMETERS, [baseplate_ignored_parameters]),
+}
+
+def main(argv: Optional[list[str]] = None) -> int:
+    '''Render every hole option for an entry point.'''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("entry_point", choices=_ENTRY_POINTS.keys())
+    parser.add_argument("output", type=Path, help="Folder to save images to.")
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--jobs", type=int, default=None, help="Maximum concurrent renders.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be rendered.")
+    parser.add_argument("--backend", choices=Backends.ALL, help="Geometry backend.  Default: openscad's default.")
+    parser.add_argument("--image-mode", choices=ImageModes.ALL, help="How images are drawn.  Default: openscad's default.")
+    strategy = parser.add_mutually_exclusive_group()
+    strategy.add_argument("--two-stage", action="store_true",
+        help="Export .csg first, and only render combinations with different geometry.")
+    strategy.add_argument("--memory-budget", type=float, metavar="GIB",
+        help="Limit concurrent renders by their predicted peak memory.  0 uses 80%% of available memory.")
+    parser.add_argument("--stats-log", type=Path,
+        help="Render history.  Predicts memory for --memory-budget, and is appended to.")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    (scad_file, parameter_file, axes, hole_parameters, normalizers) = _ENTRY_POINTS[arguments.entry_point]
+    defaults = ParameterFile.from_json(root.joinpath(parameter_file).read_text()).parameterSets["Default"]
+    sweep = ParameterSweep(defaults, axes, hole_parameters=hole_parameters, normalizers=normalizers)
+
+    if arguments.dry_run:
+        for parameters in sweep.unique_combinations():
+            print(sweep.output_file_name(parameters))
+        return 0
+
+    runner = OpenScadRunner(root.joinpath(scad_file))
+    runner.openscad_binary_path = arguments.openscad
+    runner.image_folder_base = arguments.output
+    runner.backend = arguments.backend
+    runner.image_mode = arguments.image_mode
+    runner.camera_arguments = CameraArguments(Vec3(0,0,0), CameraRotations.AngledBottom, 150)
+    runner.stats_log_path = arguments.stats_log
+    scheduler = None
+    if arguments.memory_budget != None:
+        # Imports this module.
+        from memory_scheduler import MemoryScheduler, ResourceModel
+        model = ResourceModel.from_stats_log(arguments.stats_log) if arguments.stats_log != None else ResourceModel()
+        scheduler = MemoryScheduler(model, arguments.memory_budget * 1024**3 if arguments.memory_budget > 0 else None)
+    arguments.output.mkdir(parents=True, exist_ok=True)
+    results = sweep.run(runner, max_workers=arguments.jobs, two_stage=arguments.two_stage, scheduler=scheduler)
+    return 1 if any(not result.ok for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+On disk, content addressed, cache of openscad outputs.
+Lets `OpenScadRunner` skip openscad entirely when nothing affecting an output has changed.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+_DEPENDENCY_PATTERN = re.compile(r'^\s*(?:include|use)\s*<([^>]+)>', re.MULTILINE)
+_LINE_COMMENT_PATTERN = re.compile(r'//.*$', re.MULTILINE)
+_BLOCK_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+def _direct_dependencies(scad_file_path: Path) -> tuple[Path, ...]:
+    """
+    Files named by `include <>` and `use <>` statements.  Relative paths are resolved like openscad does.
+    Only re-reads the file if it has changed on disk.
+    """
+    stat = scad_file_path.stat()
+    return _parse_dependencies(scad_file_path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=None)
+def _parse_dependencies(scad_file_path: Path, mtime_ns: int, size: int) -> tuple[Path, ...]:
+    '''`mtime_ns` and `size` are only used to invalidate the cache.'''
+    source = scad_file_path.read_text()
+    source = _BLOCK_COMMENT_PATTERN.sub('', source)
+    source = _LINE_COMMENT_PATTERN.sub('', source)
+    return tuple(scad_file_path.parent.joinpath(name).resolve()
+        for name in _DEPENDENCY_PATTERN.findall(source))
+
+def scad_dependencies(scad_file_path: Path) -> frozenset[Path]:
+    """
+    Transitive closure of all `include <>`/`use <>` files, including `scad_file_path` itself.
+    Files which cannot be found (e.g. from the OPENSCADPATH library folder) are skipped.
+    Each file is only re-read if it has changed, so a change to any nested include is picked up.
+    """
+    scad_file_path = Path(scad_file_path).resolve()
+    found = {scad_file_path}
+    to_visit = [scad_file_path]
+    while to_visit:
+        for dependency in _direct_dependencies(to_visit.pop()):
+            if dependency not in found and dependency.is_file():
+                found.add(dependency)
+                to_visit.append(dependency)
+    return frozenset(found)
+
+@functools.lru_cache(maxsize=None)
+def _file_hash(file_path: Path, mtime_ns: int, size: int) -> str:
+    '''`mtime_ns` and `size` are only used to invalidate the cache.'''
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+def file_hash(file_path: Path) -> str:
+    '''sha256 of a file's contents.  Only re-reads the file if it has changed on disk.'''
+    stat = file_path.stat()
+    return _file_hash(file_path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=None)
+def openscad_version(openscad_binary_path: str) -> str:
+    '''Output of `openscad --version`.  Different versions may produce different outputs.'''
+    output = subprocess.run([openscad_binary_path, '--version'], capture_output=True)
+    # Older versions print to stderr, newer ones to stdout.
+    return (output.stdout + output.stderr).decode().strip()
+
+class RenderCache:
+    """
+    Content addressed store of rendered files, with least recently used eviction.
+    @see `OpenScadRunner.render_cache`
+    """
+    directory: Path
+    max_size_bytes: int
+    '''Once exceeded, the least recently used entries are removed.'''
+    use_hard_links: bool
+    '''
+    If cache hits are hard linked instead of copied.  Falls back to copying if linking fails.
+    @warning Anything writing to a linked output in place also changes the cached copy.
+    '''
+
+    def __init__(self, directory: Path, max_size_bytes: int = 1024**3, use_hard_links: bool = False):
+        self.directory = Path(directory)
+        self.max_size_bytes = max_size_bytes
+        self.use_hard_links = use_hard_links
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._size_lock = threading.Lock()
+        self._size_bytes = None
+        '''Size at the last scan, plus everything `put` since.  None until the first `put`.'''
+
+    @staticmethod
+    def default_directory() -> Path:
+        '''Honors `XDG_CACHE_HOME`.'''
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home().joinpath('.cache')
+        return Path(base).joinpath('gridfinity-rebuilt', 'renders')
+
+    @staticmethod
+    def make_key(scad_file_path: Path, openscad_version: str, arguments: list[str],
+            parameters: Optional[dict], suffix: str) -> str:
+        """
+        Hash everything that can affect an output.
+        @param arguments All command line arguments, excluding input and output files.
+        @param suffix Output file extension.  Determines the export format.
+        """
+        dependencies = scad_dependencies(scad_file_path)
+        root = Path(scad_file_path).resolve().parent
+        key_data = {
+            'openscad_version': openscad_version,
+            'arguments': list(arguments),
+            'parameters': parameters,
+            'suffix': suffix,
+            # Paths are relative, so the same checkout in a different folder has the same key.
+            'files': sorted((os.path.relpath(path, root), file_hash(path)) for path in dependencies),
+        }
+        encoded = json.dumps(key_data, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry_path(self, key: str, suffix: str) -> Path:
+        return self.directory.joinpath(key[:2], key + suffix)
+
+    def get(self, key: str, destination: Path) -> bool:
+        """
+        Place a cached file at `destination`.
+        @returns False on a cache miss.  `destination` is not modified.
+        """
+        entry = self._entry_path(key, destination.suffix)
+        if not entry.exists():
+            return False
+        # Mark as recently used.
+        os.utime(entry)
+        destination.unlink(missing_ok=True)
+        if self.use_hard_links:
+            try:
+                os.link(entry, destination)
+                return True
+            except OSError:
+                pass
+        shutil.copyfile(entry, destination)
+        return True
+
+    def path(self, key: str, suffix: str) -> Optional[Path]:
+        """
+        The cached file itself, marked as recently used.
+        @returns None on a cache miss.
+        @warning Read only.  May be evicted at any time.
+        """
+        entry = self._entry_path(key, suffix)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def put(self, key: str, source: Path) -> None:
+        '''Store a copy of `source`, then evict old entries if needed.'''
+        entry = self._entry_path(key, source.suffix)
+        entry.parent.mkdir(exist_ok=True)
+        # Write then rename, so a concurrent `get` never sees a partial file.
+        with NamedTemporaryFile(dir=entry.parent, prefix='.', delete=False) as temporary_file:
+            with open(source, 'rb') as source_file:
+                shutil.copyfileobj(source_file, temporary_file)
+            size = temporary_file.tell()
+        try:
+            replaced_size = entry.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(temporary_file.name, entry)
+
+        # Only scan the whole cache when it might be over budget.
+        with self._size_lock:
+            if self._size_bytes == None:
+                self._size_bytes = self.size_bytes()
+            else:
+                self._size_bytes += size - replaced_size
+            over_budget = self._size_bytes > self.max_size_bytes
+        if over_budget:
+            self.evict()
+
+    def size_bytes(self) -> int:
+        return sum(stat.st_size for (stat, _) in self._stat_entries())
+
+    def evict(self) -> None:
+        '''Remove least recently used entries until the cache fits in `max_size_bytes`.'''
+        entries = self._stat_entries()
+        total_size = sum(stat.st_size for (stat, _) in entries)
+        entries.sort(key=lambda item: item[0].st_mtime_ns)
+        for (stat, entry) in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total_size -= stat.st_size
+        with self._size_lock:
+            self._size_bytes = total_size
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            entry.unlink(missing_ok=True)
+        with self._size_lock:
+            self._size_bytes = 0
+
+    def _stat_entries(self) -> list[tuple[os.stat_result, Path]]:
+        '''Skips entries removed since listing them, e.g. by another thread or process evicting.'''
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat(), entry))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _entries(self) -> list[Path]:
+        # Skip in progress writes from `put`.
+        return [path for path in self.directory.glob('*/*')
+            if path.is_file() and not path.name.startswith('.')]
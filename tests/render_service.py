@@ -0,0 +1,336 @@
+"""
+Small HTTP/JSON service which renders models on request.
+Identical requests share one openscad process, and every output is kept in a `RenderCache`.
+Only listens on localhost by default.  There is no authentication.
+@example python tests/render_service.py --openscad /usr/bin/openscad --port 8000
+         curl -d '{"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": {"gridx": 2, "gridy": 1, "gridz": 6}}' localhost:8000/render
+
+Endpoints:
+    POST /render           `{"scad_file", "parameters" or "parameterSets" (and "set"), "format"}`.
+                           Waits for the render.  @returns `{"key", "artifact", "source", "wall_time_s"}`
+    GET  /artifacts/<name> A rendered file, from the `artifact` field.
+    GET  /metrics          Queue depth, counters, and request latency percentiles.
+"""
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import NamedTuple, Optional
+
+from customizer_schema import SchemaError, load_schema
+from openscad_runner import OpenScadRunner, RenderJob
+from render_cache import RenderCache
+
+FORMATS = {
+    "stl": ".stl",
+    "3mf": ".3mf",
+    "off": ".off",
+    "amf": ".amf",
+    "png": ".png",
+}
+'''Request "format" -> output suffix'''
+
+_CONTENT_TYPES = {
+    ".stl": "model/stl",
+    ".3mf": "model/3mf",
+    ".png": "image/png",
+}
+
+class RequestError(ValueError):
+    '''The request is invalid.  Reported as 400 Bad Request.'''
+
+class RenderResponse(NamedTuple):
+    key: str
+    '''`RenderCache` key of the output'''
+    artifact: str
+    '''File name, for `GET /artifacts/<name>`'''
+    source: str
+    '''"store" (already rendered), "rendered", or "coalesced" (shared an identical request's render)'''
+    wall_time_s: float
+
+    def as_json(self) -> dict:
+        return self._asdict() | {"artifact": f"/artifacts/{self.artifact}"}
+
+def percentile(sorted_values: list[float], fraction: float) -> Optional[float]:
+    '''Nearest rank percentile.  None if there are no values.'''
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+class RenderService:
+    """
+    Queues renders onto a pool of openscad processes, without any HTTP.  @see `make_server`
+    Each output is identified by `OpenScadRunner.cache_key`.
+    A request for an output which is already being rendered waits for that render, instead of starting another.
+    """
+    root: Path
+    '''Folder containing the scad files which may be rendered'''
+    store: RenderCache
+    '''Every output is served from here.  Should not be shared with another `RenderCache` user, e.g. a test session.'''
+    openscad_binary_path: str
+    max_workers: int
+
+    def __init__(self, root: Path, store: RenderCache,
+            openscad_binary_path: str = OpenScadRunner.WINDOWS_DEFAULT_PATH,
+            max_workers: Optional[int] = None, latency_window: int = 1000):
+        """
+        @param latency_window Latency percentiles cover this many of the most recent requests.
+        """
+        self.root = Path(root)
+        self.store = store
+        self.openscad_binary_path = openscad_binary_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="openscad")
+        self._work_directory = TemporaryDirectory(prefix="gridfinity-rebuilt-service-")
+        self._runners = {}
+        self._in_flight = {}
+        '''key -> `Future` of the render'''
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counters = collections.Counter()
+        self._queue_depth = 0
+        self._running = 0
+
+    @staticmethod
+    def default_store_directory() -> Path:
+        '''Next to the default `RenderCache`, but separate, so evicting one never removes files from the other.'''
+        return RenderCache.default_directory().parent.joinpath("service")
+
+    def scad_files(self) -> dict[str, Path]:
+        '''Name -> path, of every scad file which may be rendered.'''
+        return {path.name: path for path in sorted(self.root.glob("*.scad"))}
+
+    def make_job(self, request: dict) -> RenderJob:
+        """
+        Validate a `/render` request.
+        Parameters are checked against, and converted to, the scad file's Customizer parameters.
+        Customizer output (all strings) works.
+        @throws RequestError
+        """
+        if not isinstance(request, dict):
+            raise RequestError("Expected a JSON object.")
+        scad_files = self.scad_files()
+        scad_file = request.get("scad_file")
+        if scad_file not in scad_files:
+            raise RequestError(f"Unknown scad_file {scad_file!r}.  Expected one of {sorted(scad_files)}.")
+        suffix = FORMATS.get(request.get("format", "stl"))
+        if suffix == None:
+            raise RequestError(f"Unknown format {request.get('format')!r}.  Expected one of {sorted(FORMATS)}.")
+
+        if "parameterSets" in request:
+            parameter_sets = request["parameterSets"]
+            set_name = request.get("set", next(iter(parameter_sets), None) if len(parameter_sets) == 1 else None)
+            if set_name not in parameter_sets:
+                raise RequestError(f"Unknown set {set_name!r}.  Expected one of {sorted(parameter_sets)}.")
+            parameters = parameter_sets[set_name]
+        else:
+            parameters = request.get("parameters", {})
+        if not isinstance(parameters, dict):
+            raise RequestError("Parameters must be a JSON object.")
+        try:
+            parameters = load_schema(scad_files[scad_file]).coerce(parameters)
+        except SchemaError as e:
+            raise RequestError(str(e))
+
+        return RenderJob(scad_file_path=scad_files[scad_file],
+            output_file_name=Path("output" + suffix),
+            parameters=parameters,
+            camera_arguments=OpenScadRunner.TOP_ANGLE_CAMERA if suffix == ".png" else None,
+            # Binary is smaller, and much faster to load.
+            args=("--export-format=binstl",) if suffix == ".stl" else ())
+
+    def render(self, job: RenderJob) -> RenderResponse:
+        """
+        Render `job`, unless it is already in the store or being rendered.  Blocks until the output is in the store.
+        @throws Whatever the render raised.  Every request sharing the render gets the same error.
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            self._counters["requests"] += 1
+        try:
+            runner = self._runner(job.scad_file_path)
+            key = runner.cache_key(job)
+            job = replace(job, output_file_name=Path(key + job.output_file_name.suffix))
+            with self._lock:
+                future = self._in_flight.get(key)
+                if future != None:
+                    source = "coalesced"
+                elif self.store.path(key, job.output_file_name.suffix) != None:
+                    source = "store"
+                else:
+                    source = "rendered"
+                    self._queue_depth += 1
+                    future = self._executor.submit(self._render, runner, job)
+                    self._in_flight[key] = future
+                self._counters[source] += 1
+            if future != None:
+                future.result()
+            return RenderResponse(key, job.output_file_name.name, source, time.perf_counter() - start_time)
+        except Exception:
+            with self._lock:
+                self._counters["failures"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start_time)
+
+    def artifact(self, name: str) -> Optional[Path]:
+        '''Stored output, from `RenderResponse.artifact`.  None if it is not (or no longer) stored.'''
+        (key, suffix) = os.path.splitext(name)
+        if suffix not in FORMATS.values() or not key.isalnum():
+            return None
+        return self.store.path(key, suffix)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "queue_depth": self._queue_depth,
+                "running": self._running,
+                "in_flight": len(self._in_flight),
+                "workers": self.max_workers,
+                "counters": dict(self._counters),
+                "latency_s": {
+                    "count": len(latencies),
+                    "p50": percentile(latencies, 0.5),
+                    "p90": percentile(latencies, 0.9),
+                    "p99": percentile(latencies, 0.99),
+                    "max": latencies[-1] if latencies else None,
+                },
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for runner in self._runners.values():
+            runner.close()
+        self._work_directory.cleanup()
+
+    def _runner(self, scad_file_path: Path) -> OpenScadRunner:
+        '''One per scad file, so parameter files are shared between its renders.'''
+        with self._lock:
+            if scad_file_path not in self._runners:
+                runner = OpenScadRunner(scad_file_path)
+                runner.openscad_binary_path = self.openscad_binary_path
+                runner.image_folder_base = Path(self._work_directory.name)
+                runner.render_cache = self.store
+                self._runners[scad_file_path] = runner
+            return self._runners[scad_file_path]
+
+    def _render(self, runner: OpenScadRunner, job: RenderJob) -> None:
+        with self._lock:
+            self._queue_depth -= 1
+            self._running += 1
+        try:
+            [result] = runner.run_batch([job], max_workers=1)
+            if not result.ok:
+                raise result.error
+        finally:
+            # Stored by the runner.  Only the copy in the store is served.
+            runner.image_folder_base.joinpath(job.output_file_name).unlink(missing_ok=True)
+            with self._lock:
+                self._running -= 1
+                # Later requests find the output in the store instead.
+                self._in_flight.pop(job.output_file_name.stem)
+
+class _Handler(BaseHTTPRequestHandler):
+    service: RenderService
+    quiet: bool = True
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        elif self.path.startswith("/artifacts/"):
+            artifact = self.service.artifact(self.path.removeprefix("/artifacts/"))
+            try:
+                data = artifact.read_bytes() if artifact != None else None
+            except FileNotFoundError:
+                # Evicted since it was found.
+                data = None
+            if data == None:
+                self._send_json(404, {"error": "Not found."})
+                return
+            self._send(200, data, _CONTENT_TYPES.get(artifact.suffix, "application/octet-stream"))
+        else:
+            self._send_json(404, {"error": "Not found."})
+
+    def do_POST(self) -> None:
+        if self.path != "/render":
+            self._send_json(404, {"error": "Not found."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = self.service.make_job(json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, RequestError) as e:
+            # Includes invalid JSON.
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            self._send_json(200, self.service.render(job).as_json())
+        except Exception as e:
+            stderr = getattr(e, "stderr", None)
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}",
+                "stderr": stderr.decode(errors="replace") if isinstance(stderr, bytes) else stderr})
+
+    def _send_json(self, status: int, value) -> None:
+        self._send(status, json.dumps(value).encode(), "application/json")
+
+    def _send(self, status: int, data: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        if not self.quiet:
+            super().log_message(format, *args)
+
+def make_server(service: RenderService, host: str = "127.0.0.1", port: int = 8000,
+        quiet: bool = True) -> ThreadingHTTPServer:
+    """
+    HTTP server for `service`.  Each request is handled on its own thread.
+    @param port 0 picks a free port.  @see `ThreadingHTTPServer.server_address`
+    """
+    handler = type("Handler", (_Handler,), {"service": service, "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--openscad", default=OpenScadRunner.WINDOWS_DEFAULT_PATH, help="openscad binary.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--jobs", type=int, default=None, help="Maximum concurrent renders.")
+    parser.add_argument("--store", type=Path, default=None,
+        help=f"Folder for rendered files.  Default: {RenderService.default_store_directory()}")
+    parser.add_argument("--store-size", type=float, default=1, metavar="GIB",
+        help="Least recently used files are removed past this size.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    arguments = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    store = RenderCache(arguments.store or RenderService.default_store_directory(), int(arguments.store_size * 1024**3))
+    service = RenderService(root, store, arguments.openscad, arguments.jobs)
+    server = make_server(service, arguments.host, arguments.port, quiet=not arguments.verbose)
+    print(f"Listening on http://{server.server_address[0]}:{server.server_address[1]}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
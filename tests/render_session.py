@@ -0,0 +1,206 @@
+"""
+Shared state for every render in a pytest session.
+Used by "conftest.py".  Renders are deferred to a shared pool, so tests do not wait on openscad one at a time.
+"""
+from __future__ import annotations
+
+import copy
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+
+from backend_calibration import BackendChoices
+from incremental_build import ArtifactIndex
+from openscad_runner import CameraArguments, OpenScadRunner, ParameterFile, RenderStats
+from render_cache import RenderCache
+
+class ParameterFiles:
+    '''Parsed parameter files.  Each file is only read once.'''
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def get(self, relative_path: str, set_name: str = "Default") -> dict:
+        '''@returns A copy, which is safe to modify.'''
+        with self._lock:
+            if relative_path not in self._files:
+                self._files[relative_path] = ParameterFile.from_json(self.root.joinpath(relative_path).read_text())
+            return self._files[relative_path].parameterSets[set_name].copy()
+
+class TimedRender(NamedTuple):
+    '''Picklable summary of a `RenderStats`, for reporting.'''
+    nodeid: str
+    output_file_name: str
+    wall_time_s: float
+    cache_hit: bool
+    succeeded: bool
+
+class DeferredRenderError(Exception):
+    '''One or more deferred renders failed.  Lists every failure, and the test which requested it.'''
+
+class RenderSession:
+    """
+    One pool of openscad processes, shared by every test.
+    If `defer` is set, `create_image` and `create_views` calls return immediately.  Failures are raised by `wait`.
+    """
+    max_workers: int
+    render_cache: Optional[RenderCache]
+    '''Set on every runner.  Renders with a valid cache entry skip openscad.'''
+    defer: bool
+    '''If False (the default), every render runs immediately, like a plain `OpenScadRunner`.'''
+    image_mode: Optional[str]
+    '''Set on every runner.  @see `OpenScadRunner.image_mode`'''
+    backend: Optional[str]
+    '''Set on every runner.  @see `OpenScadRunner.backend`'''
+    backend_choices: Optional[BackendChoices]
+    '''If set, and `backend` is not, every runner uses the calibrated backend for its scad file.'''
+    artifact_index: Optional[ArtifactIndex]
+    '''Set on every runner.  @see `OpenScadRunner.artifact_index`'''
+    timings: list[TimedRender]
+
+    def __init__(self, max_workers: int, render_cache: Optional[RenderCache] = None, defer: bool = False,
+            image_mode: Optional[str] = None, backend: Optional[str] = None,
+            backend_choices: Optional[BackendChoices] = None, artifact_index: Optional[ArtifactIndex] = None):
+        self.max_workers = max_workers
+        self.render_cache = render_cache
+        self.defer = defer
+        self.image_mode = image_mode
+        self.backend = backend
+        self.backend_choices = backend_choices
+        self.artifact_index = artifact_index
+        self.timings = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openscad")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_max_workers() -> int:
+        '''Cores, split between `pytest-xdist` workers.'''
+        worker_count = int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", "1"))
+        return max(1, (os.cpu_count() or 1) // worker_count)
+
+    def make_runner(self, file_path: Path, nodeid: str) -> SessionRunner:
+        '''@param nodeid The test using the runner.  Used when reporting failures and timings.'''
+        runner = SessionRunner(file_path, self, nodeid)
+        runner.render_cache = self.render_cache
+        runner.defer = self.defer
+        runner.image_mode = self.image_mode
+        runner.backend = self.backend
+        runner.artifact_index = self.artifact_index
+        if self.backend == None and self.backend_choices != None:
+            self.backend_choices.apply(runner)
+        return runner
+
+    def submit(self, nodeid: str, description: str, function: Callable[[], Any]) -> Future:
+        future = self._executor.submit(function)
+        with self._lock:
+            self._pending.append((nodeid, description, future))
+        return future
+
+    def record(self, nodeid: str, stats: RenderStats) -> None:
+        timing = TimedRender(nodeid, str(stats.job.output_file_name), stats.wall_time_s,
+            stats.cache_hit, stats.succeeded)
+        with self._lock:
+            self.timings.append(timing)
+
+    def failures(self) -> dict[str, list[str]]:
+        """
+        Wait for every deferred render.
+        @returns nodeid -> a description of each failed render requested by that test.  Each failure is only returned once.
+        """
+        with self._lock:
+            (pending, self._pending) = (self._pending, [])
+        failures = {}
+        for (nodeid, description, future) in pending:
+            error = future.exception()
+            if error != None:
+                failures.setdefault(nodeid, []).append(f"{description}: {type(error).__name__}: {error}")
+        return failures
+
+    def wait(self) -> None:
+        '''Wait for every deferred render.  @throws DeferredRenderError If any failed.'''
+        failures = [f"{nodeid}: {failure}" for (nodeid, messages) in self.failures().items() for failure in messages]
+        if failures:
+            raise DeferredRenderError(f"{len(failures)} deferred render(s) failed:\n" + "\n".join(failures))
+
+    def slowest(self, count: int) -> list[TimedRender]:
+        return sorted(self.timings, key=lambda timing: timing.wall_time_s, reverse=True)[:count]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+class SessionRunner(OpenScadRunner):
+    """
+    Runner which defers image renders to a `RenderSession`.
+    Settings are captured when `create_image` or `create_views` is called, so the test can keep changing them.
+    Calls which return data (`create_mesh`, `evaluate`, `run_batch`) still run immediately.
+    """
+    session: RenderSession
+    nodeid: str
+    defer: bool
+    '''Set False for tests which inspect the output themselves.'''
+
+    def __init__(self, file_path: Path, session: RenderSession, nodeid: str):
+        super().__init__(file_path)
+        self.session = session
+        self.nodeid = nodeid
+        self.defer = True
+        self._deferred = []
+        self._deferred_lock = threading.Lock()
+
+    def close(self) -> None:
+        '''Remove temporary files, once every deferred render from this runner has finished.'''
+        with self._deferred_lock:
+            (deferred, self._deferred) = (self._deferred, [])
+        remaining = [len(deferred)]
+        if not deferred:
+            super().close()
+            return
+
+        def finished(_):
+            with self._deferred_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            OpenScadRunner.close(self)
+        for future in deferred:
+            future.add_done_callback(finished)
+
+    def create_image(self, args: [str], image_file_name: str):
+        '''@returns A `Future` if deferred.  @see `OpenScadRunner.create_image`'''
+        if not self.defer:
+            return super().create_image(args, image_file_name)
+        snapshot = self._snapshot()
+        return self._submit(str(image_file_name),
+            lambda: OpenScadRunner.create_image(snapshot, args, image_file_name))
+
+    def create_views(self, args: [str], views: Sequence[tuple[str, CameraArguments]],
+            intermediate_suffix: str = '.csg', max_workers: Optional[int] = None):
+        '''@returns A `Future` if deferred.  @see `OpenScadRunner.create_views`'''
+        if not self.defer:
+            return super().create_views(args, views, intermediate_suffix, max_workers)
+        snapshot = self._snapshot()
+        # Already one of many concurrent calls.
+        return self._submit(", ".join(str(name) for (name, _) in views),
+            lambda: OpenScadRunner.create_views(snapshot, args, views, intermediate_suffix, max_workers or 1))
+
+    def _submit(self, description: str, function: Callable[[], Any]) -> Future:
+        future = self.session.submit(self.nodeid, description, function)
+        with self._deferred_lock:
+            self._deferred.append(future)
+        return future
+
+    def _snapshot(self) -> SessionRunner:
+        # Created first, so every snapshot shares one `RunFiles` with this runner.
+        self.run_files
+        snapshot = copy.copy(self)
+        snapshot.parameters = self.parameters.copy() if self.parameters != None else None
+        return snapshot
+
+    def _log_stats(self, stats: RenderStats) -> None:
+        self.session.record(self.nodeid, stats)
+        super()._log_stats(stats)
@@ -0,0 +1,131 @@
+"""
+Convert values printed by openscad's `echo` into Python values, and back.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from typing import Any, NamedTuple
+
+class ScadRange(NamedTuple):
+    '''An openscad range.  `[start : step : end]`'''
+    start: float
+    step: float
+    end: float
+
+_TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|-?inf|nan)
+        |(?P<string>"(?:[^"\\]|\\.)*")
+        |(?P<keyword>true|false|undef)
+        |(?P<symbol>[\[\],:])
+    )''', re.VERBOSE)
+
+_STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+
+def parse_scad_value(text: str) -> Any:
+    """
+    Parse a single value, as printed by `echo(name=value)`.
+    numbers -> float, strings -> str, booleans -> bool, undef -> None,
+    vectors -> list, ranges -> ScadRange.
+    @warning Function literals are not supported.
+    """
+    tokens = _tokenize(text)
+    (value, position) = _parse(tokens, 0, text)
+    if position != len(tokens):
+        raise ValueError(f'Unexpected trailing data in "{text}"')
+    return value
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match == None or match.end() == position:
+            raise ValueError(f'Unable to parse "{text}" at position {position}')
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+def _parse(tokens: list[tuple[str, str]], position: int, text: str) -> tuple[Any, int]:
+    if position >= len(tokens):
+        raise ValueError(f'Unexpected end of "{text}"')
+    (kind, token) = tokens[position]
+    if kind == 'number':
+        return (float(token), position + 1)
+    if kind == 'string':
+        return (re.sub(r'\\(.)', lambda m: _STRING_ESCAPES.get(m.group(1), m.group(1)), token[1:-1]), position + 1)
+    if kind == 'keyword':
+        return ({'true': True, 'false': False, 'undef': None}[token], position + 1)
+    if token != '[':
+        raise ValueError(f'Unexpected "{token}" in "{text}"')
+
+    position += 1
+    items = []
+    separator = None
+    while True:
+        if position >= len(tokens):
+            raise ValueError(f'Unterminated vector in "{text}"')
+        if tokens[position][1] == ']':
+            break
+        if items:
+            if separator == None:
+                separator = tokens[position][1]
+            if tokens[position][1] != separator:
+                raise ValueError(f'Mixed separators in "{text}"')
+            position += 1
+        (item, position) = _parse(tokens, position, text)
+        items.append(item)
+    position += 1
+
+    if separator == ':':
+        # openscad prints `[start : end]` when the step is 1.
+        return (ScadRange(items[0], items[1], items[2]) if len(items) == 3
+            else ScadRange(items[0], 1.0, items[1]), position)
+    return (items, position)
+
+def format_scad_value(value: Any) -> str:
+    """
+    Inverse of `parse_scad_value`.  Output is a valid SCAD expression.
+    @throws TypeError If the value has no SCAD equivalent.
+    """
+    if value is None:
+        return 'undef'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        if math.isnan(value):
+            return '(0/0)'
+        if math.isinf(value):
+            return '(1/0)' if value > 0 else '(-1/0)'
+        return repr(value)
+    if isinstance(value, str):
+        # JSON escapes are a subset of SCAD escapes.
+        return json.dumps(value)
+    if isinstance(value, ScadRange):
+        return f'[{format_scad_value(value.start)}:{format_scad_value(value.step)}:{format_scad_value(value.end)}]'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(format_scad_value(item) for item in value) + ']'
+    raise TypeError(f'{type(value).__name__} has no SCAD equivalent')
+
+_ECHO_ASSIGNMENT_PATTERN = re.compile(r'^ECHO: (\w+) = ', re.MULTILINE)
+_MESSAGE_PATTERN = re.compile(r'\n[A-Z]+:')
+
+def parse_echo_assignments(echo_output: str) -> dict[str, Any]:
+    """
+    Find every `echo(name=value)` line.
+    Values may span multiple lines (e.g. strings with new lines).
+    """
+    matches = list(_ECHO_ASSIGNMENT_PATTERN.finditer(echo_output))
+    output = {}
+    for (index, match) in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(echo_output)
+        value_text = echo_output[match.end():end]
+        # Drop anything printed by other statements.
+        other_message = _MESSAGE_PATTERN.search(value_text)
+        if other_message != None:
+            value_text = value_text[:other_message.start()]
+        output[match.group(1)] = parse_scad_value(value_text)
+    return output
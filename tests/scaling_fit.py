@@ -0,0 +1,55 @@
+"""
+Fit how a measurement (e.g. render time or peak memory) grows with model size.
+Shared by `benchmark.py` and `memory_scheduler.py`.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+def fit_power_law(sizes: Sequence[float], values: Sequence[float]) -> Optional[tuple[float, float]]:
+    """
+    Least squares fit of `value = c * size^exponent`, in log space.
+    @returns (c, exponent).  None if there is not enough data.
+    """
+    points = [(math.log(s), math.log(v)) for (s, v) in zip(sizes, values) if s > 0 and v and v > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for (x, _) in points) / len(points)
+    mean_y = sum(y for (_, y) in points) / len(points)
+    variance = sum((x - mean_x)**2 for (x, _) in points)
+    if variance == 0:
+        return None
+    exponent = sum((x - mean_x) * (y - mean_y) for (x, y) in points) / variance
+    return (math.exp(mean_y - exponent * mean_x), exponent)
+
+def fit_scaling_exponent(sizes: Sequence[float], values: Sequence[float]) -> Optional[float]:
+    """
+    How fast `values` grow with `sizes`.  e.g. 1 for linear, 2 for quadratic.
+    @returns The exponent of `fit_power_law`.  None if there is not enough data.
+    """
+    fit = fit_power_law(sizes, values)
+    return fit[1] if fit != None else None
+
+def fit_grid_exponents(gridx: Sequence[float], gridy: Sequence[float],
+        values: Sequence[float]) -> Optional[tuple[float, float]]:
+    """
+    Least squares fit of `value = c * gridx^x_exponent * gridy^y_exponent`, in log space.
+    Shows if one axis costs more than the other.  e.g. lips and dividers along only one axis.
+    @returns (x_exponent, y_exponent).  None if there is not enough data, or gridx and gridy always change together.
+    """
+    points = [(math.log(x), math.log(y), math.log(v)) for (x, y, v) in zip(gridx, gridy, values)
+        if x > 0 and y > 0 and v and v > 0]
+    if len(points) < 3:
+        return None
+    means = [sum(point[i] for point in points) / len(points) for i in range(3)]
+    (dx, dy, dv) = ([point[i] - means[i] for point in points] for i in range(3))
+    sxx = sum(a * a for a in dx)
+    syy = sum(b * b for b in dy)
+    sxy = sum(a * b for (a, b) in zip(dx, dy))
+    sxv = sum(a * v for (a, v) in zip(dx, dv))
+    syv = sum(b * v for (b, v) in zip(dy, dv))
+    determinant = sxx * syy - sxy * sxy
+    if abs(determinant) < 1e-12:
+        return None
+    return ((sxv * syy - syv * sxy) / determinant, (syv * sxx - sxv * sxy) / determinant)
@@ -0,0 +1,115 @@
+"""
+Tests for async_openscad_runner.py
+"""
+
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+import pytest
+
+import async_openscad_runner
+from async_openscad_runner import AsyncOpenScadRunner
+from openscad_runner import load_stats_log
+
+_FAKE_OPENSCAD = '''
+import json, sys, time
+if "slow" in sys.argv[sys.argv.index("-o") + 1]:
+    time.sleep(60)
+if "--summary-file" in sys.argv:
+    with open(sys.argv[sys.argv.index("--summary-file") + 1], "w") as summary:
+        json.dump({"geometry": {"facets": 6}}, summary)
+with open(sys.argv[sys.argv.index("-o") + 1], "wb") as output:
+    output.write(b"rendered")
+'''
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+
+@pytest.fixture
+def runner(tmp_path) -> AsyncOpenScadRunner:
+    openscad = tmp_path.joinpath("openscad")
+    openscad.write_text(f"#!{sys.executable}\n" + _FAKE_OPENSCAD)
+    openscad.chmod(0o755)
+    tmp_path.joinpath("model.scad").write_text("cube(1);\n")
+    runner = AsyncOpenScadRunner(tmp_path.joinpath("model.scad"), max_concurrency=2)
+    runner.openscad_binary_path = str(openscad)
+    runner.image_folder_base = tmp_path
+    runner.collect_summary = True
+    runner.stats_log_path = tmp_path.joinpath("stats.jsonl")
+    yield runner
+    runner.close()
+
+def test_stats(runner):
+    asyncio.run(runner.create_image_async([], Path("model.stl")))
+    assert runner.image_folder_base.joinpath("model.stl").read_bytes() == b"rendered"
+
+    [stats] = load_stats_log(runner.stats_log_path)
+    assert stats["succeeded"]
+    assert stats["summary"] == {"geometry": {"facets": 6}}
+    assert stats["cpu_time_s"] != None
+    assert stats["peak_rss_bytes"] > 0
+    # Summary files are removed once read.
+    assert list(runner.run_files.directory.glob("*.json")) == []
+
+def test_file_access_off_event_loop(runner, monkeypatch):
+    threads = []
+    for name in ("_prepare", "_log_stats"):
+        original = getattr(runner, name)
+        def record(*args, original=original):
+            threads.append(threading.current_thread())
+            return original(*args)
+        monkeypatch.setattr(runner, name, record)
+
+    asyncio.run(runner.create_image_async([], Path("model.stl")))
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+def test_timeout(runner):
+    """
+    A job which takes too long is killed, and reported as a timeout.
+    """
+    start_time = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(runner.create_image_async([], Path("slow.stl"), timeout_s=0.5))
+    assert time.perf_counter() - start_time < 30
+    assert not runner.image_folder_base.joinpath("slow.stl").exists()
+    [stats] = load_stats_log(runner.stats_log_path)
+    assert not stats["succeeded"]
+
+def test_jobs_error(runner):
+    '''An error reading `jobs` is raised, after the jobs read before it finish.'''
+    def jobs():
+        yield runner.make_job([], "a.stl")
+        raise KeyError("no more jobs")
+
+    async def run():
+        results = []
+        with pytest.raises(KeyError):
+            async for result in runner.run_batch_async(jobs()):
+                results.append(result)
+        return results
+
+    results = asyncio.run(asyncio.wait_for(run(), 30))
+    assert [result.ok for result in results] == [True]
+
+def test_reused_across_event_loops(runner):
+    async def render_all():
+        await asyncio.gather(*(runner.create_image_async([], f"{i}.stl") for i in range(4)))
+
+    # More jobs than `max_concurrency`, so the limit is contended in both loops.
+    asyncio.run(render_all())
+    asyncio.run(render_all())
+    assert len(load_stats_log(runner.stats_log_path)) == 8
+
+def test_kill_without_taskkill(monkeypatch):
+    async def run():
+        process = await asyncio.create_subprocess_exec(sys.executable, "-c", "import time; time.sleep(60)")
+        async def missing(*args, **kwargs):
+            raise FileNotFoundError("taskkill")
+        monkeypatch.setattr(async_openscad_runner.asyncio, "create_subprocess_exec", missing)
+        await async_openscad_runner._kill_process_tree(process)
+        return process.returncode
+
+    assert asyncio.run(asyncio.wait_for(run(), 30)) != None
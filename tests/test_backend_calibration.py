@@ -0,0 +1,37 @@
+"""
+Tests for backend_calibration.py
+"""
+
+import pytest
+
+from backend_calibration import BackendChoices, CalibrationPoint, choose_backends
+
+def _point(series: str, backend: str, wall_time_s: float, volume: float = 100, watertight: bool = True,
+        scad_file: str = "gridfinity-rebuilt-bins.scad") -> CalibrationPoint:
+    return CalibrationPoint(series, scad_file, backend, True, wall_time_s, volume, watertight)
+
+class TestChooseBackends:
+
+    def test_fastest(self):
+        points = [_point("a", "cgal", 10), _point("a", "manifold", 1),
+            _point("b", "cgal", 5, scad_file="gridfinity-spiral-vase.scad"),
+            _point("b", "manifold", 6, scad_file="gridfinity-spiral-vase.scad")]
+        assert(choose_backends(points) ==
+            {"gridfinity-rebuilt-bins.scad": "manifold", "gridfinity-spiral-vase.scad": "cgal"})
+
+    def test_every_series_counts(self):
+        points = [_point("a", "cgal", 10), _point("a", "manifold", 1),
+            _point("b", "cgal", 1), _point("b", "manifold", 20)]
+        assert(choose_backends(points) == {"gridfinity-rebuilt-bins.scad": "cgal"})
+
+    @pytest.mark.parametrize("invalid", [
+        _point("a", "manifold", 1, volume=90),
+        _point("a", "manifold", 1, watertight=False),
+        CalibrationPoint("a", "gridfinity-rebuilt-bins.scad", "manifold", False, 0, None, False),
+    ])
+    def test_invalid_not_chosen(self, invalid):
+        assert(choose_backends([_point("a", "cgal", 10), invalid]) == {"gridfinity-rebuilt-bins.scad": "cgal"})
+
+def test_never_calibrated(tmp_path):
+    choices = BackendChoices(tmp_path.joinpath('backends.json'))
+    assert(choices.get("missing-openscad", "gridfinity-rebuilt-bins.scad") == None)
@@ -7,21 +7,21 @@ from pathlib import Path
 import pytest
 
 from openscad_runner import *
+from csg_pipeline import CsgPipeline
 
 @pytest.fixture(scope="class")
-def default_parameters(pytestconfig):
-    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-rebuilt-baseplate.json")
-    parameter_file_data = ParameterFile.from_json(parameter_file_path.read_text())
-    return parameter_file_data.parameterSets["Default"]
+def default_parameters(parameter_files):
+    return parameter_files.get("tests/gridfinity-rebuilt-baseplate.json")
 
 @pytest.fixture
-def openscad_runner(pytestconfig, default_parameters) -> OpenScadRunner:
+def openscad_runner(pytestconfig, request, render_session, default_parameters) -> OpenScadRunner:
     scad_path = pytestconfig.rootpath.joinpath('gridfinity-rebuilt-baseplate.scad')
-    scad_runner = OpenScadRunner(scad_path)
+    scad_runner = render_session.make_runner(scad_path, request.node.nodeid)
     scad_runner.image_folder_base = pytestconfig.rootpath.joinpath('images/baseplate/')
     scad_runner.parameters = default_parameters.copy()
     scad_runner.camera_arguments = CameraArguments(Vec3(0,0,0), CameraRotations.AngledBottom, 150)
-    return scad_runner
+    yield scad_runner
+    scad_runner.close()
 
 class TestBasePlateHoles:
     """
@@ -34,9 +34,10 @@ class TestBasePlateHoles:
         vars = openscad_runner.parameters
         vars["enable_magnet"] = False
         vars["style_hole"] = 0
-        openscad_runner.create_image([], Path('no_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('no_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('no_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('no_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
 
     def test_plain_magnet_holes(self, openscad_runner):
         vars = openscad_runner.parameters
@@ -44,9 +45,10 @@ class TestBasePlateHoles:
         vars["style_hole"] = 0
         vars["chamfer_holes"] = False
         vars["crush_ribs"] = False
-        openscad_runner.create_image([], Path('magnet_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('plain_magnet_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('magnet_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('plain_magnet_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
 
     def test_chamfered_magnet_holes(self, openscad_runner):
         vars = openscad_runner.parameters
@@ -79,17 +81,19 @@ class TestBasePlateHoles:
         vars = openscad_runner.parameters
         vars["enable_magnet"] = False
         vars["style_hole"] = 1
-        openscad_runner.create_image([], Path('only_countersunk_screw_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('only_countersunk_screw_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('only_countersunk_screw_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('only_countersunk_screw_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
 
     def test_only_counterbored_screw_holes(self, openscad_runner):
         vars = openscad_runner.parameters
         vars["enable_magnet"] = False
         vars["style_hole"] = 2
-        openscad_runner.create_image([], Path('only_counterbored_screw_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('only_counterbored_screw_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('only_counterbored_screw_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('only_counterbored_screw_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
 
     def test_magnet_and_countersunk_screw_holes(self, openscad_runner):
         vars = openscad_runner.parameters
@@ -97,9 +101,10 @@ class TestBasePlateHoles:
         vars["chamfer_holes"] = False
         vars["crush_ribs"] = False
         vars["style_hole"] = 1
-        openscad_runner.create_image([], Path('magnet_and_countersunk_screw_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('magnet_and_countersunk_screw_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('magnet_and_countersunk_screw_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('magnet_and_countersunk_screw_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
 
     def test_magnet_and_counterbored_screw_holes(self, openscad_runner):
         vars = openscad_runner.parameters
@@ -107,6 +112,28 @@ class TestBasePlateHoles:
         vars["chamfer_holes"] = False
         vars["crush_ribs"] = False
         vars["style_hole"] = 2
-        openscad_runner.create_image([], Path('magnet_and_counterbored_screw_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)
-        openscad_runner.create_image([], Path('magnet_and_counterbored_screw_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('magnet_and_counterbored_screw_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('magnet_and_counterbored_screw_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.AngledTop)),
+        ])
+
+class TestCsgPipeline:
+
+    def test_ignored_parameters_share_render(self, openscad_runner, tmp_path):
+        """
+         Minimal baseplates have no holes, so the hole style does not change the model.
+        """
+        openscad_runner.image_folder_base = tmp_path
+        openscad_runner.stats_log_path = tmp_path.joinpath('stats.jsonl')
+        openscad_runner.parameters["style_plate"] = 0
+        jobs = []
+        for style_hole in (0, 1):
+            openscad_runner.parameters["style_hole"] = style_hole
+            jobs.append(openscad_runner.make_job([], Path(f'minimal_hole_style_{style_hole}.png')))
+
+        results = CsgPipeline(openscad_runner).run(jobs)
+        assert all(result.ok for result in results)
+        assert tmp_path.joinpath('minimal_hole_style_1.png').exists()
+        png_renders = [stats for stats in load_stats_log(openscad_runner.stats_log_path)
+            if stats["job"]["output_file_name"].endswith('.png')]
+        assert len(png_renders) == 1
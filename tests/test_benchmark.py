@@ -0,0 +1,44 @@
+"""
+Tests for benchmark.py
+"""
+
+from typing import Optional
+import pytest
+
+from benchmark import BenchmarkPoint, compare, summarize
+
+def _point(series: str, grid: int, wall_time_s: float, peak_rss_bytes: int = 1000, gridy: Optional[int] = None) -> BenchmarkPoint:
+    '''A `grid` x `grid` point, unless `gridy` is given.'''
+    return BenchmarkPoint(series=series, gridx=grid, gridy=gridy if gridy != None else grid, succeeded=True,
+        wall_time_s=wall_time_s, cpu_time_s=wall_time_s, peak_rss_bytes=peak_rss_bytes)
+
+class TestScaling:
+
+    def test_summarize(self):
+        summary = summarize([_point("a", 2, 4.0), _point("a", 1, 1.0), _point("a", 2, 2.0, gridy=1),
+            _point("a", 1, 2.0, gridy=2), _point("b", 1, 1.0)])
+        assert [(p["gridx"], p["gridy"]) for p in summary["a"]["points"]] == [(1, 1), (1, 2), (2, 1), (2, 2)]
+        # Time grows with the number of bases (gridx * gridy).
+        assert summary["a"]["time_exponent"] == pytest.approx(1)
+        assert summary["a"]["time_grid_exponents"] == pytest.approx((1, 1))
+        assert summary["b"]["time_exponent"] == None
+        assert summary["b"]["time_grid_exponents"] == None
+
+class TestCompare:
+
+    def test_regression(self):
+        baseline = summarize([_point("a", 1, 1.0), _point("a", 2, 2.0)])
+        current = summarize([_point("a", 1, 1.1), _point("a", 2, 3.0)])
+        regressions = compare(current, baseline, threshold=0.2)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("a 2x2 wall_time_s")
+
+    def test_memory_regression(self):
+        baseline = summarize([_point("a", 1, 1.0, 1000)])
+        current = summarize([_point("a", 1, 1.0, 2000)])
+        assert len(compare(current, baseline, threshold=0.2)) == 1
+
+    def test_new_series_ignored(self):
+        baseline = summarize([_point("a", 1, 1.0)])
+        current = summarize([_point("a", 2, 10.0), _point("b", 1, 10.0)])
+        assert compare(current, baseline, threshold=0.2) == []
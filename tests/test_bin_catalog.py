@@ -0,0 +1,77 @@
+"""
+Tests for bin_catalog.py
+"""
+
+import numpy as np
+import pytest
+
+from bin_catalog import *
+
+@pytest.fixture(scope="module")
+def bin_parameters(pytestconfig):
+    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-rebuilt-bins.json")
+    return ParameterFile.from_json(parameter_file_path.read_text()).parameterSets["Default"]
+
+def _compartments(**parameters) -> dict:
+    return {"gridx": 3, "gridy": 2, "divx": 3, "divy": 1, "cut_cylinders": False, "style_tab": 1, "scoop": 1} | parameters
+
+class TestRotation:
+
+    def test_symmetric(self):
+        assert is_rotation_symmetric(_compartments(divx=0))
+        assert is_rotation_symmetric(_compartments(cut_cylinders=True))
+        assert is_rotation_symmetric(_compartments(style_tab=5, scoop=0))
+        # Tabs and scoops are always on the same side.
+        assert not is_rotation_symmetric(_compartments())
+        assert not is_rotation_symmetric(_compartments(style_tab=5))
+
+    def test_canonical(self):
+        rotated = rotate_to_canonical(_compartments(cut_cylinders=True))
+        assert (rotated["gridx"], rotated["gridy"], rotated["divx"], rotated["divy"]) == (2, 3, 1, 3)
+        assert rotate_to_canonical(rotated) == rotated
+        assert rotate_to_canonical(_compartments()) == _compartments()
+
+class TestPlanCatalog:
+
+    def test_rotations_share_artifact(self, bin_parameters):
+        sweep = bin_catalog_sweep(bin_parameters, [1, 2, 3], [3])
+        artifacts = plan_catalog(sweep)
+        assert sum(len(artifact.variants) for artifact in artifacts) == 9 * 2 * 48
+        # 6 sizes with gridx <= gridy, 2 lips, and 26 unique hole options.
+        assert len(artifacts) == 6 * 2 * 26
+        for artifact in artifacts:
+            assert artifact.parameters["gridx"] <= artifact.parameters["gridy"]
+            for (parameters, rotation) in artifact.variants:
+                assert rotation == (90 if parameters["gridx"] > parameters["gridy"] else 0)
+
+    def test_orientation_dependent(self, bin_parameters):
+        sweep = bin_catalog_sweep(bin_parameters | {"divx": 1.0, "divy": 1.0, "style_tab": 1.0}, [1, 2, 3], [3])
+        assert len(plan_catalog(sweep)) == 9 * 2 * 26
+
+# Defaults are a solid bin, which is rotation symmetric.
+
+def test_incremental_update(pytestconfig, bin_parameters, tmp_path):
+    runner = OpenScadRunner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad'))
+    sweep = ParameterSweep(bin_parameters, {"gridx": [1, 2], "gridy": [1, 2]},
+        normalizers=[rotate_to_canonical])
+    with BinCatalog(tmp_path) as catalog, runner:
+        assert len(catalog.update(sweep, runner)) == 3
+        assert catalog.update(sweep, runner) == []
+        [entry] = catalog.find(gridx=2, gridy=1)
+        assert entry.rotation == 90
+        assert entry.path.exists()
+        assert entry.metrics["triangle_count"] > 0
+        with pytest.raises(ValueError):
+            catalog.find(grid_x=2)
+        # A removed file is rendered again.
+        entry.path.unlink()
+        assert len(catalog.update(sweep, runner)) == 1
+        assert len(catalog.find()) == 4
+
+def test_find_unknown_parameter(tmp_path):
+    with BinCatalog(tmp_path) as catalog:
+        assert catalog.find() == []
+        with pytest.raises(ValueError):
+            catalog.find(gridx=1)
+        with pytest.raises(ValueError):
+            catalog.find(**{"gridx') = 1 OR 1 = 1 --": 1})
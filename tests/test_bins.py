@@ -9,19 +9,18 @@ import pytest
 from openscad_runner import *
 
 @pytest.fixture(scope="class")
-def default_parameters(pytestconfig):
-    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-rebuilt-bins.json")
-    parameter_file_data = ParameterFile.from_json(parameter_file_path.read_text())
-    return parameter_file_data.parameterSets["Default"]
+def default_parameters(parameter_files):
+    return parameter_files.get("tests/gridfinity-rebuilt-bins.json")
 
 @pytest.fixture
-def openscad_runner(pytestconfig, default_parameters) -> OpenScadRunner:
+def openscad_runner(pytestconfig, request, render_session, default_parameters) -> OpenScadRunner:
     scad_path = pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad')
-    scad_runner = OpenScadRunner(scad_path)
+    scad_runner = render_session.make_runner(scad_path, request.node.nodeid)
     scad_runner.image_folder_base = pytestconfig.rootpath.joinpath('images/base_hole_options/')
     scad_runner.parameters = default_parameters.copy()
     scad_runner.camera_arguments = CameraArguments(Vec3(0,0,0), CameraRotations.AngledBottom, 150)
-    return scad_runner
+    yield scad_runner
+    scad_runner.close()
 
 class TestBinHoles:
     """
@@ -157,3 +156,60 @@ class TestBinHoles:
         vars["chamfer_holes"] = True
         vars["printable_hole_top"] = True
         openscad_runner.create_image([], Path('magnet_and_screw_holes_all.png'))
+
+class TestBinMesh:
+    """
+    Test the exported geometry of a bin.
+    """
+
+    @pytest.fixture(autouse=True)
+    def mesh_output(self, openscad_runner, tmp_path):
+        # STL files must never be committed.
+        openscad_runner.image_folder_base = tmp_path
+
+    def test_default_bin(self, openscad_runner):
+        mesh = openscad_runner.create_mesh([], Path('default.stl'))
+        [bounding_box] = openscad_runner.evaluate(["bin_get_bounding_box(bin1)"])
+        assert mesh.non_manifold_edge_count() == 0
+        assert mesh.volume() > 0
+        assert mesh.size() == pytest.approx(bounding_box, abs=0.05)
+
+    def test_larger_bin(self, openscad_runner):
+        vars = openscad_runner.parameters
+        vars["gridx"] = 2
+        vars["gridy"] = 3
+        vars["gridz"] = 3
+        mesh = openscad_runner.create_mesh([], Path('larger.stl'))
+        [bounding_box] = openscad_runner.evaluate(["bin_get_bounding_box(bin1)"])
+        assert mesh.non_manifold_edge_count() == 0
+        assert mesh.size() == pytest.approx(bounding_box, abs=0.05)
+
+class TestBinDimensions:
+    """
+    Test bin size calculations.  No geometry is rendered.
+    """
+
+    def test_bounding_box(self, openscad_runner):
+        vars = openscad_runner.parameters
+        vars["gridx"] = 2
+        vars["gridy"] = 3
+        # `stacking_lip_height()` is not visible from "gridfinity-rebuilt-bins.scad".
+        [bounding_box, stacking_lip_height] = openscad_runner.evaluate(
+            ["bin_get_bounding_box(bin1)", "bin_get_height_breakdown(bin1)[8][1]"])
+        # 42mm grid, minus the 0.5mm gap.  6 units of height, plus the stacking lip.
+        assert bounding_box == pytest.approx([2*42 - 0.5, 3*42 - 0.5, 6*7 + stacking_lip_height])
+
+    def test_height(self, openscad_runner):
+        results = openscad_runner.evaluate([
+            "height(6, 0, false)",
+            "height(40, 2, false)",
+            "height(40, 2, true)",
+            "z_snap(43)",
+        ])
+        assert results == pytest.approx([42, 40, 42, 49])
+
+    def test_height_breakdown(self, openscad_runner):
+        [breakdown, bounding_box] = openscad_runner.evaluate(
+            ["bin_get_height_breakdown(bin1)", "bin_get_bounding_box(bin1)"])
+        assert breakdown[0][0] == "Total: "
+        assert breakdown[0][1] == pytest.approx(bounding_box[2])
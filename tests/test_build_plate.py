@@ -0,0 +1,106 @@
+"""
+Tests for build_plate.py
+"""
+
+from pathlib import Path
+import numpy as np
+import pytest
+
+from build_plate import *
+from mesh import load_mesh, write_binary_stl
+
+# Unit cube, outward facing triangles.
+_CUBE_VERTICES = np.array([
+    (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+    (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1),
+], dtype=np.float64)
+_CUBE_TRIANGLES = [t for (a, b, c, d) in [
+        (0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4),
+        (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7),
+    ] for t in ((a, b, c), (a, c, d))]
+
+def _write_box(path: Path, size, origin=(0, 0, 0)) -> Path:
+    '''Binary STL of a box.'''
+    write_binary_stl(path, [(_CUBE_VERTICES * size + origin)[_CUBE_TRIANGLES]], b'box')
+    return path
+
+def _bin(gridx: float, gridy: float, name: str = "bin") -> PlateItem:
+    return PlateItem(Path(f"{name}.stl"), gridx, gridy)
+
+def _overlaps(a: Placement, b: Placement) -> bool:
+    ((ax, ay), (bx, by)) = (a.size_mm(), b.size_mm())
+    return a.x < b.x + bx and b.x < a.x + ax and a.y < b.y + by and b.y < a.y + ay
+
+class TestPlateItem:
+
+    def test_parse(self):
+        assert PlateItem.parse("bins/a:b.stl:2x1.5") == PlateItem(Path("bins/a:b.stl"), 2, 1.5)
+
+    def test_measured(self, tmp_path):
+        # Bins are `BASE_GAP_MM` smaller than their footprint.  Position does not matter.
+        path = _write_box(tmp_path.joinpath("bin.stl"), (2 * 42 - BASE_GAP_MM[0], 1.5 * 42 - BASE_GAP_MM[1], 30), (-40, 7, -3))
+        assert PlateItem.parse(str(path)) == PlateItem(path, 2, 1.5)
+
+class TestPackPlates:
+
+    def test_fills_plates(self):
+        items = [_bin(2, 2, str(i)) for i in range(5)]
+        plates = pack_plates(items, (180, 180))
+        assert [len(plate) for plate in plates] == [4, 1]
+        for plate in plates:
+            for (i, a) in enumerate(plate):
+                (width, depth) = a.size_mm()
+                assert a.x + width <= 180 and a.y + depth <= 180
+                assert not any(_overlaps(a, b) for b in plate[i + 1:])
+        # Spacing between neighbors.
+        assert sorted({placement.x for placement in plates[0]}) == [0, 84.5]
+
+    def test_rows(self):
+        [plate] = pack_plates([_bin(1, 1, "small"), _bin(3, 2, "large"), _bin(1, 1, "small")], (180, 130))
+        # Largest first.  The first small bin fits beside it, in the same row.
+        assert [(placement.item.mesh_path.stem, placement.x, placement.y) for placement in plate] == \
+            [("large", 0, 0), ("small", 126.5, 0), ("small", 0, 84.5)]
+
+    def test_rotation(self):
+        [[placement]] = pack_plates([_bin(1, 4)], (200, 100))
+        assert placement.rotated
+        assert placement.size_mm() == (168, 42)
+        [[placement]] = pack_plates([_bin(1, 4)], (100, 200))
+        assert not placement.rotated
+
+    def test_too_large(self):
+        with pytest.raises(ValueError, match="does not fit"):
+            pack_plates([_bin(5, 5)], (200, 200))
+
+class TestWritePlate:
+
+    @pytest.fixture
+    def placements(self, tmp_path):
+        items = [
+            PlateItem(_write_box(tmp_path.joinpath("a.stl"), (83.5, 41.5, 20), (-41.75, -20.75, 0)), 2, 1),
+            PlateItem(_write_box(tmp_path.joinpath("b.stl"), (41.5, 125.5, 10), (100, 100, -5)), 1, 3),
+        ]
+        [placements] = pack_plates(items, (220, 220))
+        return placements
+
+    @pytest.mark.parametrize("suffix", [".stl", ".3mf"])
+    def test_round_trip(self, placements, tmp_path, suffix):
+        output_path = tmp_path.joinpath("plate" + suffix)
+        assert write_plate(placements, output_path) == 24
+        mesh = load_mesh(output_path)
+        assert mesh.volume() == pytest.approx(83.5 * 41.5 * 20 + 41.5 * 125.5 * 10, rel=1e-5)
+        (minimum, maximum) = mesh.bounding_box()
+        assert minimum[2] == pytest.approx(0)
+        assert all(minimum[:2] >= 0) and all(maximum[:2] <= 220)
+
+    def test_centered_on_footprint(self, placements, tmp_path):
+        output_path = tmp_path.joinpath("plate.stl")
+        write_plate([placements[0]], output_path)
+        (minimum, maximum) = load_mesh(output_path).bounding_box()
+        (center_x, center_y) = placements[0].center_mm()
+        assert (minimum[0] + maximum[0]) / 2 == pytest.approx(center_x, abs=1e-4)
+        assert (minimum[1] + maximum[1]) / 2 == pytest.approx(center_y, abs=1e-4)
+
+def test_plate_file_names():
+    assert plate_file_names(Path("out/plate.stl"), 1) == [Path("out/plate.stl")]
+    assert plate_file_names(Path("out/plate.stl"), 2) == [Path("out/plate-1.stl"), Path("out/plate-2.stl")]
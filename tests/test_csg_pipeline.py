@@ -0,0 +1,17 @@
+"""
+Tests for csg_pipeline.py
+"""
+
+import pytest
+
+from csg_pipeline import split_arguments
+
+@pytest.mark.parametrize("args, expected", [
+    ((), ((), ())),
+    (('-D', 'gridx=2', '-Dgridy=3'), (('-D', 'gridx=2', '-Dgridy=3'), ())),
+    (('--export-format=binstl',), ((), ('--export-format=binstl',))),
+    (('--enable=textmetrics', '-D', 'x=1', '--export-format=binstl'),
+        (('--enable=textmetrics', '-D', 'x=1'), ('--enable=textmetrics', '--export-format=binstl'))),
+])
+def test_split_arguments(args, expected):
+    assert(split_arguments(args) == expected)
@@ -0,0 +1,121 @@
+"""
+Tests for customizer_schema.py
+"""
+
+import re
+import pytest
+
+from customizer_schema import *
+from openscad_runner import ParameterFile
+
+SOURCE = '''
+/*
+ * Not a section.
+ * size = 1;
+ */
+include <src/core/standard.scad>
+
+/* [General] */
+// number of bases
+size = 2;
+// height, in mm
+height = 6; //.1
+style = 1; // [0: thin, 1:weighted, 2:skeletonized]
+count = 1; // [1:3]
+fit = 0; // [-1:0.1:1]
+name = "bin"; // [8]
+shape = "round"; // [round, square]
+offset = [0, 0, 0];
+enabled = true;
+
+/* [Hidden] */
+derived = size * 42;
+if (enabled) {
+    inside = 1;
+}
+secret = 3;
+
+module not_a_parameter() {}
+after = 1;
+'''
+
+@pytest.fixture
+def schema() -> CustomizerSchema:
+    return parse_schema(SOURCE, "test.scad")
+
+class TestParse:
+
+    def test_parameters(self, schema):
+        assert list(schema.parameters) == ["size", "height", "style", "count", "fit", "name", "shape", "offset", "enabled", "secret"]
+        assert schema.sections() == {
+            "General": ["size", "height", "style", "count", "fit", "name", "shape", "offset", "enabled"],
+            "Hidden": ["secret"],
+        }
+        assert schema.defaults()["offset"] == [0, 0, 0]
+
+    def test_annotations(self, schema):
+        size = schema.parameters["size"]
+        assert (size.kind, size.default, size.description) == (ParameterKinds.Number, 2, "number of bases")
+        assert schema.parameters["height"].step == 0.1
+        style = schema.parameters["style"]
+        assert style.kind == ParameterKinds.Int
+        assert style.choices == {0: "thin", 1: "weighted", 2: "skeletonized"}
+        count = schema.parameters["count"]
+        assert (count.kind, count.minimum, count.maximum) == (ParameterKinds.Int, 1, 3)
+        fit = schema.parameters["fit"]
+        assert (fit.kind, fit.minimum, fit.step, fit.maximum) == (ParameterKinds.Number, -1, 0.1, 1)
+        assert schema.parameters["name"].maximum == 8
+        assert list(schema.parameters["shape"].choices) == ["round", "square"]
+        assert schema.parameters["offset"].kind == ParameterKinds.Vector
+        assert schema.parameters["enabled"].kind == ParameterKinds.Bool
+
+    def test_baseplate(self, pytestconfig):
+        schema = load_schema(pytestconfig.rootpath.joinpath("gridfinity-rebuilt-baseplate.scad"))
+        assert schema.parameters["style_plate"].kind == ParameterKinds.Int
+        assert schema.parameters["style_plate"].choices[3] == "screw together"
+        assert schema.parameters["style_hole"].choices == {0: "none", 1: "countersink", 2: "counterbore"}
+        assert "hole_options" not in schema.parameters
+        # Cached.
+        assert load_schema(pytestconfig.rootpath.joinpath("gridfinity-rebuilt-baseplate.scad")) is schema
+
+class TestCoerce:
+
+    def test_customizer_strings(self, schema):
+        assert schema.coerce({"size": "1.5", "style": "2", "count": 3.0, "enabled": "false", "offset": "[1, 2, 3]"}) == \
+            {"size": 1.5, "style": 2, "count": 3, "enabled": False, "offset": [1.0, 2.0, 3.0]}
+        assert type(schema.coerce({"style": 2.0})["style"]) == int
+
+    @pytest.mark.parametrize(("parameters", "message"), [
+        ({"sizee": 1}, 'Unknown parameter "sizee".  Did you mean "size"?'),
+        ({"style": 3}, "not one of 0 (thin), 1 (weighted), 2 (skeletonized)"),
+        ({"style": 1.5}, "expected a whole number"),
+        ({"count": 4}, "outside 1 to 3"),
+        ({"fit": -2}, "outside -1 to 1"),
+        ({"enabled": 1}, "expected true or false"),
+        ({"size": "large"}, '"size"'),
+        ({"name": "much too long"}, "longer than 8 characters"),
+        ({"shape": "hexagon"}, "not one of"),
+        ({"offset": [1, 2]}, "expected a vector of 3 numbers"),
+    ])
+    def test_invalid(self, schema, parameters, message):
+        with pytest.raises(SchemaError, match=re.escape(message)):
+            schema.coerce(parameters)
+
+    def test_every_error_reported(self, schema):
+        with pytest.raises(SchemaError, match='"count".*"fit"'):
+            schema.coerce({"count": 0, "fit": 5})
+
+@pytest.mark.parametrize(("scad_file", "parameter_file"), [
+    ("gridfinity-rebuilt-bins.scad", "tests/gridfinity-rebuilt-bins.json"),
+    ("gridfinity-rebuilt-baseplate.scad", "tests/gridfinity-rebuilt-baseplate.json"),
+    ("gridfinity-spiral-vase.scad", "tests/gridfinity-spiral-vase.json"),
+])
+def test_parameter_files(pytestconfig, scad_file, parameter_file):
+    file = ParameterFile.from_json(pytestconfig.rootpath.joinpath(parameter_file).read_text())
+    coerced = file.coerced(pytestconfig.rootpath.joinpath(scad_file))
+    assert coerced.parameterSets.keys() == file.parameterSets.keys()
+    schema = load_schema(pytestconfig.rootpath.joinpath(scad_file))
+    for parameters in coerced.parameterSets.values():
+        for (name, value) in parameters.items():
+            if schema.parameters[name].kind == ParameterKinds.Int:
+                assert type(value) == int
@@ -0,0 +1,78 @@
+"""
+Tests for drawer_planner.py
+"""
+
+import json
+import pytest
+
+from drawer_planner import AxisPiece, Tile, main, plan_drawer, split_axis
+
+class TestSplitAxis:
+
+    def test_fits_on_bed(self):
+        assert(split_axis(200, 220) == [AxisPiece(4, 16, 16)])
+
+    def test_fewest_pieces(self):
+        # 14 bases, 6mm of padding on each side.  A 180mm bed fits at most 4 bases.
+        pieces = split_axis(600, 180)
+        assert([piece.bases for piece in pieces] == [3, 4, 4, 3])
+        assert((pieces[0].padding_before, pieces[-1].padding_after) == (6, 6))
+        assert(all(piece.padding_after == 0 for piece in pieces[:-1]))
+
+    def test_padding_reduces_edge_capacity(self):
+        # 9 bases, and 22mm of padding.  5 bases (210mm) fit on the bed, but not with the padding.
+        assert(split_axis(400, 220, fit=1) == [AxisPiece(5, 0, 0), AxisPiece(4, 0, 22)])
+        assert(split_axis(400, 220, fit=-1) == [AxisPiece(4, 22, 0), AxisPiece(5, 0, 0)])
+        assert([piece.bases for piece in split_axis(400, 220, fit=0)] == [3, 3, 3])
+
+    def test_odd_count_symmetric(self):
+        # 14 bases in 3 pieces.  The extra bases go to both edges, not the middle and one edge.
+        sizes = [piece.bases for piece in split_axis(600, 220)]
+        assert(sizes == [5, 4, 5])
+        assert(sizes == sizes[::-1])
+        assert([piece.bases for piece in split_axis(13 * 42, 220)] == [4, 5, 4])
+
+    def test_bed_too_small(self):
+        with pytest.raises(ValueError):
+            split_axis(400, 30)
+
+def test_rotation():
+    tile = Tile(gridx=3, gridy=4, distancex=132, distancey=0, fitx=-1, fity=0)
+    assert(tile.rotated().rotated() == Tile(3, 4, 132, 0, 1, 0))
+    assert(tile.rotated().rotated().rotated().rotated() == tile)
+    (canonical, rotation) = tile.canonical()
+    for _ in range(rotation // 90):
+        canonical = canonical.rotated()
+    assert(canonical == tile)
+
+class TestPlanDrawer:
+
+    def test_rotations_share_render(self):
+        plan = plan_drawer((600, 400), (180, 180))
+        assert((len(plan.columns), len(plan.rows)) == (4, 3))
+        assert(len(plan.placements) == 12)
+        # Corners padded on opposite sides, interior, and two kinds of edge.
+        assert(sorted(plan.counts()) == [2, 2, 2, 2, 4])
+
+    def test_symmetric_tiles_shared(self):
+        plan = plan_drawer((600, 400), (220, 220))
+        assert((len(plan.columns), len(plan.rows)) == (3, 3))
+        # Opposite corners and opposite edges are rotations of each other.
+        assert(len(plan.placements) == 9)
+        assert(len(plan.unique_tiles) == 5)
+
+    def test_covers_drawer(self):
+        plan = plan_drawer((600, 400), (220, 220), clearance_mm=1)
+        assert(plan.drawer_mm == (599, 399))
+        width = sum(piece.bases * 42 + piece.padding_before + piece.padding_after for piece in plan.columns)
+        depth = sum(piece.bases * 42 + piece.padding_before + piece.padding_after for piece in plan.rows)
+        assert((width, depth) == pytest.approx((599, 399)))
+        for tile in plan.unique_tiles:
+            assert(max(tile.gridx * 42, tile.distancex) <= 220)
+            assert(max(tile.gridy * 42, tile.distancey) <= 220)
+
+def test_dry_run(tmp_path):
+    assert(main(["600", "400", str(tmp_path), "--bed", "180", "180", "--dry-run"]) == 0)
+    manifest = json.loads(tmp_path.joinpath("manifest.json").read_text())
+    assert(sum(tile["count"] for tile in manifest["tiles"]) == len(manifest["placements"]) == 12)
+    assert(not list(tmp_path.glob("*.stl")))
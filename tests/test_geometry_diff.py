@@ -0,0 +1,89 @@
+"""
+Tests for geometry_diff.py
+"""
+
+import struct
+import tarfile
+from pathlib import Path
+import numpy as np
+import pytest
+
+from geometry_diff import checkout_revision, compare_meshes, mesh_file_names, point_triangle_distance
+
+def _box_triangles(size=(10, 10, 10), split: int = 1):
+    '''Closed box, each face split into `split` x `split` squares.'''
+    triangles = []
+    steps = np.linspace(0, 1, split + 1)
+    for axis in range(3):
+        (u, v) = ((axis + 1) % 3, (axis + 2) % 3)
+        for side in (0, 1):
+            for (i, j) in np.ndindex(split, split):
+                corners = []
+                for (du, dv) in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                    corner = np.zeros(3)
+                    corner[axis] = side * size[axis]
+                    corner[u] = steps[i + du] * size[u]
+                    corner[v] = steps[j + dv] * size[v]
+                    corners.append(corner)
+                (a, b, c, d) = corners if side else corners[::-1]
+                triangles += [(a, b, c), (a, c, d)]
+    return np.array(triangles)
+
+def _write_binary_stl(path: Path, triangles) -> Path:
+    with open(path, 'wb') as file:
+        file.write(b'binary'.ljust(80, b' '))
+        file.write(struct.pack('<I', len(triangles)))
+        for triangle in triangles:
+            file.write(struct.pack('<12fH', 0, 0, 0, *np.asarray(triangle).flatten(), 0))
+    return path
+
+def test_point_triangle_distance():
+    triangle = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=float)
+    points = np.array([
+        [0.25, 0.25, 2],  # Above the face
+        [-1, -1, 0],  # Past a corner
+        [0.5, -3, 4],  # Past an edge
+        [1, 1, 0],  # Past the hypotenuse
+    ], dtype=float)
+    distances = point_triangle_distance(points, np.repeat(triangle[None], len(points), axis=0))
+    assert(distances == pytest.approx([2, np.sqrt(2), 5, np.sqrt(0.5)]))
+
+class TestCompareMeshes:
+
+    def test_identical_files(self, tmp_path):
+        old = _write_binary_stl(tmp_path.joinpath('old.stl'), _box_triangles())
+        new = _write_binary_stl(tmp_path.joinpath('new.stl'), _box_triangles())
+        assert(compare_meshes(old, new).identical)
+
+    def test_retriangulated(self, tmp_path):
+        '''Same shape, different triangles.'''
+        old = _write_binary_stl(tmp_path.joinpath('old.stl'), _box_triangles())
+        new = _write_binary_stl(tmp_path.joinpath('new.stl'), _box_triangles(split=4))
+        difference = compare_meshes(old, new, sample_count=5000)
+        assert(not difference.identical)
+        assert(difference.hausdorff_distance < 1e-5)
+        assert(difference.volume_delta == pytest.approx(0, abs=1e-3))
+        assert((difference.old_triangle_count, difference.new_triangle_count) == (12, 192))
+        assert(not difference.drifted(tolerance=1e-3))
+
+    def test_moved_face(self, tmp_path):
+        old = _write_binary_stl(tmp_path.joinpath('old.stl'), _box_triangles())
+        new = _write_binary_stl(tmp_path.joinpath('new.stl'), _box_triangles(size=(10, 10, 10.5)))
+        difference = compare_meshes(old, new, sample_count=5000)
+        assert(difference.hausdorff_distance == pytest.approx(0.5, abs=1e-5))
+        assert(difference.bounding_box_delta == pytest.approx(0.5, abs=1e-5))
+        assert(difference.relative_volume_delta == pytest.approx(0.05, rel=1e-4))
+        assert(difference.drifted(tolerance=0.1))
+
+def test_checkout_revision(pytestconfig, tmp_path):
+    checkout_revision(pytestconfig.rootpath, "HEAD", tmp_path)
+    assert(tmp_path.joinpath('gridfinity-rebuilt-bins.scad').exists())
+
+def test_checkout_revision_without_filters(pytestconfig, tmp_path, monkeypatch):
+    monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    checkout_revision(pytestconfig.rootpath, "HEAD", tmp_path)
+    assert(tmp_path.joinpath('gridfinity-rebuilt-bins.scad').exists())
+
+def test_mesh_file_names():
+    names = mesh_file_names({"Default": {}, "../../escape": {}, "a/b": {}, "a_b": {}})
+    assert(names == {"Default": "0-Default.stl", "../../escape": "1-_escape.stl", "a/b": "2-a_b.stl", "a_b": "3-a_b.stl"})
@@ -0,0 +1,18 @@
+"""
+Tests for gridfinity_standard.py
+"""
+
+import re
+
+from gridfinity_standard import *
+from scad_values import parse_scad_value
+
+def test_matches_standard_scad(pytestconfig):
+    '''Every constant still has the value assigned in "src/core/standard.scad".'''
+    standard = pytestconfig.rootpath.joinpath('src/core/standard.scad').read_text()
+    for (name, value) in (('GRID_DIMENSIONS_MM', GRID_DIMENSIONS_MM), ('BASE_TOP_DIMENSIONS', BASE_TOP_DIMENSIONS)):
+        match = re.search(rf'^{name}\s*=\s*([^;]*);', standard, re.MULTILINE)
+        assert match != None
+        assert tuple(parse_scad_value(match[1])) == value
+    assert re.search(r'^BASE_GAP_MM\s*=\s*GRID_DIMENSIONS_MM - BASE_TOP_DIMENSIONS;', standard, re.MULTILINE)
+    assert BASE_GAP_MM == (0.5, 0.5)
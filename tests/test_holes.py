@@ -9,12 +9,13 @@ import pytest
 from openscad_runner import *
 
 @pytest.fixture
-def openscad_runner(pytestconfig) -> OpenScadRunner:
+def openscad_runner(pytestconfig, request, render_session) -> OpenScadRunner:
     scad_path = pytestconfig.rootpath.joinpath('src/core/gridfinity-rebuilt-holes.scad')
-    scad_runner = OpenScadRunner(scad_path)
+    scad_runner = render_session.make_runner(scad_path, request.node.nodeid)
     scad_runner.image_folder_base = pytestconfig.rootpath.joinpath('images/hole_cutouts/')
     scad_runner.camera_arguments = CameraArguments(Vec3(0,0,0), CameraRotations.AngledTop, 50)
-    return scad_runner
+    yield scad_runner
+    scad_runner.close()
 
 class TestHoleCutouts:
     """
@@ -0,0 +1,118 @@
+"""
+Tests for image_compare.py
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import pytest
+
+from image_compare import (RENDERED_IMAGES, Tolerance, compare_committed, compare_folders, compare_image,
+    perceptual_hash, ssim, update_golden)
+
+def _scene(height: int = 90, width: int = 160):
+    '''Gradient background with a few boxes, like a render.'''
+    (y, x) = np.mgrid[0:height, 0:width]
+    image = np.stack([x * 255 // width, y * 255 // height, np.full_like(x, 128)], axis=2).astype(np.uint8)
+    image[30:60, 50:110] = (230, 200, 40)
+    image[5:25, 10:40] = (20, 20, 20)
+    image[65:85, 120:150] = (250, 250, 250)
+    return image
+
+def _save(path: Path, image) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(image).save(path)
+    return path
+
+class TestCompareImage:
+
+    def test_identical(self, tmp_path):
+        image = _save(tmp_path.joinpath('new.png'), _scene())
+        golden = _save(tmp_path.joinpath('golden.png'), _scene())
+        comparison = compare_image(image, golden)
+        assert(comparison.passed)
+        assert(comparison.ssim == 1.0)
+        assert(comparison.hash_distance == 0)
+
+    def test_noise_within_tolerance(self, tmp_path):
+        noisy = _scene().astype(np.int16) + np.random.default_rng(0).integers(-3, 4, _scene().shape)
+        image = _save(tmp_path.joinpath('new.png'), np.clip(noisy, 0, 255).astype(np.uint8))
+        golden = _save(tmp_path.joinpath('golden.png'), _scene())
+        comparison = compare_image(image, golden, Tolerance(min_ssim=0.9))
+        assert(comparison.passed)
+        assert(comparison.changed_fraction == 0)
+
+    def test_changed_region_fails(self, tmp_path):
+        changed = _scene()
+        changed[30:60, 50:110] = (40, 40, 40)
+        image = _save(tmp_path.joinpath('new.png'), changed)
+        golden = _save(tmp_path.joinpath('golden.png'), _scene())
+        heatmap = tmp_path.joinpath('heatmaps/new.png')
+
+        comparison = compare_image(image, golden, heatmap_path=heatmap)
+        assert(not comparison.passed)
+        assert(comparison.changed_fraction == pytest.approx(30 * 60 / (90 * 160)))
+        assert(comparison.ssim < 0.99)
+        assert(comparison.heatmap_path == heatmap)
+        assert(Image.open(heatmap).size == (160, 90))
+
+    def test_size_mismatch(self, tmp_path):
+        image = _save(tmp_path.joinpath('new.png'), _scene(height=100))
+        golden = _save(tmp_path.joinpath('golden.png'), _scene())
+        assert(not compare_image(image, golden).passed)
+
+def test_similarity_measures():
+    scene = _scene()
+    inverted = 255 - scene
+    assert(ssim(scene, scene) == pytest.approx(1.0))
+    assert(ssim(scene, inverted) < 0.5)
+    assert(np.count_nonzero(perceptual_hash(scene) != perceptual_hash(inverted)) > 32)
+
+def test_compare_folders(tmp_path):
+    (images, golden) = (tmp_path.joinpath('images'), tmp_path.joinpath('golden'))
+    changed = _scene()
+    changed[0:45] = 0
+    _save(images.joinpath('same.png'), _scene())
+    _save(golden.joinpath('same.png'), _scene())
+    _save(images.joinpath('sub/changed.png'), changed)
+    _save(golden.joinpath('sub/changed.png'), _scene())
+    _save(images.joinpath('new.png'), _scene())
+    _save(golden.joinpath('removed.png'), _scene())
+
+    comparisons = compare_folders(images, golden, max_workers=4)
+    assert({c.golden_path.relative_to(golden).as_posix(): c.passed for c in comparisons} ==
+        {'same.png': True, 'sub/changed.png': False, 'new.png': False, 'removed.png': False})
+
+    update_golden(comparisons)
+    assert([c.golden_path.name for c in compare_folders(images, golden) if not c.passed] == ['removed.png'])
+
+@pytest.mark.skipif(shutil.which('git') == None, reason="Needs git")
+def test_compare_committed(tmp_path):
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+            cwd=tmp_path, check=True, capture_output=True)
+    changed = _scene()
+    changed[0:45] = 0
+    _save(tmp_path.joinpath('images', 'holes', 'a.png'), _scene())
+    _save(tmp_path.joinpath('images', 'bins', 'b.png'), _scene())
+    _save(tmp_path.joinpath('images', 'other', 'c.png'), _scene())
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'images')
+
+    # Rendered over the committed images.
+    _save(tmp_path.joinpath('images', 'bins', 'b.png'), changed)
+    _save(tmp_path.joinpath('images', 'bins', 'new.png'), _scene())
+    # Not compared.
+    _save(tmp_path.joinpath('images', 'other', 'c.png'), changed)
+
+    comparisons = compare_committed(tmp_path, ['images/holes', 'images/bins'], heatmap_folder=tmp_path.joinpath('heatmaps'))
+    assert([(c.image_path.relative_to(tmp_path).as_posix(), c.passed) for c in comparisons] ==
+        [('images/holes/a.png', True), ('images/bins/b.png', False), ('images/bins/new.png', False)])
+    assert(tmp_path.joinpath('heatmaps', 'images', 'bins', 'b.png').exists())
+
+def test_rendered_images_committed(pytestconfig):
+    for folder in RENDERED_IMAGES:
+        assert(list(pytestconfig.rootpath.joinpath(folder).glob('*.png')))
@@ -0,0 +1,152 @@
+"""
+Tests for incremental_build.py
+"""
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+from incremental_build import *
+from openscad_runner import CameraArguments, OpenScadRunner, RenderJob, Vec3
+
+_FAKE_OPENSCAD = '''
+import sys
+with open(sys.argv[sys.argv.index("-o") + 1], "wb") as output:
+    output.write(b"rendered")
+'''
+
+@pytest.fixture
+def root(tmp_path) -> Path:
+    '''bin.scad and plate.scad both use src/core.scad.  Only bin.scad includes src/tab.scad.'''
+    root = tmp_path.joinpath("repository")
+    root.joinpath("src").mkdir(parents=True)
+    root.joinpath("images").mkdir()
+    root.joinpath("src", "core.scad").write_text("module core() { cube(1); }\n")
+    root.joinpath("src", "tab.scad").write_text("include <core.scad>\n")
+    root.joinpath("bin.scad").write_text("gridx = 1;\ninclude <src/tab.scad>\ncore();\n")
+    root.joinpath("plate.scad").write_text("use <src/core.scad>\ncore();\n")
+    return root
+
+@pytest.fixture
+def index(root, tmp_path):
+    with ArtifactIndex(root, tmp_path.joinpath("artifacts.sqlite")) as index:
+        yield index
+
+def _runner(root: Path) -> OpenScadRunner:
+    runner = OpenScadRunner(root.joinpath("bin.scad"))
+    runner.image_folder_base = root.joinpath("images")
+    return runner
+
+def _record(index: ArtifactIndex, runner: OpenScadRunner, scad_file: str, output: str, **job_fields) -> None:
+    job = RenderJob(scad_file_path=index.root.joinpath(scad_file), output_file_name=Path(output), **job_fields)
+    assert index.record(runner, job, 2.0)
+    runner.image_folder_base.joinpath(output).parent.mkdir(parents=True, exist_ok=True)
+    runner.image_folder_base.joinpath(output).write_bytes(b"rendered")
+
+def test_record(index, root):
+    runner = _runner(root)
+    runner.backend = "manifold"
+    camera = CameraArguments(Vec3(1, 2, 3), Vec3(45, 0, 45), 150)
+    _record(index, runner, "bin.scad", "bin.png", parameters={"gridx": 2}, camera_arguments=camera, args=("-D", "a=1"))
+
+    (record,) = index.records()
+    assert record.output == "images/bin.png"
+    assert record.scad_file == "bin.scad"
+    assert record.backend == "manifold"
+    assert record.wall_time_s == 2.0
+    assert record.job(root) == RenderJob(scad_file_path=root.joinpath("bin.scad"),
+        output_file_name=Path("images/bin.png"), parameters={"gridx": 2}, camera_arguments=camera, args=("-D", "a=1"))
+
+    # A cache hit keeps the last real duration.
+    assert index.record(runner, RenderJob(scad_file_path=root.joinpath("bin.scad"), output_file_name=Path("bin.png")))
+    assert index.records()[0].wall_time_s == 2.0
+
+def test_outside_root(index, root, tmp_path):
+    runner = _runner(root)
+    temporary = tmp_path.joinpath("model.csg")
+    temporary.write_text("cube(1);\n")
+    assert not index.record(runner, RenderJob(scad_file_path=temporary, output_file_name=Path("view.png")))
+    runner.image_folder_base = tmp_path
+    assert not index.record(runner, RenderJob(scad_file_path=root.joinpath("bin.scad"), output_file_name=Path("a.png")))
+    assert index.records() == []
+
+def test_stale_changed_files(index, root):
+    runner = _runner(root)
+    _record(index, runner, "bin.scad", "bin.png")
+    _record(index, runner, "plate.scad", "plate.png")
+
+    assert [record.output for record in index.stale(["src/core.scad"])] == ["images/bin.png", "images/plate.png"]
+    assert [record.output for record in index.stale(["src/tab.scad", "README.md"])] == ["images/bin.png"]
+    assert index.stale([]) == []
+
+    root.joinpath("images", "plate.png").unlink()
+    assert [record.output for record in index.stale([])] == ["images/plate.png"]
+
+def test_stale_hashes(index, root):
+    runner = _runner(root)
+    _record(index, runner, "bin.scad", "bin.png")
+    _record(index, runner, "plate.scad", "plate.png")
+    assert index.stale() == []
+
+    root.joinpath("src", "tab.scad").write_text("include <core.scad>\ncube(2);\n")
+    assert [record.output for record in index.stale()] == ["images/bin.png"]
+
+    # Re-recording picks up the new include set.
+    root.joinpath("src", "tab.scad").write_text("cube(2);\n")
+    _record(index, runner, "bin.scad", "bin.png")
+    assert index.stale() == []
+    assert [record.output for record in index.stale(["src/core.scad"])] == ["images/plate.png"]
+
+def test_remove(index, root):
+    _record(index, _runner(root), "bin.scad", "bin.png")
+    index.remove(["images/bin.png"])
+    assert index.records() == []
+    assert index.stale(["src/core.scad"]) == []
+
+def test_estimate_wall_time():
+    assert estimate_wall_time([], 4) == 0
+    assert estimate_wall_time([3.0, 1.0, 2.0], 1) == 6
+    assert estimate_wall_time([3.0, 1.0, 2.0], 2) == 3
+    assert estimate_wall_time([5.0, 4.0, 3.0, 3.0, 3.0], 2) == 10
+    assert estimate_wall_time([1.0], 0) == 1
+
+@pytest.mark.skipif(shutil.which("git") == None, reason="Needs git")
+def test_changed_since(root):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=root, check=True, capture_output=True)
+    git("init", "-q")
+    root.joinpath(".gitignore").write_text("images/\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "initial")
+    root.joinpath("src", "core.scad").write_text("module core() { cube(2); }\n")
+    root.joinpath("src", "lid.scad").write_text("cube(1);\n")
+    root.joinpath("images", "bin.png").write_bytes(b"rendered")
+    assert sorted(changed_since(root, "HEAD")) == ["src/core.scad", "src/lid.scad"]
+
+def test_main_outside_repository(tmp_path, capsys):
+    outside = tmp_path.joinpath("model.scad")
+    outside.write_text("cube(1);\n")
+    assert main([str(outside), "--index", str(tmp_path.joinpath("artifacts.sqlite")), "--dry-run"]) == 0
+    assert "not tracked" in capsys.readouterr().err
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_rebuild(index, root, tmp_path):
+    openscad = tmp_path.joinpath("openscad")
+    openscad.write_text(f"#!{sys.executable}\n" + _FAKE_OPENSCAD)
+    openscad.chmod(0o755)
+    runner = _runner(root)
+    _record(index, runner, "bin.scad", "bin.stl", parameters={"gridx": 2})
+    _record(index, runner, "plate.scad", "plates/plate.stl")
+    root.joinpath("images", "plates", "plate.stl").unlink()
+    root.joinpath("images", "bin.stl").write_bytes(b"old")
+
+    results = rebuild(index, index.stale(["src/tab.scad"]), str(openscad), max_workers=2)
+    assert sorted(str(result.job.output_file_name) for result in results if result.ok) == \
+        ["images/bin.stl", "images/plates/plate.stl"]
+    assert root.joinpath("images", "bin.stl").read_bytes() == b"rendered"
+    assert root.joinpath("images", "plates", "plate.stl").read_bytes() == b"rendered"
+    assert index.stale([]) == []
+    assert all(record.wall_time_s < 2 for record in index.records())
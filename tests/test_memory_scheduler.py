@@ -0,0 +1,89 @@
+"""
+Tests for memory_scheduler.py
+"""
+
+import signal
+import subprocess
+import time
+from pathlib import Path
+import pytest
+
+from memory_scheduler import *
+from openscad_runner import OpenScadRunner, RenderJob, RenderStats, set_variable_argument
+
+def _job(gridx: int, gridy: int = 1, **parameters) -> RenderJob:
+    return RenderJob(Path("gridfinity-rebuilt-bins.scad"), Path(f"{gridx}x{gridy}.png"),
+        {"gridx": gridx, "gridy": gridy, **parameters})
+
+class TestResourceModel:
+
+    def test_power_law(self):
+        model = ResourceModel(memory_margin=1)
+        for grid in (1, 2, 4):
+            model.observe("gridfinity-rebuilt-bins.scad", {"gridx": grid, "gridy": grid}, 1e6 * grid**2, 2.0 * grid)
+        prediction = model.predict(_job(3, 3))
+        assert prediction.peak_rss_bytes == pytest.approx(9e6)
+        assert prediction.wall_time_s == pytest.approx(6)
+
+    def test_hole_options_fitted_separately(self):
+        model = ResourceModel(memory_margin=1)
+        model.observe("gridfinity-rebuilt-bins.scad", {"gridx": 1, "gridy": 1, "magnet_holes": True}, 4e6, 1)
+        model.observe("gridfinity-rebuilt-bins.scad", {"gridx": 1, "gridy": 1, "magnet_holes": False}, 1e6, 1)
+        # Only one size each.  Assumed to be linear.
+        assert model.predict(_job(2, magnet_holes=True)).peak_rss_bytes == pytest.approx(8e6)
+        assert model.predict(_job(2, magnet_holes=False)).peak_rss_bytes == pytest.approx(2e6)
+        # Never seen.  Falls back to every render of the entry point.
+        assert model.predict(_job(1, screw_holes=True)).peak_rss_bytes == pytest.approx(4e6)
+
+    def test_default(self):
+        model = ResourceModel(default=Prediction(1, 2))
+        assert model.predict(_job(1)) == Prediction(1, 2)
+
+    def test_stats_log_records(self):
+        model = ResourceModel(memory_margin=1)
+        job = {"scad_file_path": "/a/gridfinity-rebuilt-bins.scad", "parameters": {"gridx": 2.0, "gridy": 1.0}}
+        model.add_records([
+            {"job": job, "succeeded": True, "cache_hit": False, "wall_time_s": 5, "peak_rss_bytes": 2e6},
+            {"job": job, "succeeded": True, "cache_hit": True, "wall_time_s": 0, "peak_rss_bytes": None},
+            {"job": job, "succeeded": False, "cache_hit": False, "wall_time_s": 1, "peak_rss_bytes": None},
+        ])
+        assert model.predict(_job(2)) == Prediction(2e6, 5)
+
+def test_out_of_memory():
+    assert is_out_of_memory(subprocess.CalledProcessError(-signal.SIGKILL, ["openscad"]))
+    assert is_out_of_memory(subprocess.CalledProcessError(1, ["openscad"], stderr=b"terminate called after throwing an instance of 'std::bad_alloc'"))
+    assert not is_out_of_memory(subprocess.CalledProcessError(11, ["openscad"], stderr=b"ERROR: Assertion failed"))
+    assert not is_out_of_memory(FileNotFoundError())
+
+def test_scheduled_batch(pytestconfig, tmp_path):
+    runner = OpenScadRunner(pytestconfig.rootpath.joinpath('src/core/gridfinity-rebuilt-holes.scad'))
+    runner.image_folder_base = tmp_path
+    jobs = [runner.make_job(set_variable_argument('test_options',
+            f'bundle_hole_options(refined_hole=false, magnet_hole=true, screw_hole={screw}, crush_ribs=true, chamfer=false, supportless=false)'),
+            Path(f'screw_{screw}.png'))
+        for screw in ('false', 'true')]
+    scheduler = MemoryScheduler(ResourceModel(), memory_budget_bytes=1)
+    results = list(scheduler.run(runner, jobs))
+    assert sorted(result.job.output_file_name.name for result in results if result.ok) == ['screw_false.png', 'screw_true.png']
+
+def test_retry_not_starved(pytestconfig, monkeypatch):
+    '''Smaller jobs do not start while a job which ran out of memory waits to be retried.'''
+    runner = OpenScadRunner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad'))
+    jobs = [RenderJob(runner.scad_file_path, Path(f'{name}.png')) for name in ('big', 'a', 'b', 'c', 'd', 'e', 'f')]
+    started = []
+    def render_with_stats(job):
+        started.append(job.output_file_name.stem)
+        if started.count('big') == 1 and job.output_file_name.stem == 'big':
+            raise subprocess.CalledProcessError(-signal.SIGKILL, ['openscad'])
+        # Finish one at a time.
+        duration = {'a': 0.05, 'b': 0.2, 'c': 0.4}.get(job.output_file_name.stem, 0.01)
+        time.sleep(duration)
+        return (subprocess.CompletedProcess(['openscad'], 0), RenderStats(job=job, succeeded=True, cache_hit=False, wall_time_s=duration))
+    monkeypatch.setattr(runner, '_render_with_stats', render_with_stats)
+
+    model = ResourceModel(default=Prediction(1, 1))
+    results = list(MemoryScheduler(model, memory_budget_bytes=10).run(runner, jobs, max_workers=4))
+    assert all(result.ok for result in results)
+    assert started[:4] == ['big', 'a', 'b', 'c']
+    assert started[4] == 'big'
+    assert len(started) == 8
@@ -0,0 +1,111 @@
+"""
+Tests for mesh.py
+"""
+
+import struct
+from pathlib import Path
+import numpy as np
+import pytest
+
+from mesh import Mesh, load_mesh, write_binary_stl
+
+# Unit cube, outward facing triangles.
+CUBE_VERTICES = [
+    (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+    (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1),
+]
+CUBE_QUADS = [
+    (0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4),
+    (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7),
+]
+CUBE_TRIANGLES = [t for (a, b, c, d) in CUBE_QUADS for t in ((a, b, c), (a, c, d))]
+
+def _cube_corners(scale: float = 1):
+    return [[[scale * value for value in CUBE_VERTICES[i]] for i in triangle] for triangle in CUBE_TRIANGLES]
+
+def _write_binary_stl(path: Path, triangles) -> None:
+    with open(path, 'wb') as file:
+        file.write(b'solid binary'.ljust(80, b' '))
+        file.write(struct.pack('<I', len(triangles)))
+        for triangle in triangles:
+            file.write(struct.pack('<3f', 0, 0, 0))
+            for corner in triangle:
+                file.write(struct.pack('<3f', *corner))
+            file.write(struct.pack('<H', 0))
+
+def _write_ascii_stl(path: Path, triangles) -> None:
+    lines = ['solid ascii']
+    for triangle in triangles:
+        lines += ['facet normal 0 0 0', 'outer loop']
+        lines += [f'vertex {x} {y} {z}' for (x, y, z) in triangle]
+        lines += ['endloop', 'endfacet']
+    lines.append('endsolid ascii')
+    path.write_text('\n'.join(lines))
+
+def _write_off(path: Path, scale: float) -> None:
+    lines = ['OFF', f'{len(CUBE_VERTICES)} {len(CUBE_QUADS)} 0']
+    lines += [' '.join(str(scale * value) for value in vertex) for vertex in CUBE_VERTICES]
+    # Trailing values are an rgba color.
+    lines += ['4 ' + ' '.join(map(str, quad)) + ' 255 0 0 255' for quad in CUBE_QUADS]
+    path.write_text('\n'.join(lines))
+
+class TestLoading:
+
+    def test_binary_stl(self, tmp_path):
+        path = tmp_path.joinpath('cube.stl')
+        _write_binary_stl(path, _cube_corners(2))
+        mesh = load_mesh(path)
+        assert mesh.triangle_count == 12
+        assert len(mesh.vertices) == 8
+        assert mesh.volume() == pytest.approx(8)
+
+    def test_ascii_stl(self, tmp_path):
+        path = tmp_path.joinpath('cube.stl')
+        _write_ascii_stl(path, _cube_corners(2))
+        mesh = load_mesh(path)
+        assert mesh.triangle_count == 12
+        assert mesh.volume() == pytest.approx(8)
+
+    def test_off(self, tmp_path):
+        path = tmp_path.joinpath('cube.off')
+        _write_off(path, 2)
+        mesh = load_mesh(path)
+        assert mesh.triangle_count == 12
+        assert mesh.volume() == pytest.approx(8)
+
+    def test_unsupported(self, tmp_path):
+        with pytest.raises(ValueError):
+            load_mesh(tmp_path.joinpath('cube.obj'))
+
+    def test_write_binary_stl(self, tmp_path):
+        path = tmp_path.joinpath('cube.stl')
+        corners = np.array(_cube_corners(2), dtype=np.float32)
+        assert write_binary_stl(path, [corners[:5], corners[5:]], b'cube') == 12
+        mesh = load_mesh(path)
+        assert mesh.triangle_count == 12
+        assert mesh.volume() == pytest.approx(8)
+        assert mesh.non_manifold_edge_count() == 0
+
+class TestMetrics:
+
+    @pytest.fixture
+    def cube(self) -> Mesh:
+        return Mesh.from_triangles(np.array(_cube_corners(3)))
+
+    def test_bounding_box(self, cube):
+        (minimum, maximum) = cube.bounding_box()
+        assert minimum == pytest.approx([0, 0, 0])
+        assert maximum == pytest.approx([3, 3, 3])
+        assert cube.size() == pytest.approx([3, 3, 3])
+
+    def test_volume_and_area(self, cube):
+        assert cube.volume() == pytest.approx(27)
+        assert cube.surface_area() == pytest.approx(54)
+
+    def test_manifold(self, cube):
+        assert cube.non_manifold_edge_count() == 0
+
+    def test_open_mesh(self):
+        # Remove the top face.
+        open_cube = Mesh.from_triangles(np.array(_cube_corners()[:2] + _cube_corners()[4:]))
+        assert open_cube.non_manifold_edge_count() == 4
@@ -0,0 +1,132 @@
+"""
+Tests for openscad_runner.py
+"""
+
+import sys
+import pytest
+
+from openscad_runner import *
+
+_FAKE_OPENSCAD = '''
+import sys
+output_path = sys.argv[sys.argv.index("-o") + 1]
+if "invalid" in output_path:
+    # Like a failed assert, which does not set the return code.
+    print("ERROR: Assertion failed", file=sys.stderr)
+    sys.exit(0)
+with open(output_path, "wb") as output:
+    output.write(b"rendered")
+'''
+
+@pytest.fixture
+def run_files():
+    files = RunFiles()
+    yield files
+    files.close()
+
+@pytest.fixture
+def fake_runner(tmp_path) -> OpenScadRunner:
+    '''Fails any output with "invalid" in its name.'''
+    openscad = tmp_path.joinpath('openscad')
+    openscad.write_text(f"#!{sys.executable}\n" + _FAKE_OPENSCAD)
+    openscad.chmod(0o755)
+    tmp_path.joinpath('model.scad').write_text('cube(1);\n')
+    runner = OpenScadRunner(tmp_path.joinpath('model.scad'))
+    runner.openscad_binary_path = str(openscad)
+    runner.image_folder_base = tmp_path
+    yield runner
+    runner.close()
+
+def large_parameters(index: int) -> dict:
+    return {f"value_{i}": float(i) for i in range(RunFiles.MAX_DEFINE_PARAMETERS)} | {"index": index}
+
+class TestRunFiles:
+
+    def test_one_file_per_batch(self, run_files):
+        sets = [large_parameters(i) for i in range(3)]
+        file_path = run_files.add(sets + sets)
+
+        parameter_file = ParameterFile.from_json(file_path.read_text())
+        assert(len(parameter_file.parameterSets) == 3)
+        for parameters in sets:
+            assert(run_files.arguments(parameters) ==
+                ["-p", str(file_path), "-P", RunFiles.set_name(parameters)])
+            assert(parameter_file.parameterSets[RunFiles.set_name(parameters)] == parameters)
+        assert(list(run_files.directory.iterdir()) == [file_path])
+
+    def test_only_new_sets_written(self, run_files):
+        run_files.add([large_parameters(0)])
+        assert(run_files.add([large_parameters(0)]) == None)
+        new_file = run_files.add([large_parameters(0), large_parameters(1)])
+        assert(list(ParameterFile.from_json(new_file.read_text()).parameterSets.keys()) ==
+            [RunFiles.set_name(large_parameters(1))])
+
+    def test_small_sets_use_defines(self, run_files):
+        assert(run_files.arguments({"gridx": 2.0, "enable_label": True, "name": "a"}) ==
+            ['-D', 'gridx=2.0', '-D', 'enable_label=true', '-D', 'name="a"'])
+        assert(run_files.add([{"gridx": 2.0}]) == None)
+
+    def test_written_on_demand(self, run_files):
+        arguments = run_files.arguments(large_parameters(0))
+        assert(Path(arguments[1]).exists())
+
+    def test_close(self):
+        files = RunFiles()
+        files.add([large_parameters(0)])
+        files.close()
+        assert(not files.directory.exists())
+
+def test_backend_and_image_mode_arguments():
+    runner = OpenScadRunner(Path('model.scad'))
+    image = RenderJob(Path('model.scad'), Path('model.png'))
+    mesh = RenderJob(Path('model.scad'), Path('model.stl'))
+    assert(runner._render_arguments(image) == runner.common_arguments)
+
+    runner.backend = Backends.Manifold
+    runner.image_mode = ImageModes.ThrownTogether
+    assert(runner._render_arguments(image) ==
+        runner.common_arguments + ['--backend=manifold', '--preview=throwntogether'])
+    # Image mode only applies to images.
+    assert(runner._render_arguments(mesh) == runner.common_arguments + ['--backend=manifold'])
+
+def test_invalid_parameters_rejected(pytestconfig, tmp_path):
+    runner = OpenScadRunner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-baseplate.scad'))
+    runner.openscad_binary_path = str(tmp_path.joinpath('missing-openscad'))
+    runner.image_folder_base = tmp_path
+    runner.parameters = {"style_plate": 1.0, "styel_hole": 1}
+    [result] = runner.run_batch([runner.make_job([], 'baseplate.png')])
+    # Before openscad is ever run.
+    assert(isinstance(result.error, SchemaError))
+    assert('Did you mean "style_hole"?' in str(result.error))
+
+    runner.parameters = {"style_plate": 1.0}
+    assert(type(runner.checked_job(runner.make_job([], 'baseplate.png')).parameters["style_plate"]) == int)
+    runner.validate_parameters = False
+    assert(runner.checked_job(runner.make_job([], 'baseplate.png')).parameters == {"style_plate": 1.0})
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_batch_reports_each_job(fake_runner):
+    """
+    A failing job in a batch must not hide, or stop, the others.
+    """
+    good_job = fake_runner.make_job([], Path('good.png'))
+    bad_job = fake_runner.make_job([], Path('invalid.png'))
+
+    results = {result.job.output_file_name: result for result in fake_runner.run_batch([good_job, bad_job])}
+    assert(results[good_job.output_file_name].ok)
+    assert(not results[bad_job.output_file_name].ok)
+    assert(isinstance(results[bad_job.output_file_name].error, subprocess.CalledProcessError))
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_stats_logged(fake_runner, tmp_path):
+    fake_runner.stats_log_path = tmp_path.joinpath('stats.jsonl')
+    fake_runner.create_image([], Path('model.png'))
+    with pytest.raises(subprocess.CalledProcessError):
+        fake_runner.create_image([], Path('invalid.png'))
+
+    [stats, failed_stats] = load_stats_log(fake_runner.stats_log_path)
+    assert(stats["succeeded"])
+    assert(not stats["cache_hit"])
+    assert(stats["wall_time_s"] > 0)
+    assert(stats["job"]["output_file_name"] == 'model.png')
+    assert(not failed_stats["succeeded"])
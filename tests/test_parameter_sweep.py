@@ -0,0 +1,74 @@
+"""
+Tests for parameter_sweep.py
+"""
+
+import pytest
+
+from parameter_sweep import *
+
+@pytest.fixture(scope="module")
+def bin_parameters(pytestconfig):
+    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-rebuilt-bins.json")
+    return ParameterFile.from_json(parameter_file_path.read_text()).parameterSets["Default"]
+
+@pytest.fixture(scope="module")
+def baseplate_parameters(pytestconfig):
+    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-rebuilt-baseplate.json")
+    return ParameterFile.from_json(parameter_file_path.read_text()).parameterSets["Default"]
+
+class TestHoleOptions:
+
+    def test_invalid(self):
+        assert not HoleOptions(refined_hole=True, magnet_hole=True).is_valid()
+        assert HoleOptions(refined_hole=True, screw_hole=True).is_valid()
+
+    def test_effective(self):
+        assert HoleOptions(crush_ribs=True, chamfer=True, supportless=True).effective() == HoleOptions()
+        assert HoleOptions(screw_hole=True, crush_ribs=True, chamfer=True).effective() \
+            == HoleOptions(screw_hole=True, chamfer=True)
+        magnet = HoleOptions(magnet_hole=True, crush_ribs=True, chamfer=True, supportless=True)
+        assert magnet.effective() == magnet
+
+    def test_as_scad(self):
+        assert HoleOptions(magnet_hole=True).as_scad() == "bundle_hole_options(" \
+            "refined_hole=false, magnet_hole=true, screw_hole=false, crush_ribs=false, chamfer=false, supportless=false)"
+
+class TestParameterSweep:
+
+    def test_product(self, bin_parameters):
+        sweep = ParameterSweep(bin_parameters, {"gridx": [1, 2, 3], "gridy": [1, 2]})
+        combinations = list(sweep.combinations())
+        assert len(combinations) == 6
+        assert {(c["gridx"], c["gridy"]) for c in combinations} == {(x, y) for x in [1, 2, 3] for y in [1, 2]}
+        # Base parameters are kept, but not modified.
+        assert all(c["gridz"] == bin_parameters["gridz"] for c in combinations)
+        assert bin_parameters["gridx"] == 1
+
+    def test_exclusions(self, bin_parameters):
+        sweep = ParameterSweep(bin_parameters, {"gridx": [1, 2, 3], "gridy": [1, 2]},
+            exclusions=[lambda p: p["gridx"] < p["gridy"]])
+        assert len(list(sweep.combinations())) == 5
+
+    def test_bin_holes(self, bin_parameters):
+        sweep = ParameterSweep(bin_parameters, BIN_HOLE_AXES, hole_parameters=BIN_HOLE_PARAMETERS)
+        combinations = list(sweep.combinations())
+        # refined and magnet holes are incompatible.
+        assert len(combinations) == 2**6 - 2**4
+        unique = sweep.unique_combinations()
+        assert len(unique) == 26
+        effective = {hole_options_from_parameters(p, BIN_HOLE_PARAMETERS).effective() for p in unique}
+        assert len(effective) == len(unique)
+
+    def test_baseplate_holes(self, baseplate_parameters):
+        sweep = ParameterSweep(baseplate_parameters, BASEPLATE_HOLE_AXES,
+            hole_parameters=BASEPLATE_HOLE_PARAMETERS, normalizers=[baseplate_ignored_parameters])
+        assert len(list(sweep.combinations())) == 5 * 3 * 2**3
+        # 3 styles with holes: 3 hole styles * 5 magnet options.  Plus 2 styles without any holes.
+        assert len(sweep.unique_combinations()) == 3 * 3 * 5 + 2
+
+    def test_output_file_names_unique(self, bin_parameters):
+        sweep = ParameterSweep(bin_parameters, BIN_HOLE_AXES, hole_parameters=BIN_HOLE_PARAMETERS)
+        names = {sweep.output_file_name(p) for p in sweep.combinations()}
+        assert len(names) == len(list(sweep.combinations()))
+        assert sweep.output_file_name(bin_parameters) == Path("refined_holes-true_magnet_holes-false_"
+            "screw_holes-false_crush_ribs-true_chamfer_holes-true_printable_hole_top-true.png")
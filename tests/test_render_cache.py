@@ -0,0 +1,139 @@
+"""
+Tests for render_cache.py
+"""
+
+import os
+from pathlib import Path
+import pytest
+
+from render_cache import RenderCache, scad_dependencies
+
+def _key(scad_file_path: Path, **overrides) -> str:
+    key_arguments = {
+        "openscad_version": "OpenSCAD version 2021.01",
+        "arguments": ["--imgsize=1280,720"],
+        "parameters": {"gridx": 1.0},
+        "suffix": ".png",
+    }
+    key_arguments.update(overrides)
+    return RenderCache.make_key(scad_file_path, **key_arguments)
+
+class TestDependencies:
+
+    def test_bins_transitive(self, pytestconfig):
+        root = pytestconfig.rootpath
+        dependencies = scad_dependencies(root.joinpath('gridfinity-rebuilt-bins.scad'))
+        assert root.joinpath('src/core/bin.scad') in dependencies
+        assert root.joinpath('src/helpers/grid.scad') in dependencies
+        assert root.joinpath('src/core/standard.scad') in dependencies
+
+    def test_holes_excludes_unrelated(self, pytestconfig):
+        root = pytestconfig.rootpath
+        dependencies = scad_dependencies(root.joinpath('src/core/gridfinity-rebuilt-holes.scad'))
+        assert root.joinpath('src/helpers/shapes.scad') in dependencies
+        assert root.joinpath('src/core/tab.scad') not in dependencies
+        assert root.joinpath('src/core/bin.scad') not in dependencies
+
+    def test_commented_out_ignored(self, tmp_path):
+        tmp_path.joinpath('a.scad').write_text('// use <b.scad>\n/*\ninclude <c.scad>\n*/\n')
+        tmp_path.joinpath('b.scad').write_text('')
+        tmp_path.joinpath('c.scad').write_text('')
+        assert scad_dependencies(tmp_path.joinpath('a.scad')) == {tmp_path.joinpath('a.scad').resolve()}
+
+    def test_nested_change(self, tmp_path):
+        tmp_path.joinpath('a.scad').write_text('include <b.scad>\n')
+        tmp_path.joinpath('b.scad').write_text('')
+        tmp_path.joinpath('c.scad').write_text('')
+        assert scad_dependencies(tmp_path.joinpath('a.scad')) == {tmp_path.joinpath(name + '.scad').resolve() for name in 'ab'}
+        # Only b.scad changes.
+        tmp_path.joinpath('b.scad').write_text('use <c.scad>\n')
+        assert scad_dependencies(tmp_path.joinpath('a.scad')) == {tmp_path.joinpath(name + '.scad').resolve() for name in 'abc'}
+
+class TestRenderCache:
+
+    @pytest.fixture
+    def scad_files(self, tmp_path) -> Path:
+        tmp_path.joinpath('main.scad').write_text('use <lib.scad>\ncube(1);\n')
+        tmp_path.joinpath('lib.scad').write_text('module a() {}\n')
+        tmp_path.joinpath('unrelated.scad').write_text('module b() {}\n')
+        return tmp_path
+
+    def test_key_tracks_dependencies(self, scad_files):
+        main = scad_files.joinpath('main.scad')
+        original = _key(main)
+
+        scad_files.joinpath('unrelated.scad').write_text('module c() {}\n')
+        assert _key(main) == original
+
+        lib = scad_files.joinpath('lib.scad')
+        lib.write_text('module a() { cube(2); }\n')
+        os.utime(lib, ns=(0, lib.stat().st_mtime_ns + 1))
+        assert _key(main) != original
+
+    def test_key_tracks_inputs(self, scad_files):
+        main = scad_files.joinpath('main.scad')
+        original = _key(main)
+        assert _key(main, parameters={"gridx": 2.0}) != original
+        assert _key(main, arguments=["--imgsize=640,480"]) != original
+        assert _key(main, openscad_version="OpenSCAD version 2024.12.06") != original
+        assert _key(main, suffix=".stl") != original
+
+    def test_get_put(self, tmp_path):
+        cache = RenderCache(tmp_path.joinpath('cache'))
+        output = tmp_path.joinpath('out.png')
+        assert not cache.get('ab' * 32, output)
+        assert not output.exists()
+
+        output.write_bytes(b'image')
+        cache.put('ab' * 32, output)
+        output.unlink()
+        assert cache.get('ab' * 32, output)
+        assert output.read_bytes() == b'image'
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        cache = RenderCache(tmp_path.joinpath('cache'), max_size_bytes=20)
+        source = tmp_path.joinpath('out.png')
+        source.write_bytes(b'0123456789')
+        cache.put('aa' * 32, source)
+        cache.put('bb' * 32, source)
+        # Make 'aa' the most recently used.
+        for (key, mtime) in (('aa', 2_000_000_000), ('bb', 1_000_000_000)):
+            os.utime(cache._entry_path(key * 32, '.png'), (mtime, mtime))
+
+        cache.put('cc' * 32, source)
+        assert cache.get('aa' * 32, tmp_path.joinpath('a.png'))
+        assert not cache.get('bb' * 32, tmp_path.joinpath('b.png'))
+        assert cache.get('cc' * 32, tmp_path.joinpath('c.png'))
+        assert cache.size_bytes() <= 20
+
+    def test_put_only_scans_when_over_budget(self, tmp_path, monkeypatch):
+        cache = RenderCache(tmp_path.joinpath('cache'), max_size_bytes=25)
+        source = tmp_path.joinpath('out.png')
+        source.write_bytes(b'0123456789')
+        cache.put('aa' * 32, source)
+
+        scans = []
+        original = RenderCache._stat_entries
+        monkeypatch.setattr(RenderCache, '_stat_entries', lambda self: scans.append(1) or original(self))
+        cache.put('bb' * 32, source)
+        cache.put('bb' * 32, source)
+        assert scans == []
+        cache.put('cc' * 32, source)
+        assert scans == [1]
+        assert cache.size_bytes() <= 25
+
+    def test_evict_skips_removed_entries(self, tmp_path, monkeypatch):
+        cache = RenderCache(tmp_path.joinpath('cache'), max_size_bytes=10)
+        source = tmp_path.joinpath('out.png')
+        source.write_bytes(b'0123456789')
+        cache.put('aa' * 32, source)
+        # Another process evicts 'aa' after it is listed, but before it is checked.
+        original = RenderCache._entries
+        def entries(self):
+            listed = original(self)
+            cache._entry_path('aa' * 32, '.png').unlink(missing_ok=True)
+            return listed
+        monkeypatch.setattr(RenderCache, '_entries', entries)
+        cache.put('bb' * 32, source)
+        cache.evict()
+        assert cache.size_bytes() <= 10
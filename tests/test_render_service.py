@@ -0,0 +1,145 @@
+"""
+Tests for render_service.py
+"""
+
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+
+from render_cache import RenderCache
+from render_service import *
+
+_FAKE_OPENSCAD = '''
+import os, sys, time
+if sys.argv[1:] == ["--version"]:
+    print("OpenSCAD version fake")
+    sys.exit(0)
+with open(os.path.join(os.path.dirname(sys.argv[0]), "renders.log"), "a") as log:
+    log.write("render\\n")
+time.sleep(1)
+with open(sys.argv[sys.argv.index("-o") + 1], "wb") as output:
+    output.write(b"rendered")
+'''
+
+@pytest.fixture
+def fake_openscad(tmp_path) -> Path:
+    '''Records each render in "renders.log", next to itself.  Takes a second.'''
+    path = tmp_path.joinpath("openscad")
+    path.write_text(f"#!{sys.executable}\n" + _FAKE_OPENSCAD)
+    path.chmod(0o755)
+    return path
+
+@pytest.fixture
+def service(pytestconfig, tmp_path):
+    service = RenderService(pytestconfig.rootpath, RenderCache(tmp_path.joinpath("store")),
+        str(tmp_path.joinpath("openscad")), max_workers=2)
+    yield service
+    service.close()
+
+def _request(**parameters) -> dict:
+    return {"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": parameters}
+
+class TestMakeJob:
+
+    def test_parameters(self, service):
+        job = service.make_job({"scad_file": "gridfinity-rebuilt-bins.scad",
+            "parameters": {"gridx": "2", "enable_zsnap": "true", "style_tab": 1}})
+        assert job.parameters == {"gridx": 2.0, "enable_zsnap": True, "style_tab": 1}
+        assert job.scad_file_path.name == "gridfinity-rebuilt-bins.scad"
+        assert job.output_file_name.suffix == ".stl"
+        assert job.camera_arguments == None
+
+    def test_parameter_file(self, service):
+        job = service.make_job({"scad_file": "gridfinity-rebuilt-bins.scad", "format": "png",
+            "fileFormatVersion": "1", "parameterSets": {"small": {"gridx": "1"}, "large": {"gridx": "5"}}, "set": "large"})
+        assert job.parameters == {"gridx": 5.0}
+        assert job.output_file_name.suffix == ".png"
+        assert job.camera_arguments != None
+
+    @pytest.mark.parametrize("request_body", [
+        [],
+        {"scad_file": "../pyproject.toml"},
+        {"scad_file": "gridfinity-rebuilt-bins.scad", "format": "dxf"},
+        {"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": [1, 2]},
+        {"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": {"gridxx": 1}},
+        {"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": {"style_tab": 9}},
+        {"scad_file": "gridfinity-rebuilt-bins.scad", "parameterSets": {"a": {}, "b": {}}},
+    ])
+    def test_invalid(self, service, request_body):
+        with pytest.raises(RequestError):
+            service.make_job(request_body)
+
+def test_default_store_separate(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert RenderService.default_store_directory() != RenderCache.default_directory()
+    assert not RenderService.default_store_directory().is_relative_to(RenderCache.default_directory())
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([3.0], 0.9) == 3
+    assert percentile([], 0.5) == None
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_coalesced(service, fake_openscad, tmp_path):
+    log_path = tmp_path.joinpath("renders.log")
+    job = service.make_job(_request(gridx=2, gridy=1))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(service.render, [job] * 4))
+
+    assert log_path.read_text().count("render") == 1
+    assert sorted(response.source for response in responses) == ["coalesced"] * 3 + ["rendered"]
+    assert len({response.key for response in responses}) == 1
+    assert service.artifact(responses[0].artifact).read_bytes() == b"rendered"
+
+    assert service.render(job).source == "store"
+    metrics = service.metrics()
+    assert metrics["queue_depth"] == 0
+    assert metrics["in_flight"] == 0
+    assert metrics["counters"] == {"requests": 5, "rendered": 1, "coalesced": 3, "store": 1}
+    assert metrics["latency_s"]["count"] == 5
+    assert metrics["latency_s"]["p50"] >= 1
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_http(service, fake_openscad, tmp_path):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(body) -> dict:
+        request = urllib.request.Request(url + "/render", data=json.dumps(body).encode())
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    try:
+        response = post(_request(gridx=1))
+        assert response["source"] == "rendered"
+        with urllib.request.urlopen(url + response["artifact"]) as artifact:
+            assert artifact.read() == b"rendered"
+            assert artifact.headers["Content-Type"] == "model/stl"
+        with urllib.request.urlopen(url + "/metrics") as metrics:
+            assert json.load(metrics)["counters"]["rendered"] == 1
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post({"scad_file": "missing.scad"})
+        assert error.value.code == 400
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/artifacts/" + "0" * 64 + ".stl")
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_failure(service):
+    # No openscad binary.
+    job = service.make_job({"scad_file": "gridfinity-rebuilt-bins.scad", "parameters": {"gridx": 1}})
+    with pytest.raises(FileNotFoundError):
+        service.render(job)
+    assert service.metrics()["counters"] == {"requests": 1, "failures": 1}
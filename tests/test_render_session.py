@@ -0,0 +1,97 @@
+"""
+Tests for render_session.py
+"""
+
+from pathlib import Path
+import sys
+import threading
+import pytest
+
+from openscad_runner import load_stats_log
+from render_session import DeferredRenderError, ParameterFiles, RenderSession
+
+@pytest.fixture
+def session():
+    session = RenderSession(max_workers=2, render_cache=None, defer=True)
+    yield session
+    session.close()
+
+def test_parameter_files(pytestconfig):
+    parameter_files = ParameterFiles(pytestconfig.rootpath)
+    parameters = parameter_files.get("tests/gridfinity-rebuilt-bins.json")
+    parameters["gridx"] = 100
+    assert parameter_files.get("tests/gridfinity-rebuilt-bins.json")["gridx"] != 100
+
+def test_deferred_failure(pytestconfig, session, tmp_path):
+    runner = session.make_runner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad'), "test_node")
+    runner.openscad_binary_path = str(tmp_path.joinpath('missing-openscad'))
+    runner.image_folder_base = tmp_path
+    runner.stats_log_path = tmp_path.joinpath('stats.jsonl')
+    runner.parameters = {"gridx": 1}
+    runner.create_image([], Path('deferred.png'))
+    # Changes after the call do not affect the deferred render.
+    runner.parameters["gridx"] = 2
+
+    with pytest.raises(DeferredRenderError, match="test_node: deferred.png"):
+        session.wait()
+    [stats] = load_stats_log(runner.stats_log_path)
+    assert stats["job"]["parameters"] == {"gridx": 1}
+    assert [(timing.nodeid, timing.succeeded) for timing in session.timings] == [("test_node", False)]
+    # Failures are only reported once.
+    session.wait()
+
+def test_immediate(pytestconfig, session, tmp_path):
+    runner = session.make_runner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad'), "test_node")
+    runner.openscad_binary_path = str(tmp_path.joinpath('missing-openscad'))
+    runner.image_folder_base = tmp_path
+    runner.defer = False
+    with pytest.raises(FileNotFoundError):
+        runner.create_image([], Path('immediate.png'))
+    session.wait()
+
+def test_failures_by_test(pytestconfig, session, tmp_path):
+    for nodeid in ("test_a", "test_b"):
+        runner = session.make_runner(pytestconfig.rootpath.joinpath('gridfinity-rebuilt-bins.scad'), nodeid)
+        runner.openscad_binary_path = str(tmp_path.joinpath('missing-openscad'))
+        runner.image_folder_base = tmp_path
+        runner.create_image([], Path(nodeid + '.png'))
+    failures = session.failures()
+    assert sorted(failures) == ["test_a", "test_b"]
+    assert failures["test_a"][0].startswith("test_a.png: FileNotFoundError")
+    assert session.failures() == {}
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake openscad is a script")
+def test_deferred_share_run_files(session, tmp_path):
+    """
+    Deferred renders use the runner's parameter files, which stay until the last deferred render finishes.
+    """
+    release = tmp_path.joinpath('release')
+    openscad = tmp_path.joinpath('openscad')
+    openscad.write_text(f"#!{sys.executable}\n"
+        "import pathlib, sys, time\n"
+        f"while not pathlib.Path({str(release)!r}).exists(): time.sleep(0.01)\n"
+        "assert pathlib.Path(sys.argv[sys.argv.index('-p') + 1]).exists()\n"
+        "open(sys.argv[sys.argv.index('-o') + 1], 'wb').close()\n")
+    openscad.chmod(0o755)
+    # Too many parameters for `-D`, so a parameter file is used.
+    names = [f"p{index}" for index in range(10)]
+    tmp_path.joinpath('model.scad').write_text("".join(f"{name} = 0;\n" for name in names))
+    runner = session.make_runner(tmp_path.joinpath('model.scad'), "test_node")
+    runner.openscad_binary_path = str(openscad)
+    runner.image_folder_base = tmp_path
+    runner.parameters = {name: 1 for name in names}
+    futures = [runner.create_image([], Path(f'{index}.png')) for index in range(2)]
+    run_files = runner.run_files
+    assert len(list(tmp_path.glob('*.png'))) == 0
+
+    runner.close()
+    assert run_files.directory.exists()
+    release.touch()
+    session.wait()
+    assert all(future.done() for future in futures)
+    # Closed by the last render's done callback, which may still be running.
+    for _ in range(100):
+        if not run_files.directory.exists():
+            break
+        threading.Event().wait(0.01)
+    assert not run_files.directory.exists()
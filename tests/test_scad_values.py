@@ -0,0 +1,76 @@
+"""
+Tests for scad_values.py
+"""
+
+import pytest
+
+from scad_values import ScadRange, format_scad_value, parse_echo_assignments, parse_scad_value
+
+class TestParseValue:
+
+    @pytest.mark.parametrize("text, expected", [
+        ("1", 1.0),
+        ("-41.5", -41.5),
+        ("1e+06", 1e6),
+        ("3.5e-05", 3.5e-5),
+        ("inf", float("inf")),
+        ("-inf", float("-inf")),
+        ("true", True),
+        ("false", False),
+        ("undef", None),
+        ('"text"', "text"),
+        ('"a \\"quoted\\" \\\\ string\\n"', 'a "quoted" \\ string\n'),
+    ])
+    def test_scalars(self, text, expected):
+        assert parse_scad_value(text) == expected
+
+    def test_nan(self):
+        value = parse_scad_value("nan")
+        assert value != value
+
+    def test_vectors(self):
+        assert parse_scad_value("[]") == []
+        assert parse_scad_value("[41.5, 41.5, 45.5515]") == [41.5, 41.5, 45.5515]
+        assert parse_scad_value('[["Total: ", 49], [true, undef]]') == [["Total: ", 49], [True, None]]
+
+    def test_ranges(self):
+        assert parse_scad_value("[0 : 2 : 10]") == ScadRange(0, 2, 10)
+        assert parse_scad_value("[0 : 10]") == ScadRange(0, 1, 10)
+
+    @pytest.mark.parametrize("text", ["[1, 2", "[1, 2 : 3]", "1 2", "function(x) x"])
+    def test_invalid(self, text):
+        with pytest.raises(ValueError):
+            parse_scad_value(text)
+
+class TestFormatValue:
+
+    @pytest.mark.parametrize("value", [
+        1.0, -41.5, 3.5e-5, True, False, None, "", 'say "hi"\n',
+        [83.5, [41.5, "x"], True], ScadRange(0, 2, 10),
+    ])
+    def test_round_trip(self, value):
+        assert parse_scad_value(format_scad_value(value)) == value
+
+    def test_integers(self):
+        assert format_scad_value(42) == "42"
+
+    def test_unsupported(self):
+        with pytest.raises(TypeError):
+            format_scad_value({"a": 1})
+
+class TestParseEcho:
+
+    def test_assignments(self):
+        echo_output = "\n".join([
+            'ECHO: "Height breakdown:"',
+            'ECHO: size = [83.5, 41.5, 49]',
+            'WARNING: Ignoring unknown variable "x"',
+            'ECHO: name = "two',
+            'lines"',
+            'ECHO: enabled = true',
+        ])
+        assert parse_echo_assignments(echo_output) == {
+            "size": [83.5, 41.5, 49],
+            "name": "two\nlines",
+            "enabled": True,
+        }
@@ -0,0 +1,29 @@
+"""
+Tests for scaling_fit.py
+"""
+
+import pytest
+
+from scaling_fit import fit_grid_exponents, fit_power_law, fit_scaling_exponent
+
+def test_exponent():
+    sizes = [1, 2, 4, 8]
+    assert fit_scaling_exponent(sizes, [3 * s for s in sizes]) == pytest.approx(1)
+    assert fit_scaling_exponent(sizes, [0.5 * s**2 for s in sizes]) == pytest.approx(2)
+
+def test_not_enough_data():
+    assert fit_scaling_exponent([1], [1]) == None
+    assert fit_scaling_exponent([2, 2], [1, 3]) == None
+    assert fit_scaling_exponent([1, 2], [None, None]) == None
+
+def test_grid_exponents():
+    grid = [(x, y) for x in (1, 2, 3) for y in (1, 2, 3)]
+    exponents = fit_grid_exponents([x for (x, _) in grid], [y for (_, y) in grid],
+        [2 * x * y**2 for (x, y) in grid])
+    assert exponents == pytest.approx((1, 2))
+    # gridx and gridy always equal.
+    assert fit_grid_exponents([1, 2, 3], [1, 2, 3], [1, 4, 9]) == None
+    assert fit_grid_exponents([1, 2], [1, 1], [1, 2]) == None
+
+def test_power_law():
+    assert fit_power_law([1, 2, 4], [3, 12, 48]) == pytest.approx((3, 2))
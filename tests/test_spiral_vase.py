@@ -9,19 +9,18 @@ import pytest
 from openscad_runner import *
 
 @pytest.fixture(scope="class")
-def default_parameters(pytestconfig):
-    parameter_file_path = pytestconfig.rootpath.joinpath("tests/gridfinity-spiral-vase.json")
-    parameter_file_data = ParameterFile.from_json(parameter_file_path.read_text())
-    return parameter_file_data.parameterSets["Default"]
+def default_parameters(parameter_files):
+    return parameter_files.get("tests/gridfinity-spiral-vase.json")
 
 @pytest.fixture
-def openscad_runner(pytestconfig, default_parameters) -> OpenScadRunner:
+def openscad_runner(pytestconfig, request, render_session, default_parameters) -> OpenScadRunner:
     scad_path = pytestconfig.rootpath.joinpath('gridfinity-spiral-vase.scad')
-    scad_runner = OpenScadRunner(scad_path)
+    scad_runner = render_session.make_runner(scad_path, request.node.nodeid)
     scad_runner.image_folder_base = pytestconfig.rootpath.joinpath('images/spiral_vase_base/')
     scad_runner.parameters = default_parameters.copy()
     scad_runner.camera_arguments = CameraArguments(Vec3(0,0,0), CameraRotations.AngledBottom, 150)
-    return scad_runner
+    yield scad_runner
+    scad_runner.close()
 
 class TestSpiralVaseBase:
     """
@@ -34,14 +33,16 @@ class TestSpiralVaseBase:
         vars = openscad_runner.parameters
         vars["type"] = 1 # Create a Base
         vars["enable_holes"] = False
-        openscad_runner.create_image([], Path('no_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.Top)
-        openscad_runner.create_image([], Path('no_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('no_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('no_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.Top)),
+        ])
 
     def test_holes(self, openscad_runner):
         vars = openscad_runner.parameters
         vars["type"] = 1 # Create a Base
         vars["enable_holes"] = True
-        openscad_runner.create_image([], Path('with_holes_bottom.png'))
-        openscad_runner.camera_arguments = openscad_runner.camera_arguments.with_rotation(CameraRotations.Top)
-        openscad_runner.create_image([], Path('with_holes_top.png'))
+        openscad_runner.create_views([], [
+            (Path('with_holes_bottom.png'), openscad_runner.camera_arguments),
+            (Path('with_holes_top.png'), openscad_runner.camera_arguments.with_rotation(CameraRotations.Top)),
+        ])